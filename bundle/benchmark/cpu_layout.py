@@ -0,0 +1,81 @@
+import sys
+sys.path.append('.')
+import time
+import torch
+import argparse
+from model.RIFE_HD import Model
+
+# Per stage CPU timings of RIFE_HD in NCHW and channels_last memory formats
+# run from bundle folder: python benchmark/cpu_layout.py --sizes 1080p 2k 4k
+
+sizes = {
+    '1080p': (1920, 1080),
+    '2k': (2048, 1556),
+    '4k': (4096, 2160),
+}
+
+
+def add_stage_timers(model, timings):
+    # accumulates wall time of each network forward pass
+    def pre_hook(name):
+        def hook(module, inputs):
+            timings.setdefault(name, 0.0)
+            module.stage_start = time.perf_counter()
+        return hook
+
+    def post_hook(name):
+        def hook(module, inputs, output):
+            timings[name] += time.perf_counter() - module.stage_start
+        return hook
+
+    for name, net in (('flownet', model.flownet), ('contextnet', model.contextnet), ('fusionnet', model.fusionnet)):
+        net.register_forward_pre_hook(pre_hook(name))
+        net.register_forward_hook(post_hook(name))
+
+
+def benchmark(model, img0, img1, UHD, iterations):
+    model.inference(img0, img1, UHD)
+    timings = {}
+    add_stage_timers(model, timings)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        output = model.inference(img0, img1, UHD)
+    timings['total'] = time.perf_counter() - start
+    for net in (model.flownet, model.contextnet, model.fusionnet):
+        net._forward_pre_hooks.clear()
+        net._forward_hooks.clear()
+    return {k: v / iterations for k, v in timings.items()}, output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CPU memory format benchmark')
+    parser.add_argument('--sizes', dest='sizes', nargs='+', default=['1080p', '2k', '4k'], choices=list(sizes.keys()))
+    parser.add_argument('--UHD', dest='UHD', action='store_true', help='flow size 1/4')
+    parser.add_argument('--iterations', dest='iterations', type=int, default=3)
+    parser.add_argument('--threads', dest='threads', type=int, default=0, help='torch CPU threads, 0 - default')
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    print ('oneDNN available: %s, threads: %s' % (torch.backends.mkldnn.is_available(), torch.get_num_threads()))
+
+    model = Model(device=torch.device('cpu'))
+    model.eval()
+
+    stages = ['flownet', 'contextnet', 'fusionnet', 'total']
+    for size in args.sizes:
+        width, height = sizes[size]
+        ph = ((height - 1) // 64 + 1) * 64
+        pw = ((width - 1) // 64 + 1) * 64
+        img0 = torch.rand(1, 3, ph, pw)
+        img1 = torch.rand(1, 3, ph, pw)
+        model.set_channels_last(False)
+        nchw, reference = benchmark(model, img0, img1, args.UHD, args.iterations)
+        model.set_channels_last(True)
+        nhwc, output = benchmark(model, img0, img1, args.UHD, args.iterations)
+        model.set_channels_last(False)
+        print ('---\n%s (%s x %s), max abs difference %.2e' % (size, width, height, (output - reference).abs().max().item()))
+        print ('%-12s %10s %14s %8s' % ('stage', 'NCHW, s', 'NHWC, s', 'speedup'))
+        for stage in stages:
+            print ('%-12s %10.3f %14.3f %7.2fx' % (stage, nchw[stage], nhwc[stage], nchw[stage] / nhwc[stage]))
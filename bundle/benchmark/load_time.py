@@ -0,0 +1,77 @@
+import os
+import sys
+sys.path.append('.')
+import time
+import shutil
+import tempfile
+import argparse
+import psutil
+import torch
+import multiprocessing as mp
+from model.RIFE_HD import Model
+from model.weights import save_flat, FLAT_WEIGHTS
+
+# Model loading time and per process memory of .pkl and flat memory mapped weights
+# with several worker processes loading the same model at once, as CPU inference does
+# run from bundle folder: python benchmark/load_time.py --model ./trained_models/default/v1.8.model --workers 4
+
+
+def worker(path, results, done):
+    start = time.perf_counter()
+    model = Model(device=torch.device('cpu'))
+    init_time = time.perf_counter() - start
+    start = time.perf_counter()
+    model.load_model(path, -1)
+    model.eval()
+    load_time = time.perf_counter() - start
+    memory = psutil.Process().memory_full_info()
+    results.put((init_time, load_time, memory.rss, memory.uss, getattr(memory, 'pss', 0)))
+    # keep the model loaded until every worker is done measuring
+    done.wait()
+
+
+def benchmark(path, workers):
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    done = ctx.Event()
+    processes = [ctx.Process(target=worker, args=(path, results, done)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measured = [results.get() for _ in processes]
+    done.set()
+    for process in processes:
+        process.join()
+    return [sum(m[i] for m in measured) / workers for i in range(5)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Model load time and memory benchmark')
+    parser.add_argument('--model', dest='model', type=str, default='./trained_models/default/v1.8.model')
+    parser.add_argument('--workers', dest='workers', type=int, default=4)
+    args = parser.parse_args()
+
+    # .pkl and flat copies of the model in temporary folders
+    folder = tempfile.mkdtemp()
+    try:
+        pkl_path = os.path.join(folder, 'pkl')
+        flat_path = os.path.join(folder, 'flat')
+        os.makedirs(pkl_path)
+        os.makedirs(flat_path)
+        for name in ('flownet.pkl', 'contextnet.pkl', 'unet.pkl'):
+            shutil.copy(os.path.join(args.model, name), pkl_path)
+        model = Model(device=torch.device('cpu'))
+        model.load_model(pkl_path, -1)
+        save_flat({
+            'flownet': model.flownet.state_dict(),
+            'contextnet': model.contextnet.state_dict(),
+            'fusionnet': model.fusionnet.state_dict()}, os.path.join(flat_path, FLAT_WEIGHTS))
+        del model
+
+        print ('%s workers loading %s' % (args.workers, args.model))
+        print ('%-8s %10s %12s %10s %10s %10s' % ('format', 'init, s', 'load, s', 'RSS, Mb', 'USS, Mb', 'PSS, Mb'))
+        for name, path in (('pkl', pkl_path), ('flat', flat_path)):
+            init_time, load_time, rss, uss, pss = benchmark(path, args.workers)
+            print ('%-8s %10.3f %12.3f %10.1f %10.1f %10.1f' % (
+                name, init_time, load_time, rss / 2 ** 20, uss / 2 ** 20, pss / 2 ** 20))
+    finally:
+        shutil.rmtree(folder)
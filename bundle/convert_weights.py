@@ -0,0 +1,36 @@
+import os
+import torch
+import argparse
+import warnings
+warnings.filterwarnings("ignore")
+
+from model.RIFE_HD import Model
+from model.weights import save_flat, FLAT_WEIGHTS
+
+# converts trained flownet.pkl / contextnet.pkl / unet.pkl
+# into a single flat weights.bin that Model.load_model memory maps,
+# so processes loading the model share one copy of the weights
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert RIFE HD model to flat memory mapped weights')
+    parser.add_argument('--model', dest='model', type=str, default='./trained_models/default/v1.8.model')
+    parser.add_argument('--output', dest='output', type=str, default=None, help='folder to write weights.bin to, model folder by default')
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = args.model
+
+    model = Model(device=torch.device('cpu'))
+    model.load_model(args.model, -1)
+    if model.quantized:
+        print ('%s is an int8 quantized model, flat weights support float models only' % args.model)
+        exit()
+    print ('Trained model loaded: %s' % args.model)
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    path = os.path.join(os.path.abspath(args.output), FLAT_WEIGHTS)
+    save_flat({
+        'flownet': model.flownet.state_dict(),
+        'contextnet': model.contextnet.state_dict(),
+        'fusionnet': model.fusionnet.state_dict()}, path)
+    print ('Flat weights written to %s (%.1f Mb)' % (path, os.path.getsize(path) / 2 ** 20))
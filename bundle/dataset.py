@@ -1,3 +1,4 @@
+import os
 import cv2
 import ast
 import torch
@@ -94,3 +95,75 @@ class VimeoDataset(Dataset):
         img1 = torch.from_numpy(img1.copy()).permute(2, 0, 1)
         gt = torch.from_numpy(gt.copy()).permute(2, 0, 1)
         return torch.cat((img0, img1, gt), 0), flow_gt
+
+
+class FramePairDataset(Dataset):
+    # consecutive frame pairs for training without ground truth middle frames,
+    # e.g. distillation from a teacher model. path is a folder of image sequences,
+    # frames of each subfolder are paired in file name order, at most length pairs
+    # are picked evenly across them. Frames smaller than crop are mirror padded.
+    # path None generates length pairs of shifted random textures for small scale tests
+    def __init__(self, path=None, crop=256, length=1000):
+        self.path = path
+        self.crop = crop
+        self.length = length
+        self.pairs = []
+        if path is None:
+            return
+        for root, dirs, files in sorted(os.walk(path)):
+            frames = sorted(f for f in files if os.path.splitext(f)[1].lower() in ('.png', '.jpg', '.exr'))
+            for i in range(len(frames) - 1):
+                self.pairs.append((os.path.join(root, frames[i]), os.path.join(root, frames[i + 1])))
+        if len(self.pairs) > length:
+            indices = np.linspace(0, len(self.pairs) - 1, length).round().astype(int)
+            self.pairs = [self.pairs[index] for index in indices]
+
+    def __len__(self):
+        return len(self.pairs) if self.path is not None else self.length
+
+    def read(self, path):
+        img = cv2.imread(path, cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1]
+        if img.dtype == np.uint8:
+            return img.astype(np.float32) / 255.
+        return np.clip(img.astype(np.float32), 0, 1)
+
+    def pad(self, img):
+        # mirrors frames smaller than crop up to crop size
+        h, w, _ = img.shape
+        if h >= self.crop and w >= self.crop:
+            return img
+        return np.pad(img, ((0, max(0, self.crop - h)), (0, max(0, self.crop - w)), (0, 0)), mode='symmetric')
+
+    def synthetic(self, index):
+        rng = np.random.RandomState(index)
+        size = self.crop + 32
+        texture = cv2.resize(rng.rand(size // 8, size // 8, 3).astype(np.float32), (size, size), interpolation=cv2.INTER_CUBIC)
+        dy, dx = rng.randint(-16, 17, 2)
+        img0 = texture[16:16 + self.crop, 16:16 + self.crop]
+        img1 = texture[16 + dy:16 + dy + self.crop, 16 + dx:16 + dx + self.crop]
+        return np.clip(img0, 0, 1), np.clip(img1, 0, 1)
+
+    def __getitem__(self, index):
+        if self.path is None:
+            img0, img1 = self.synthetic(index)
+        else:
+            img0 = self.pad(self.read(self.pairs[index][0]))
+            img1 = self.pad(self.read(self.pairs[index][1]))
+            if img0.shape != img1.shape:
+                raise ValueError('frame size differs within pair: %s, %s' % self.pairs[index])
+            h, w, _ = img0.shape
+            y = np.random.randint(0, h - self.crop + 1)
+            x = np.random.randint(0, w - self.crop + 1)
+            img0 = img0[y:y + self.crop, x:x + self.crop]
+            img1 = img1[y:y + self.crop, x:x + self.crop]
+        if random.uniform(0, 1) < 0.5:
+            img0 = img0[::-1]
+            img1 = img1[::-1]
+        if random.uniform(0, 1) < 0.5:
+            img0 = img0[:, ::-1]
+            img1 = img1[:, ::-1]
+        if random.uniform(0, 1) < 0.5:
+            img0, img1 = img1, img0
+        img0 = torch.from_numpy(img0.copy()).permute(2, 0, 1)
+        img1 = torch.from_numpy(img1.copy()).permute(2, 0, 1)
+        return torch.cat((img0, img1), 0)
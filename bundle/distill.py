@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import time
+import torch
+import random
+import argparse
+import numpy as np
+from torch.utils.data import DataLoader, Subset
+import warnings
+warnings.filterwarnings("ignore")
+
+from model.RIFE_HD import Model
+from model.IFNet_HD import IFNet
+from model.calibration import psnr
+from dataset import FramePairDataset
+from finetune import finetune
+
+# Trains a slimmer student flownet against a trained RIFE HD teacher.
+# No ground truth middle frames are needed: the student flow is pushed towards
+# the teacher flow and the frame synthesized from it by the teacher contextnet /
+# fusionnet towards the teacher output. Student folder is used with --model
+# in inference scripts, its flownet size is stored in config.json
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Distill a lightweight student flownet from a trained model')
+    parser.add_argument('--model', dest='model', type=str, default='./trained_models/default/v1.8.model', help='teacher model')
+    parser.add_argument('--data', dest='data', type=str, default=None, help='folder with image sequences, synthetic pairs if not set')
+    parser.add_argument('--output', dest='output', type=str, default=None, help='folder to save student model to')
+    parser.add_argument('--channels', dest='channels', type=int, nargs=4, default=[96, 64, 48, 32], help='student flownet block channels')
+    parser.add_argument('--depth', dest='depth', type=int, default=3, help='student ResBlocks per flownet block')
+    parser.add_argument('--steps', dest='steps', type=int, default=20000)
+    parser.add_argument('--batch_size', dest='batch_size', type=int, default=8)
+    parser.add_argument('--crop', dest='crop', type=int, default=256, help='training crop size, multiple of 64')
+    parser.add_argument('--lr', dest='lr', type=float, default=3e-4)
+    parser.add_argument('--flow_weight', dest='flow_weight', type=float, default=0.01, help='weight of flow loss against image loss')
+    parser.add_argument('--eval_pairs', dest='eval_pairs', type=int, default=16, help='pairs held out for the speed / PSNR report')
+    parser.add_argument('--cpu', dest='cpu', action='store_true', help='train on CPU')
+    parser.add_argument('--workers', dest='workers', type=int, default=4, help='data loader workers')
+    args = parser.parse_args()
+    if args.output is None:
+        parser.print_help()
+        sys.exit()
+
+    device = torch.device('cuda' if torch.cuda.is_available() and not args.cpu else 'cpu')
+    random.seed(1234)
+    np.random.seed(1234)
+    torch.manual_seed(1234)
+
+    teacher = Model(device=device)
+    teacher.load_model(args.model, -1)
+    teacher.eval()
+    for net in (teacher.flownet, teacher.contextnet, teacher.fusionnet):
+        net.requires_grad_(False)
+    print ('Teacher model loaded: %s' % args.model)
+
+    dataset = FramePairDataset(args.data, args.crop, length=args.steps * args.batch_size + args.eval_pairs)
+    if len(dataset) <= args.eval_pairs:
+        print ('not enough frame pairs: %s found, more than %s needed' % (len(dataset), args.eval_pairs))
+        sys.exit()
+    # last pairs are held out from training for the report
+    train_set = Subset(dataset, range(len(dataset) - args.eval_pairs))
+    eval_set = Subset(dataset, range(len(dataset) - args.eval_pairs, len(dataset)))
+    train_data = DataLoader(train_set, batch_size=args.batch_size, shuffle=True, drop_last=True, num_workers=args.workers)
+
+    student = IFNet(args.channels, args.depth).to(device)
+    student.train()
+    print ('Student flownet: channels %s, depth %s, %.1fM parameters (teacher %.1fM)' % (
+        args.channels, args.depth, sum(p.numel() for p in student.parameters()) / 1e6,
+        sum(p.numel() for p in teacher.flownet.parameters()) / 1e6))
+
+    finetune(teacher, student, teacher.predict, student.parameters(), train_data, args.steps, args.lr, device, args.flow_weight)
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+    torch.save(student.state_dict(), os.path.join(args.output, 'flownet.pkl'))
+    torch.save(teacher.contextnet.state_dict(), os.path.join(args.output, 'contextnet.pkl'))
+    torch.save(teacher.fusionnet.state_dict(), os.path.join(args.output, 'unet.pkl'))
+    config = {
+        'flownet': {'channels': args.channels, 'depth': args.depth},
+        'source_model': os.path.abspath(args.model),
+        }
+    with open(os.path.join(args.output, 'config.json'), 'w') as config_file:
+        json.dump(config, config_file, indent=4)
+
+    # student is loaded back from its folder the way inference scripts do
+    torch.set_grad_enabled(False)
+    model = Model(device=device)
+    model.load_model(args.output, -1)
+    model.eval()
+
+    psnr_list = []
+    teacher_time = 0
+    student_time = 0
+    for imgs in DataLoader(eval_set, batch_size=1):
+        imgs = imgs.to(device)
+        I0, I1 = imgs[:, :3], imgs[:, 3:]
+        start = time.time()
+        reference = teacher.inference(I0, I1)
+        teacher_time += time.time() - start
+        start = time.time()
+        result = model.inference(I0, I1)
+        student_time += time.time() - start
+        psnr_list.append(psnr(reference, result))
+
+    report = {
+        'pairs': len(eval_set),
+        'psnr': float(np.mean(psnr_list)),
+        'min_psnr': float(np.min(psnr_list)),
+        'teacher_sec_per_frame': teacher_time / len(eval_set),
+        'student_sec_per_frame': student_time / len(eval_set),
+    }
+    print ('---\nstudent against teacher on %s held out %s x %s pairs:' % (report['pairs'], args.crop, args.crop))
+    print ('PSNR: %.2f dB (min %.2f dB)' % (report['psnr'], report['min_psnr']))
+    print ('teacher: %.3f sec per frame, student: %.3f sec per frame (%.2fx)\n---' % (
+        report['teacher_sec_per_frame'], report['student_sec_per_frame'], report['teacher_sec_per_frame'] / report['student_sec_per_frame']))
+
+    config['report'] = report
+    with open(os.path.join(args.output, 'config.json'), 'w') as config_file:
+        json.dump(config, config_file, indent=4)
+    print ('Student model saved: %s' % args.output)
@@ -0,0 +1,42 @@
+import os
+import torch
+import argparse
+import warnings
+warnings.filterwarnings("ignore")
+
+from model.RIFE_HD import Model, FLOW_SCALES
+from model.driver import pad_size
+from model.RIFE_HD_onnx import export_onnx, check_onnx
+
+# exports trained flownet.pkl / contextnet.pkl / unet.pkl
+# as a single ONNX graph for a given frame size.
+# Inference scripts with --backend onnx do the same on first use of a frame size
+# and cache graphs in --compile_cache folder
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export RIFE HD model to ONNX')
+    parser.add_argument('--model', dest='model', type=str, default='./trained_models/default/v1.8.model')
+    parser.add_argument('--output', dest='output', type=str, default=None, help='onnx file to write')
+    parser.add_argument('--width', dest='width', type=int, default=1920)
+    parser.add_argument('--height', dest='height', type=int, default=1080)
+    parser.add_argument('--UHD', dest='UHD', action='store_true', help='flow size 1/4')
+    parser.add_argument('--flow_scale', dest='flow_scale', type=float, default=0, choices=(0, ) + FLOW_SCALES, help='flow size relative to the frame, 0.125 or 0.0625 for 6K / 8K, overrides --UHD')
+    parser.add_argument('--opset', dest='opset', type=int, default=17)
+    args = parser.parse_args()
+    if args.output is None:
+        parser.print_help()
+        exit()
+    if args.flow_scale:
+        # UHD argument of the model carries the flow size
+        args.UHD = args.flow_scale
+    check_onnx()
+
+    model = Model(device=torch.device('cpu'))
+    model.load_model(args.model, -1)
+    model.eval()
+    print ('Trained model loaded: %s' % args.model)
+
+    # padded as inference scripts pad frames of this size
+    ph, pw, _ = pad_size(args.height, args.width, args.UHD)
+    export_onnx(model, os.path.abspath(args.output), ph, pw, args.UHD, args.opset)
+    print ('Exported %s x %s graph to %s' % (pw, ph, args.output))
@@ -0,0 +1,53 @@
+import math
+import time
+import torch
+import numpy as np
+from torch.optim import AdamW
+
+# Training loop shared by distill.py and prune.py: a student flownet, and the nets
+# synthesizing its frames, are pushed towards a trained teacher model output on
+# FramePairDataset batches. No ground truth middle frames are needed
+
+
+def get_learning_rate(step, steps, lr):
+    warmup = min(200, steps // 10)
+    if step < warmup:
+        return lr * (step + 1) / warmup
+    return lr * (np.cos((step - warmup) / max(1, steps - warmup) * math.pi) * 0.5 + 0.5)
+
+
+def finetune(teacher, flownet, predict, parameters, train_data, steps, lr, device, flow_weight=0):
+    # flownet flow goes through predict(imgs, flow) and is trained against teacher output,
+    # with flow_weight its flow pyramid is also pushed towards the teacher flow.
+    # parameters are the ones optimized, train_data yields N x 6 x H x W batches
+    optimizer = AdamW(parameters, lr=lr, weight_decay=1e-5)
+    step = 0
+    time_stamp = time.time()
+    with torch.enable_grad():
+        while step < steps:
+            for imgs in train_data:
+                if step >= steps:
+                    break
+                imgs = imgs.to(device, non_blocking=True)
+                learning_rate = get_learning_rate(step, steps, lr)
+                for param_group in optimizer.param_groups:
+                    param_group['lr'] = learning_rate
+                with torch.no_grad():
+                    teacher_flow, _ = teacher.flownet(imgs)
+                    teacher_pred = teacher.predict(imgs, teacher_flow, training=False)
+                flow, flow_list = flownet(imgs)
+                pred = predict(imgs, flow, training=False)
+                loss_l1 = (pred - teacher_pred).abs().mean()
+                loss = loss_l1
+                if flow_weight:
+                    loss_flow = sum((f - teacher_flow).abs().mean() for f in flow_list) / len(flow_list)
+                    loss = loss_l1 + flow_weight * loss_flow
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+                if step % 100 == 0:
+                    print ('step: {}/{} time: {:.2f} lr: {:.2e} loss_l1: {:.4e}{}'.format(
+                        step, steps, time.time() - time_stamp, learning_rate, loss_l1.item(),
+                        ' loss_flow: {:.4e}'.format(loss_flow.item()) if flow_weight else ''))
+                    time_stamp = time.time()
+                step += 1
@@ -11,6 +11,8 @@ from torch.nn import functional as F
 import warnings
 import _thread
 from queue import Queue, Empty
+from model.RIFE_HD import FLOW_SCALES
+from model.driver import device_type, time_budget_workers, pad_size, load_model, configure_model, cpu_workers, print_stats, make_inference_rational_batch, make_inference_rational_cpu
 
 from pprint import pprint, pformat
 import time
@@ -82,79 +84,6 @@ def build_read_buffer(user_args, read_buffer, videogen):
         read_buffer.put(frame_data)
     read_buffer.put(None)
 
-def make_inference_rational(model, I0, I1, ratio, rthreshold=0.02, maxcycles=5, UHD=False, always_interp=False):
-    I0_ratio = 0.0
-    I1_ratio = 1.0
-    rational_m = torch.mean(I0) * ratio + torch.mean(I1) * (1 - ratio)
-
-    if not always_interp:
-        if ratio <= I0_ratio + rthreshold / 2:
-            return I0
-        if ratio >= I1_ratio - rthreshold / 2:
-            return I1
-
-    for inference_cycle in range(0, maxcycles):
-        middle = model.inference(I0, I1, UHD)
-        middle_ratio = (I0_ratio + I1_ratio) / 2
-        
-        if not always_interp:
-            if ratio - (rthreshold / 2) <= middle_ratio <= ratio + (rthreshold / 2):
-                return middle # + (rational_m - torch.mean(middle)).expand_as(middle)
-
-        if ratio > middle_ratio:
-            I0 = middle
-            I0_ratio = middle_ratio
-        else:
-            I1 = middle
-            I1_ratio = middle_ratio
-    
-    return middle # + (rational_m - torch.mean(middle)).expand_as(middle)
-
-
-def make_inference_rational_cpu(model, I0, I1, ratio, frame_num, w, h, write_buffer, rthreshold=0.02, maxcycles=8, UHD=False, always_interp=False):
-    device = torch.device("cpu")
-    torch.set_grad_enabled(False)
-
-    I0_ratio = 0.0
-    I1_ratio = 1.0
-    rational_m = torch.mean(I0) * ratio + torch.mean(I1) * (1 - ratio)
-
-    if not always_interp:
-        if ratio <= I0_ratio + rthreshold / 2:
-            I0 = (((I0[0]).cpu().detach().numpy().transpose(1, 2, 0)))
-            write_buffer.put((frame_num, I0[:h, :w]))
-            return
-        if ratio >= I1_ratio - rthreshold / 2:
-            I1 = (((I1[0]).cpu().detach().numpy().transpose(1, 2, 0)))
-            write_buffer.put((frame_num, I1[:h, :w]))
-            return
-
-    for inference_cycle in range(0, maxcycles):
-        middle = model.inference(I0, I1, UHD)
-        middle_ratio = (I0_ratio + I1_ratio) / 2
-        
-        if not always_interp:
-            if ratio - (rthreshold / 2) <= middle_ratio <= ratio + (rthreshold / 2):
-                # middle = middle + (rational_m - torch.mean(middle)).expand_as(middle)
-                middle = (((middle[0]).cpu().detach().numpy().transpose(1, 2, 0)))
-                write_buffer.put((frame_num, middle[:h, :w]))
-                return
-
-        if ratio > middle_ratio:
-            middle = middle.detach()
-            I0 = middle.to(device, non_blocking=True)
-            I0_ratio = middle_ratio
-        else:
-            middle = middle.detach()
-            I1 = middle.to(device, non_blocking=True)
-            I1_ratio = middle_ratio
-
-    # middle + (rational_m - torch.mean(middle)).expand_as(middle)
-    middle = (((middle[0]).cpu().detach().numpy().transpose(1, 2, 0)))
-    write_buffer.put((frame_num, middle[:h, :w]))
-    return
-
-
 def dictify(r, root=True):
     from copy import copy
 
@@ -467,9 +396,36 @@ if __name__ == '__main__':
     parser.add_argument('--record_out', dest='record_out', type=int, default=0, help='record out point relative to tw setup')
     parser.add_argument('--model', dest='model', type=str, default='./trained_models/default/v1.8.model')
     parser.add_argument('--UHD', dest='UHD', action='store_true', help='flow size 1/4')
+    parser.add_argument('--flow_scale', dest='flow_scale', type=float, default=0, choices=(0, ) + FLOW_SCALES, help='flow size relative to the frame, 0.125 or 0.0625 for 6K / 8K, overrides --UHD')
     parser.add_argument('--cpu', dest='cpu', action='store_true', help='do not use GPU at all, process only on CPU')
+    parser.add_argument('--timestep', dest='timestep', action='store_true', help='synthesize frames at given ratio from a single flow estimate instead of bisection')
+    parser.add_argument('--batch_size', dest='batch_size', type=int, default=1, help='number of frames to process in one pass')
+    parser.add_argument('--memory_budget', dest='memory_budget', type=float, default=0, help='pick batch size to fit in given memory (Gb) per worker')
+    parser.add_argument('--precision', dest='precision', type=str, default='fp32', choices=['fp32', 'bf16', 'fp16'], help='inference precision')
+    parser.add_argument('--min_psnr', dest='min_psnr', type=float, default=40.0, help='fall back to fp32 if reduced precision PSNR is lower (dB)')
+    parser.add_argument('--compile', dest='compile', action='store_true', help='trace and freeze inference graph, compiled graphs are cached on disk')
+    parser.add_argument('--compile_cache', dest='compile_cache', type=str, default='./compiled_models', help='folder to cache compiled graphs in')
+    parser.add_argument('--backend', dest='backend', type=str, default='torch', choices=['torch', 'onnx'], help='run inference with torch or onnx runtime')
+    parser.add_argument('--channels_last', dest='channels_last', action='store_true', help='run networks in channels_last memory format, faster on CPU')
+    parser.add_argument('--quality', dest='quality', type=str, default='final', choices=['draft', 'normal', 'final'], help='speed / quality tier, draft skips the last flow block and refinement')
+    parser.add_argument('--similarity_gate', dest='similarity_gate', type=float, default=0, help='pairs whose frames differ less than this skip the model, 0 - off')
+    parser.add_argument('--gate_mode', dest='gate_mode', type=str, default='blend', choices=['blend', 'nearest'], help='similarity gate fast path: blend the two frames or copy the nearer one')
+    parser.add_argument('--sparse', dest='sparse', action='store_true', help='run contextnet and fusionnet only on tiles with motion, blend static tiles')
+    parser.add_argument('--adaptive_flow', dest='adaptive_flow', action='store_true', help='pick flow size per pair from its estimated motion: 1/4 for large motion, 1/2 for small')
+    parser.add_argument('--flow_cache', dest='flow_cache', type=str, default=None, help='folder to keep flownet results in, so the same frame pairs rendered again skip flownet (torch eager only)')
+    parser.add_argument('--flow_cache_size', dest='flow_cache_size', type=float, default=20, help='flow cache size limit (GB)')
+    parser.add_argument('--flow_cache_age', dest='flow_cache_age', type=float, default=14, help='flow cache entries unused for this many days are removed')
+    parser.add_argument('--roi', dest='roi', type=str, default=None, help='x,y,w,h region to interpolate in pixels from the top left corner, the rest of the frame is blended')
+    parser.add_argument('--time_budget', dest='time_budget', type=float, default=0, help='pick model, backend, precision and quality from profile_models.py profiles to finish in given minutes')
+    parser.add_argument('--tile_size', dest='tile_size', type=int, default=0, help='render frames larger than this in overlapping tiles (px), 0 - pick from memory budget')
+    parser.add_argument('--tile_overlap', dest='tile_overlap', type=int, default=64, help='tiles overlap (px)')
 
     args = parser.parse_args()
+    if args.flow_scale:
+        # UHD argument of the model carries the flow size
+        args.UHD = args.flow_scale
+    if args.roi:
+        args.roi = [int(v) for v in args.roi.split(',')]
     if (args.output is None or args.input is None or args.setup is None):
          parser.print_help()
          sys.exit()
@@ -506,29 +462,39 @@ if __name__ == '__main__':
     
     output_duration = (args.record_out - args.record_in) + 1
 
+    src_start_frame = cv2.imread(src_files.get(start_frame), cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
+    h, w, _ = src_start_frame.shape
+    ph, pw, padding = pad_size(h, w, args.UHD)
+
+    if args.time_budget:
+        # at most one synthesized frame per output frame, without --timestep
+        # bisection runs up to maxcycles passes for it: 5 on GPU, 8 on CPU
+        from model.registry import apply_time_budget
+        cycles = 1 if args.timestep else (5 if device_type(args) == 'cuda' else 8)
+        apply_time_budget(args, w, h, output_duration * cycles, device_type(args), time_budget_workers(args, h, w))
+
+    ref_frames = None
+    if args.precision != 'fp32':
+        # reduced precision is checked against fp32 on the first pair of the clip
+        ref_image = cv2.imread(src_files.get(start_frame + 1, src_files.get(start_frame)), cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
+        ref_frames = (src_start_frame, ref_image)
+
     if torch.cuda.is_available() and not args.cpu:
         # Process on GPU
 
-        from model.RIFE_HD import Model     # type: ignore
-        model = Model()
-        model.load_model(args.model, -1)
-        model.eval()
-        model.device()
-        print ('Trained model loaded: %s' % args.model)
+        device = torch.device("cuda")
+        model = load_model(args, device)
 
         write_buffer = Queue(maxsize=mp.cpu_count() - 3)
         _thread.start_new_thread(clear_write_buffer, (args, write_buffer, output_duration))
-    
-        src_start_frame = cv2.imread(src_files.get(start_frame), cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
-        h, w, _ = src_start_frame.shape
-        ph = ((h - 1) // 64 + 1) * 64
-        pw = ((w - 1) // 64 + 1) * 64
-        padding = (0, pw - w, 0, ph - h)
-    
-        device = torch.device("cuda")
-        torch.set_grad_enabled(False)
-        torch.backends.cudnn.enabled = True
-        torch.backends.cudnn.benchmark = True
+
+        configure_model(model, args, h, w, ref_frames)
+
+        batch_frame_numbers = []
+        batch_I0 = []
+        batch_I1 = []
+        batch_ratios = []
+        batch_pairs = []
 
         output_frame_number = 1
         for frame_number in range(args.record_in, args.record_out +1):
@@ -560,12 +526,32 @@ if __name__ == '__main__':
             I0 = F.pad(I0, padding)
             I1 = F.pad(I1, padding)
             
-            mid = make_inference_rational(model, I0, I1, ratio, UHD = args.UHD)
-            mid = (((mid[0]).cpu().numpy().transpose(1, 2, 0)))
-            write_buffer.put((output_frame_number, mid[:h, :w]))
+            batch_frame_numbers.append(output_frame_number)
+            batch_I0.append(I0)
+            batch_I1.append(I1)
+            batch_ratios.append(ratio)
+            # output frames between the same source frames share their flow
+            batch_pairs.append(I0_frame_number)
+
+            if len(batch_frame_numbers) >= args.batch_size:
+                mids = make_inference_rational_batch(model, torch.cat(batch_I0), torch.cat(batch_I1), batch_ratios, maxcycles = 5, UHD = args.UHD, timestep = args.timestep, pairs = batch_pairs)
+                for index, batch_frame_number in enumerate(batch_frame_numbers):
+                    mid = (((mids[index]).cpu().numpy().transpose(1, 2, 0)))
+                    write_buffer.put((batch_frame_number, mid[:h, :w]))
+                batch_frame_numbers = []
+                batch_I0 = []
+                batch_I1 = []
+                batch_ratios = []
+                batch_pairs = []
 
             output_frame_number += 1
 
+        if batch_frame_numbers:
+            mids = make_inference_rational_batch(model, torch.cat(batch_I0), torch.cat(batch_I1), batch_ratios, maxcycles = 5, UHD = args.UHD, timestep = args.timestep, pairs = batch_pairs)
+            for index, batch_frame_number in enumerate(batch_frame_numbers):
+                mid = (((mids[index]).cpu().numpy().transpose(1, 2, 0)))
+                write_buffer.put((batch_frame_number, mid[:h, :w]))
+
         # send write loop exit code
         write_buffer.put((-1, -1))
 
@@ -574,41 +560,12 @@ if __name__ == '__main__':
             time.sleep(0.01)
     
     else:
-        # process on GPU
-
-        from model_cpu.RIFE_HD import Model     # type: ignore
-        model = Model()
-        model.load_model(args.model, -1)
-        model.eval()
-        model.device()
-        print ('Trained model loaded: %s' % args.model)
-
-        src_start_frame = cv2.imread(src_files.get(start_frame), cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
-        h, w, _ = src_start_frame.shape
-        ph = ((h - 1) // 64 + 1) * 64
-        pw = ((w - 1) // 64 + 1) * 64
-        padding = (0, pw - w, 0, ph - h)
+        # process on CPU
 
         device = torch.device('cpu')
-        torch.set_grad_enabled(False)
-
-
-        max_cpu_workers = mp.cpu_count() - 2
-        available_ram = psutil.virtual_memory()[1]/( 1024 ** 3 )
-        megapixels = ( h * w ) / ( 10 ** 6 )
-        thread_ram = megapixels * 2.4
-        sim_workers = round( available_ram / thread_ram )
-        if sim_workers < 1:
-            sim_workers = 1
-        elif sim_workers > max_cpu_workers:
-            sim_workers = max_cpu_workers
-
-        print ('---\nFree RAM: %s Gb available' % '{0:.1f}'.format(available_ram))
-        print ('Image size: %s x %s' % ( w, h,))
-        print ('Peak memory usage estimation: %s Gb per CPU thread ' % '{0:.1f}'.format(thread_ram))
-        print ('Using %s CPU worker thread%s (of %s available)\n---' % (sim_workers, '' if sim_workers == 1 else 's', mp.cpu_count()))
-        if thread_ram > available_ram:
-            print ('Warning: estimated peak memory usage is greater then RAM avaliable')
+        model = load_model(args, device)
+        thread_ram = configure_model(model, args, h, w, ref_frames)
+        sim_workers, thread_ram = cpu_workers(model, args, h, w, thread_ram)
 
         write_buffer = mp.Queue(maxsize=mp.cpu_count() - 3)
         _thread.start_new_thread(clear_write_buffer, (args, write_buffer, input_duration))
@@ -617,6 +574,12 @@ if __name__ == '__main__':
         output_frame_number = 1
         last_thread_time = time.time()
 
+        batch_frame_numbers = []
+        batch_I0 = []
+        batch_I1 = []
+        batch_ratios = []
+        batch_pairs = []
+
         for frame_number in range(args.record_in, args.record_out +1):
 
             I0_frame_number = int(frame_value_map[frame_number])
@@ -646,10 +609,27 @@ if __name__ == '__main__':
             I0 = F.pad(I0, padding)
             I1 = F.pad(I1, padding)
             
-            p = mp.Process(target=make_inference_rational_cpu, args=(model, I0, I1, ratio, output_frame_number, w, h, write_buffer), kwargs = {'UHD': args.UHD})
+            batch_frame_numbers.append(output_frame_number)
+            batch_I0.append(I0)
+            batch_I1.append(I1)
+            batch_ratios.append(ratio)
+            # output frames between the same source frames share their flow
+            batch_pairs.append(I0_frame_number)
+
+            if len(batch_frame_numbers) < args.batch_size:
+                output_frame_number += 1
+                continue
+
+            p = mp.Process(target=make_inference_rational_cpu, args=(model, torch.cat(batch_I0), torch.cat(batch_I1), batch_ratios, batch_frame_numbers, w, h, write_buffer), kwargs = {'UHD': args.UHD, 'timestep': args.timestep, 'pairs': batch_pairs})
             p.start()
             active_workers.append(p)
 
+            batch_frame_numbers = []
+            batch_I0 = []
+            batch_I1 = []
+            batch_ratios = []
+            batch_pairs = []
+
             if (time.time() - last_thread_time) < (thread_ram / 8):
                 if sim_workers > 1:
                     time.sleep(thread_ram/8)
@@ -668,6 +648,11 @@ if __name__ == '__main__':
 
             output_frame_number += 1
 
+        if batch_frame_numbers:
+            p = mp.Process(target=make_inference_rational_cpu, args=(model, torch.cat(batch_I0), torch.cat(batch_I1), batch_ratios, batch_frame_numbers, w, h, write_buffer), kwargs = {'UHD': args.UHD, 'timestep': args.timestep, 'pairs': batch_pairs})
+            p.start()
+            active_workers.append(p)
+
         while len(active_workers) >= sim_workers:
             finished_workers = []
             alive_workers = []
@@ -691,6 +676,8 @@ if __name__ == '__main__':
         while(IOThreadsFlag):
             time.sleep(0.01)
         
+    print_stats(model, args)
+
     for p in IOProcesses:
         p.join(timeout=8)
 
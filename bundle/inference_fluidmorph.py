@@ -11,6 +11,8 @@ import _thread
 import threading
 import skvideo.io
 from queue import Queue, Empty
+from model.RIFE_HD import FLOW_SCALES
+from model.driver import device_type, time_budget_workers, pad_size, load_model, configure_model, cpu_workers, print_stats, make_inference_rational_batch
 warnings.filterwarnings("ignore")
 
 from pprint import pprint, pformat
@@ -82,75 +84,22 @@ def build_read_buffer(folder, read_buffer, file_list):
         read_buffer.put(frame_data)
     read_buffer.put(None)
 
-def make_inference_rational(model, I0, I1, ratio, rthreshold = 0.02, maxcycles = 8, UHD=False, always_interp=False):
-    I0_ratio = 0.0
-    I1_ratio = 1.0
-    rational_m = torch.mean(I0) * ratio + torch.mean(I1) * (1 - ratio)
-
-    if not always_interp:
-        if ratio <= I0_ratio + rthreshold / 2:
-            return I0
-        if ratio >= I1_ratio - rthreshold / 2:
-            return I1
-    # print ('target ratio: %s' % ratio)
-    for inference_cycle in range(0, maxcycles):
-        middle = model.inference(I0, I1, UHD)
-        middle_ratio = ( I0_ratio + I1_ratio ) / 2
-        if not always_interp:
-            if ratio - (rthreshold / 2) <= middle_ratio <= ratio + (rthreshold / 2):
-                return middle # + (rational_m - torch.mean(middle)).expand_as(middle)
-
-        if ratio > middle_ratio:
-            I0 = middle
-            I0_ratio = middle_ratio
-        else:
-            I1 = middle
-            I1_ratio = middle_ratio
-
-    return middle # + (rational_m - torch.mean(middle)).expand_as(middle)
-
-
-def three_of_a_perfect_pair(incoming_frame, outgoing_frame, frame_num, ratio, device, padding, model, args, h, w, write_buffer):
-    # print ('target ratio %s' % ratio)
-    rthreshold = 0.02
-    maxcycles = 8
-    I0_ratio = 0.0
-    I1_ratio = 1.0
-    
-    if ratio <= I0_ratio + rthreshold / 2:
-        write_buffer.put((frame_num, incoming_frame))
-        return
-    if ratio >= I1_ratio - rthreshold / 2:
-        write_buffer.put((frame_num, outgoing_frame))
-        return
-
-    for inference_cycle in range(0, maxcycles):
-        start = time.time()
+def three_of_a_perfect_pair(incoming_frames, outgoing_frames, frame_nums, ratios, device, padding, model, args, h, w, write_buffer):
+    # renders a batch of transition frames in a CPU worker process
+    torch.set_grad_enabled(False)
 
+    batch_I0 = []
+    batch_I1 = []
+    for incoming_frame, outgoing_frame in zip(incoming_frames, outgoing_frames):
         I0 = torch.from_numpy(np.transpose(incoming_frame, (2,0,1))).to(device, non_blocking=True).unsqueeze(0)
-        I0 = F.pad(I0, padding)
+        batch_I0.append(F.pad(I0, padding))
         I1 = torch.from_numpy(np.transpose(outgoing_frame, (2,0,1))).to(device, non_blocking=True).unsqueeze(0)
-        I1 = F.pad(I1, padding)
+        batch_I1.append(F.pad(I1, padding))
 
-        # rational_m = torch.mean(I0) * ratio + torch.mean(I1) * (1 - ratio)
-
-        middle = model.inference(I0, I1, args.UHD)
-        # middle = middle + (rational_m - torch.mean(middle)).expand_as(middle)
-        middle = (((middle[0]).cpu().detach().numpy().transpose(1, 2, 0)))
-        middle_ratio = ( I0_ratio + I1_ratio ) / 2
-        
-        if ratio - (rthreshold / 2) <= middle_ratio <= ratio + (rthreshold / 2):
-            write_buffer.put((frame_num, middle[:h, :w]))
-            return
-
-        if ratio > middle_ratio:
-            incoming_frame = middle[:h, :w]
-            I0_ratio = middle_ratio
-        else:
-            outgoing_frame = middle[:h, :w]
-            I1_ratio = middle_ratio
-
-    write_buffer.put((frame_num, middle[:h, :w]))
+    middles = make_inference_rational_batch(model, torch.cat(batch_I0), torch.cat(batch_I1), ratios, UHD = args.UHD, timestep = args.timestep)
+    for index, frame_num in enumerate(frame_nums):
+        middle = (((middles[index]).cpu().detach().numpy().transpose(1, 2, 0)))
+        write_buffer.put((frame_num, middle[:h, :w]))
     return
 
 if __name__ == '__main__':
@@ -164,10 +113,34 @@ if __name__ == '__main__':
     parser.add_argument('--output', dest='output', type=str, default=None)
     parser.add_argument('--model', dest='model', type=str, default='./trained_models/default/v1.8.model')
     parser.add_argument('--UHD', dest='UHD', action='store_true', help='flow size 1/4')
+    parser.add_argument('--flow_scale', dest='flow_scale', type=float, default=0, choices=(0, ) + FLOW_SCALES, help='flow size relative to the frame, 0.125 or 0.0625 for 6K / 8K, overrides --UHD')
     parser.add_argument('--cpu', dest='cpu', action='store_true', help='process only on CPU(s)')
     parser.add_argument('--curve', dest='curve', type=int, default=1, help='1 - linear, 2 - smooth')
+    parser.add_argument('--timestep', dest='timestep', action='store_true', help='synthesize frames at given ratio from a single flow estimate instead of bisection')
+    parser.add_argument('--batch_size', dest='batch_size', type=int, default=1, help='number of frames to process in one pass')
+    parser.add_argument('--memory_budget', dest='memory_budget', type=float, default=0, help='pick batch size to fit in given memory (Gb) per worker')
+    parser.add_argument('--precision', dest='precision', type=str, default='fp32', choices=['fp32', 'bf16', 'fp16'], help='inference precision')
+    parser.add_argument('--min_psnr', dest='min_psnr', type=float, default=40.0, help='fall back to fp32 if reduced precision PSNR is lower (dB)')
+    parser.add_argument('--compile', dest='compile', action='store_true', help='trace and freeze inference graph, compiled graphs are cached on disk')
+    parser.add_argument('--compile_cache', dest='compile_cache', type=str, default='./compiled_models', help='folder to cache compiled graphs in')
+    parser.add_argument('--backend', dest='backend', type=str, default='torch', choices=['torch', 'onnx'], help='run inference with torch or onnx runtime')
+    parser.add_argument('--channels_last', dest='channels_last', action='store_true', help='run networks in channels_last memory format, faster on CPU')
+    parser.add_argument('--quality', dest='quality', type=str, default='final', choices=['draft', 'normal', 'final'], help='speed / quality tier, draft skips the last flow block and refinement')
+    parser.add_argument('--similarity_gate', dest='similarity_gate', type=float, default=0, help='pairs whose frames differ less than this skip the model, 0 - off')
+    parser.add_argument('--gate_mode', dest='gate_mode', type=str, default='blend', choices=['blend', 'nearest'], help='similarity gate fast path: blend the two frames or copy the nearer one')
+    parser.add_argument('--sparse', dest='sparse', action='store_true', help='run contextnet and fusionnet only on tiles with motion, blend static tiles')
+    parser.add_argument('--adaptive_flow', dest='adaptive_flow', action='store_true', help='pick flow size per pair from its estimated motion: 1/4 for large motion, 1/2 for small')
+    parser.add_argument('--flow_cache', dest='flow_cache', type=str, default=None, help='folder to keep flownet results in, so the same frame pairs rendered again skip flownet (torch eager only)')
+    parser.add_argument('--flow_cache_size', dest='flow_cache_size', type=float, default=20, help='flow cache size limit (GB)')
+    parser.add_argument('--flow_cache_age', dest='flow_cache_age', type=float, default=14, help='flow cache entries unused for this many days are removed')
+    parser.add_argument('--time_budget', dest='time_budget', type=float, default=0, help='pick model, backend, precision and quality from profile_models.py profiles to finish in given minutes')
+    parser.add_argument('--tile_size', dest='tile_size', type=int, default=0, help='render frames larger than this in overlapping tiles (px), 0 - pick from memory budget')
+    parser.add_argument('--tile_overlap', dest='tile_overlap', type=int, default=64, help='tiles overlap (px)')
 
     args = parser.parse_args()
+    if args.flow_scale:
+        # UHD argument of the model carries the flow size
+        args.UHD = args.flow_scale
     if (args.incoming is None or args.outgoing is None or args.output is None):
          parser.print_help()
          sys.exit()
@@ -220,9 +193,17 @@ if __name__ == '__main__':
     
     h = h_inc
     w = w_inc
-    ph = ((h - 1) // 64 + 1) * 64
-    pw = ((w - 1) // 64 + 1) * 64
-    padding = (0, pw - w, 0, ph - h)
+    ph, pw, padding = pad_size(h, w, args.UHD)
+
+    if args.time_budget:
+        # one synthesized frame per input frame, without --timestep
+        # bisection runs up to maxcycles (8) passes for it
+        from model.registry import apply_time_budget
+        cycles = 1 if args.timestep else 8
+        apply_time_budget(args, w, h, input_duration * cycles, device_type(args), time_budget_workers(args, h, w))
+
+    # reduced precision is checked against fp32 on the first incoming / outgoing pair
+    ref_frames = (incoming_first_image, outgoing_first_image)
 
     output_folder = os.path.abspath(args.output)
     if not os.path.exists(output_folder):
@@ -244,24 +225,20 @@ if __name__ == '__main__':
         _thread.start_new_thread(build_read_buffer, (args.incoming, incoming_read_buffer, incoming_files_list))
         _thread.start_new_thread(build_read_buffer, (args.outgoing, outgoing_read_buffer, outgoing_files_list))
 
-        from model.RIFE_HD import Model     # type: ignore
-        model = Model()
-        model.load_model(args.model, -1)
-        model.eval()
-        model.device()
-        print ('Trained model loaded: %s' % args.model)
-
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        if torch.cuda.is_available():
-            torch.set_grad_enabled(False)
-            torch.backends.cudnn.enabled = True
-            torch.backends.cudnn.benchmark = True
+        device = torch.device("cuda")
+        model = load_model(args, device)
+        configure_model(model, args, h, w, ref_frames)
 
         _thread.start_new_thread(clear_write_buffer, (args.output, write_buffer, input_duration))
 
         rstep = 1 / ( input_duration + 1 )
         ratio = rstep
 
+        batch_frames = []
+        batch_I0 = []
+        batch_I1 = []
+        batch_ratios = []
+
         for frame in range(1, input_duration + 1):
             incoming_frame = incoming_read_buffer.get()
             outgoing_frame = outgoing_read_buffer.get()
@@ -271,12 +248,25 @@ if __name__ == '__main__':
             I1 = torch.from_numpy(np.transpose(outgoing_frame, (2,0,1))).to(device, non_blocking=True).unsqueeze(0)
             I1 = F.pad(I1, padding)
 
-            mid = make_inference_rational(model, I0, I1, ratio, UHD = args.UHD)
-            mid = (((mid[0]).cpu().numpy().transpose(1, 2, 0)))
-            write_buffer.put((frame, mid[:h, :w]))
-            
+            batch_frames.append(frame)
+            batch_I0.append(I0)
+            batch_I1.append(I1)
+            batch_ratios.append(ratio)
             ratio += rstep
 
+            if len(batch_frames) < args.batch_size and frame < input_duration:
+                continue
+
+            mids = make_inference_rational_batch(model, torch.cat(batch_I0), torch.cat(batch_I1), batch_ratios, UHD = args.UHD, timestep = args.timestep)
+            for index, batch_frame in enumerate(batch_frames):
+                mid = (((mids[index]).cpu().numpy().transpose(1, 2, 0)))
+                write_buffer.put((batch_frame, mid[:h, :w]))
+
+            batch_frames = []
+            batch_I0 = []
+            batch_I1 = []
+            batch_ratios = []
+
         # send write loop exit code
         write_buffer.put((-1, -1))
 
@@ -302,35 +292,11 @@ if __name__ == '__main__':
         _thread.start_new_thread(build_read_buffer, (args.incoming, incoming_read_buffer, incoming_files_list))
         _thread.start_new_thread(build_read_buffer, (args.outgoing, outgoing_read_buffer, outgoing_files_list))
 
-        from model_cpu.RIFE_HD import Model     # type: ignore
-        model = Model()
-        model.load_model(args.model, -1)
-        model.eval()
-        model.device()
-        print ('Trained model loaded: %s' % args.model)
-
         device = torch.device('cpu')
-        torch.set_grad_enabled(False)
-        
-        max_cpu_workers = mp.cpu_count() - 2
-        available_ram = psutil.virtual_memory()[1]/( 1024 ** 3 )
-        megapixels = ( h * w ) / ( 10 ** 6 )
-        thread_ram = megapixels * 2.4
-        sim_workers = round( available_ram / thread_ram )
-        if sim_workers < 1:
-            sim_workers = 1
-        elif sim_workers > max_cpu_workers:
-            sim_workers = max_cpu_workers
-        
-        # sim_workers = 1
-        
-        print ('---\nFree RAM: %s Gb available' % '{0:.1f}'.format(available_ram))
-        print ('Image size: %s x %s' % ( w, h,))
-        print ('Peak memory usage estimation: %s Gb per CPU thread ' % '{0:.1f}'.format(thread_ram))
-        print ('Using %s CPU worker thread%s (of %s available)\n---' % (sim_workers, '' if sim_workers == 1 else 's', mp.cpu_count()))
-        if thread_ram > available_ram:
-            print ('Warning: estimated peak memory usage is greater then RAM avaliable')
-        
+        model = load_model(args, device)
+        thread_ram = configure_model(model, args, h, w, ref_frames)
+        sim_workers, thread_ram = cpu_workers(model, args, h, w, thread_ram)
+
         # print ('rendering %s frames to %s/' % (last_frame_number, args.output))
         _thread.start_new_thread(clear_write_buffer, (args.output, write_buffer, input_duration))
 
@@ -344,17 +310,33 @@ if __name__ == '__main__':
         rstep = 1 / ( input_duration + 1 )
         ratio = rstep
 
+        batch_frames = []
+        batch_incoming = []
+        batch_outgoing = []
+        batch_ratios = []
+
         last_thread_time = time.time()
         for frame in range(1, input_duration + 1):
             incoming_frame = incoming_read_buffer.get()
             outgoing_frame = outgoing_read_buffer.get()
 
-            
-            p = mp.Process(target=three_of_a_perfect_pair, args=(incoming_frame, outgoing_frame, frame, ratio, device, padding, model, args, h, w, write_buffer, ))
+            batch_frames.append(frame)
+            batch_incoming.append(incoming_frame)
+            batch_outgoing.append(outgoing_frame)
+            batch_ratios.append(ratio)
+            ratio += rstep
+
+            if len(batch_frames) < args.batch_size and frame < input_duration:
+                continue
+
+            p = mp.Process(target=three_of_a_perfect_pair, args=(batch_incoming, batch_outgoing, batch_frames, batch_ratios, device, padding, model, args, h, w, write_buffer, ))
             p.start()
             active_workers.append(p)
 
-            ratio += rstep
+            batch_frames = []
+            batch_incoming = []
+            batch_outgoing = []
+            batch_ratios = []
             
             # try to shift threads in time to avoid memory congestion
             if (time.time() - last_thread_time) < (thread_ram / 8):
@@ -384,6 +366,8 @@ if __name__ == '__main__':
         while(IOThreadsFlag):
             time.sleep(0.01)
 
+    print_stats(model, args)
+
     for p in IOProcesses:
         p.join(timeout=8)
 
@@ -3,8 +3,8 @@ import cv2
 import torch
 import argparse
 from torch.nn import functional as F
-from model.RIFE_HD import Model
 import warnings
+from model.RIFE_HD import flow_padding
 warnings.filterwarnings("ignore")
 
 from pprint import pprint
@@ -18,12 +18,37 @@ if torch.cuda.is_available():
 parser = argparse.ArgumentParser(description='Interpolation for a pair of images')
 parser.add_argument('--img', dest='img', nargs=2, required=True)
 parser.add_argument('--exp', default=4, type=int)
+parser.add_argument('--precision', dest='precision', type=str, default='fp32', choices=['fp32', 'bf16', 'fp16'], help='inference precision')
+parser.add_argument('--min_psnr', dest='min_psnr', type=float, default=40.0, help='fall back to fp32 if reduced precision PSNR is lower (dB)')
+parser.add_argument('--compile', dest='compile', action='store_true', help='trace and freeze inference graph, compiled graphs are cached on disk')
+parser.add_argument('--compile_cache', dest='compile_cache', type=str, default='./compiled_models', help='folder to cache compiled graphs in')
+parser.add_argument('--backend', dest='backend', type=str, default='torch', choices=['torch', 'onnx'], help='run inference with torch or onnx runtime')
+parser.add_argument('--channels_last', dest='channels_last', action='store_true', help='run networks in channels_last memory format, faster on CPU')
+parser.add_argument('--quality', dest='quality', type=str, default='final', choices=['draft', 'normal', 'final'], help='speed / quality tier, draft skips the last flow block and refinement')
+parser.add_argument('--similarity_gate', dest='similarity_gate', type=float, default=0, help='pairs whose frames differ less than this skip the model, 0 - off')
+parser.add_argument('--gate_mode', dest='gate_mode', type=str, default='blend', choices=['blend', 'nearest'], help='similarity gate fast path: blend the two frames or copy the nearer one')
+parser.add_argument('--sparse', dest='sparse', action='store_true', help='run contextnet and fusionnet only on tiles with motion, blend static tiles')
+parser.add_argument('--adaptive_flow', dest='adaptive_flow', action='store_true', help='pick flow size per pair from its estimated motion: 1/4 for large motion, 1/2 for small')
 args = parser.parse_args()
 
-model = Model()
+if args.backend == 'onnx':
+    from model.RIFE_HD_onnx import Model
+else:
+    from model.RIFE_HD import Model
+model = Model(device=device)
 model.load_model('./train_log', -1)
 model.eval()
 model.device()
+if args.channels_last:
+    model.set_channels_last()
+model.set_precision(args.precision)
+model.set_quality(args.quality)
+if args.similarity_gate:
+    model.set_similarity_gate(args.similarity_gate, args.gate_mode)
+if args.sparse:
+    model.set_sparse_synthesis()
+if args.adaptive_flow:
+    model.set_adaptive_flow()
 
 if args.img[0].endswith('.exr') and args.img[1].endswith('.exr'):
     img0 = cv2.imread(args.img[0], cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)
@@ -38,12 +63,22 @@ else:
     img1 = (torch.tensor(img1.transpose(2, 0, 1)).to(device) / 255.).unsqueeze(0)
 
 n, c, h, w = img0.shape
-ph = ((h - 1) // 32 + 1) * 32
-pw = ((w - 1) // 32 + 1) * 32
+pad = 32
+if args.adaptive_flow:
+    # pairs can switch to 1/4 flow size
+    pad = max(64, flow_padding(True))
+ph = ((h - 1) // pad + 1) * pad
+pw = ((w - 1) // pad + 1) * pad
 padding = (0, pw - w, 0, ph - h)
 img0 = F.pad(img0, padding)
 img1 = F.pad(img1, padding)
 
+if model.precision != 'fp32':
+    psnr = model.check_precision(img0, img1, min_psnr=args.min_psnr)
+    print ('Inference precision: %s (%.2f dB PSNR against fp32)' % (model.precision, psnr))
+if args.compile or args.backend == 'onnx':
+    model.enable_compile(args.compile_cache)
+
 img_list = [img0, img1]
 for i in range(args.exp):
     tmp = []
@@ -54,6 +89,21 @@ for i in range(args.exp):
     tmp.append(img1)
     img_list = tmp
 
+if args.similarity_gate:
+    stats = model.gate_stats()
+    print ('Similarity gate: %s of %s pairs took the fast path (%s)' % (
+        stats['fast'], stats['fast'] + stats['model'], args.gate_mode))
+if args.sparse:
+    stats = model.sparse_stats()
+    tiles = stats['static'] + stats['moving']
+    print ('Sparse synthesis: %s of %s tiles static (%.1f%% skipped)' % (
+        stats['static'], tiles, 100.0 * stats['static'] / max(1, tiles)))
+if args.adaptive_flow:
+    stats = model.adaptive_flow_stats()
+    saved = 'time saved not measured' if stats['saved'] is None else 'estimated %.1f sec saved' % stats['saved']
+    print ('Adaptive flow: %s pairs at 1/4 flow size (mean motion %.1f px), %s at 1/2 (%.1f px), %s' % (
+        stats['coarse'], stats['coarse_motion'], stats['fine'], stats['fine_motion'], saved))
+
 if not os.path.exists('output'):
     os.mkdir('output')
 for i in range(len(img_list)):
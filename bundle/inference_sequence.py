@@ -11,6 +11,8 @@ import _thread
 import threading
 import skvideo.io
 from queue import Queue, Empty
+from model.RIFE_HD import FLOW_SCALES
+from model.driver import device_type, time_budget_workers, pad_size, load_model, configure_model, cpu_workers, print_stats
 warnings.filterwarnings("ignore")
 
 from pprint import pprint, pformat
@@ -86,14 +88,36 @@ def build_read_buffer(user_args, read_buffer, videogen):
         read_buffer.put(frame_data)
     read_buffer.put(None)
 
-def make_inference(model, I0, I1, exp, UHD):
-    middle = model.inference(I0, I1, UHD)
+def make_inference(model, I0, I1, exp, UHD, keys=None, warm_start=False):
+    # keys are optional frame numbers of I0 and I1 for the model feature cache,
+    # synthesized middle frames are not cached.
+    # warm_start - I0 and I1 follow the previous top level pair of the sequence
+    if warm_start:
+        middle = model.inference_warm(I0, I1, UHD, keys)
+    else:
+        middle = model.inference(I0, I1, UHD, keys)
     if exp == 1:
         return [middle]
-    first_half = make_inference(model, I0, middle, exp=exp - 1, UHD=UHD)
-    second_half = make_inference(model, middle, I1, exp=exp - 1, UHD=UHD)
+    first_keys = second_keys = None
+    if keys is not None:
+        first_keys = (keys[0], [None] * len(keys[0]))
+        second_keys = ([None] * len(keys[1]), keys[1])
+    first_half = make_inference(model, I0, middle, exp=exp - 1, UHD=UHD, keys=first_keys)
+    second_half = make_inference(model, middle, I1, exp=exp - 1, UHD=UHD, keys=second_keys)
     return [*first_half, middle, *second_half]
 
+def write_batch(output, lastframes, write_buffer, h, w):
+    # output is a list of batched middle frames as returned by make_inference
+    # for a batch of pairs starting with lastframes
+    for index, lastframe in enumerate(lastframes):
+        write_buffer.put(lastframe)
+        for mid in output:
+            if sys.platform == 'darwin':
+                mid = (((mid[index]).cpu().detach().numpy().transpose(1, 2, 0)))
+            else:
+                mid = (((mid[index]).cpu().numpy().transpose(1, 2, 0)))
+            write_buffer.put(mid[:h, :w])
+
 def find_middle_frame(frames, frames_taken):
     for start_frame in range(1, len(frames.keys()) + 1):
         for frame_number in range (start_frame, len(frames.keys()) + 1):
@@ -127,45 +151,57 @@ def find_middle_frame(frames, frames_taken):
     return False
 
 def three_of_a_perfect_pair(frames, device, padding, model, args, h, w, frames_written, frames_taken):
-    perfect_pair = find_middle_frame(frames, frames_taken)
+    # takes up to args.batch_size frames to interpolate
+    # and renders them in a single pass
+    perfect_pairs = []
+    for batch_index in range(args.batch_size):
+        perfect_pair = find_middle_frame(frames, frames_taken)
+        if not perfect_pair:
+            break
+        perfect_pairs.append(perfect_pair)
 
-    if not perfect_pair:
+    if not perfect_pairs:
         # print ('no more frames left')
         return False
 
-    start_frame = perfect_pair[0]
-    middle_frame = perfect_pair[1]
-    end_frame = perfect_pair[2]
-
-    frame0 = cv2.imread(frames[start_frame], cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
-    frame1 = cv2.imread(frames[end_frame], cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
+    frames0 = []
+    frames1 = []
+    batch_I0 = []
+    batch_I1 = []
+    for start_frame, middle_frame, end_frame in perfect_pairs:
+        frame0 = cv2.imread(frames[start_frame], cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
+        frame1 = cv2.imread(frames[end_frame], cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
     
-    I0 = torch.from_numpy(np.transpose(frame0, (2,0,1))).to(device, non_blocking=True).unsqueeze(0)
-    I1 = torch.from_numpy(np.transpose(frame1, (2,0,1))).to(device, non_blocking=True).unsqueeze(0)
+        I0 = torch.from_numpy(np.transpose(frame0, (2,0,1))).to(device, non_blocking=True).unsqueeze(0)
+        I1 = torch.from_numpy(np.transpose(frame1, (2,0,1))).to(device, non_blocking=True).unsqueeze(0)
 
-    I0 = F.pad(I0, padding)
-    I1 = F.pad(I1, padding)
+        frames0.append(frame0)
+        frames1.append(frame1)
+        batch_I0.append(F.pad(I0, padding))
+        batch_I1.append(F.pad(I1, padding))
 
-    diff = (F.interpolate(I0, (16, 16), mode='bilinear', align_corners=False)
-        - F.interpolate(I1, (16, 16), mode='bilinear', align_corners=False)).abs()
-    
-    mid = model.inference(I0, I1, args.UHD)
-    mid = (((mid[0]).cpu().detach().numpy().transpose(1, 2, 0)))
-    midframe = mid[:h, :w]
-    cv2.imwrite(os.path.join(os.path.abspath(args.output), '{:0>7d}.exr'.format(middle_frame)), midframe[:, :, ::-1], [cv2.IMWRITE_EXR_TYPE, cv2.IMWRITE_EXR_TYPE_HALF])
+    mids = model.inference_batch(batch_I0, batch_I1, args.UHD)
 
-    start_frame_out_file_name = os.path.join(os.path.abspath(args.output), '{:0>7d}.exr'.format(start_frame))
-    if not os.path.isfile(start_frame_out_file_name):
-        cv2.imwrite(start_frame_out_file_name, frame0[:, :, ::-1], [cv2.IMWRITE_EXR_TYPE, cv2.IMWRITE_EXR_TYPE_HALF])
-        frames_written[ start_frame ] = start_frame_out_file_name
+    for index, (start_frame, middle_frame, end_frame) in enumerate(perfect_pairs):
+        frame0 = frames0[index]
+        frame1 = frames1[index]
 
-    end_frame_out_file_name = os.path.join(os.path.abspath(args.output), '{:0>7d}.exr'.format(end_frame))
-    if not os.path.isfile(end_frame_out_file_name):
-        cv2.imwrite(end_frame_out_file_name, frame1[:, :, ::-1], [cv2.IMWRITE_EXR_TYPE, cv2.IMWRITE_EXR_TYPE_HALF])
-        frames_written[ end_frame ] = end_frame_out_file_name
+        mid = (((mids[index]).cpu().detach().numpy().transpose(1, 2, 0)))
+        midframe = mid[:h, :w]
+        cv2.imwrite(os.path.join(os.path.abspath(args.output), '{:0>7d}.exr'.format(middle_frame)), midframe[:, :, ::-1], [cv2.IMWRITE_EXR_TYPE, cv2.IMWRITE_EXR_TYPE_HALF])
 
-    frames[ middle_frame ] = os.path.join(os.path.abspath(args.output), '{:0>7d}.exr'.format(middle_frame))
-    frames_written[ middle_frame ] = os.path.join(os.path.abspath(args.output), '{:0>7d}.exr'.format(middle_frame))
+        start_frame_out_file_name = os.path.join(os.path.abspath(args.output), '{:0>7d}.exr'.format(start_frame))
+        if not os.path.isfile(start_frame_out_file_name):
+            cv2.imwrite(start_frame_out_file_name, frame0[:, :, ::-1], [cv2.IMWRITE_EXR_TYPE, cv2.IMWRITE_EXR_TYPE_HALF])
+            frames_written[ start_frame ] = start_frame_out_file_name
+
+        end_frame_out_file_name = os.path.join(os.path.abspath(args.output), '{:0>7d}.exr'.format(end_frame))
+        if not os.path.isfile(end_frame_out_file_name):
+            cv2.imwrite(end_frame_out_file_name, frame1[:, :, ::-1], [cv2.IMWRITE_EXR_TYPE, cv2.IMWRITE_EXR_TYPE_HALF])
+            frames_written[ end_frame ] = end_frame_out_file_name
+
+        frames[ middle_frame ] = os.path.join(os.path.abspath(args.output), '{:0>7d}.exr'.format(middle_frame))
+        frames_written[ middle_frame ] = os.path.join(os.path.abspath(args.output), '{:0>7d}.exr'.format(middle_frame))
 
     return True
 
@@ -192,11 +228,39 @@ if __name__ == '__main__':
     parser.add_argument('--output', dest='output', type=str, default=None)
     parser.add_argument('--model', dest='model', type=str, default='./trained_models/default/v1.8.model')
     parser.add_argument('--UHD', dest='UHD', action='store_true', help='flow size 1/4')
+    parser.add_argument('--flow_scale', dest='flow_scale', type=float, default=0, choices=(0, ) + FLOW_SCALES, help='flow size relative to the frame, 0.125 or 0.0625 for 6K / 8K, overrides --UHD')
     parser.add_argument('--exp', dest='exp', type=int, default=1)
     parser.add_argument('--cpu', dest='cpu', action='store_true', help='process only on CPU(s)')
+    parser.add_argument('--batch_size', dest='batch_size', type=int, default=1, help='number of frame pairs to process in one pass')
+    parser.add_argument('--memory_budget', dest='memory_budget', type=float, default=0, help='pick batch size to fit in given memory (Gb) per worker')
+    parser.add_argument('--precision', dest='precision', type=str, default='fp32', choices=['fp32', 'bf16', 'fp16'], help='inference precision')
+    parser.add_argument('--min_psnr', dest='min_psnr', type=float, default=40.0, help='fall back to fp32 if reduced precision PSNR is lower (dB)')
+    parser.add_argument('--compile', dest='compile', action='store_true', help='trace and freeze inference graph, compiled graphs are cached on disk')
+    parser.add_argument('--compile_cache', dest='compile_cache', type=str, default='./compiled_models', help='folder to cache compiled graphs in')
+    parser.add_argument('--backend', dest='backend', type=str, default='torch', choices=['torch', 'onnx'], help='run inference with torch or onnx runtime')
+    parser.add_argument('--channels_last', dest='channels_last', action='store_true', help='run networks in channels_last memory format, faster on CPU')
+    parser.add_argument('--quality', dest='quality', type=str, default='final', choices=['draft', 'normal', 'final'], help='speed / quality tier, draft skips the last flow block and refinement')
+    parser.add_argument('--similarity_gate', dest='similarity_gate', type=float, default=0, help='pairs whose frames differ less than this skip the model, 0 - off')
+    parser.add_argument('--gate_mode', dest='gate_mode', type=str, default='blend', choices=['blend', 'nearest'], help='similarity gate fast path: blend the two frames or copy the nearer one')
+    parser.add_argument('--sparse', dest='sparse', action='store_true', help='run contextnet and fusionnet only on tiles with motion, blend static tiles')
+    parser.add_argument('--adaptive_flow', dest='adaptive_flow', action='store_true', help='pick flow size per pair from its estimated motion: 1/4 for large motion, 1/2 for small')
+    parser.add_argument('--flow_cache', dest='flow_cache', type=str, default=None, help='folder to keep flownet results in, so the same frame pairs rendered again skip flownet (torch eager only)')
+    parser.add_argument('--flow_cache_size', dest='flow_cache_size', type=float, default=20, help='flow cache size limit (GB)')
+    parser.add_argument('--flow_cache_age', dest='flow_cache_age', type=float, default=14, help='flow cache entries unused for this many days are removed')
+    parser.add_argument('--roi', dest='roi', type=str, default=None, help='x,y,w,h region to interpolate in pixels from the top left corner, the rest of the frame is blended')
+    parser.add_argument('--time_budget', dest='time_budget', type=float, default=0, help='pick model, backend, precision and quality from profile_models.py profiles to finish in given minutes')
+    parser.add_argument('--tile_size', dest='tile_size', type=int, default=0, help='render frames larger than this in overlapping tiles (px), 0 - pick from memory budget')
+    parser.add_argument('--tile_overlap', dest='tile_overlap', type=int, default=64, help='tiles overlap (px)')
+    parser.add_argument('--warm_start', dest='warm_start', action='store_true', help='start flow estimation from the previous pair flow (GPU, batch size 1)')
+    parser.add_argument('--feature_cache', dest='feature_cache', action='store_true', help='reuse per frame contextnet features in neighbouring pairs (GPU, torch eager only)')
 
 
     args = parser.parse_args()
+    if args.flow_scale:
+        # UHD argument of the model carries the flow size
+        args.UHD = args.flow_scale
+    if args.roi:
+        args.roi = [int(v) for v in args.roi.split(',')]
     assert (not args.output is None or not args.input is None)
 
     manager = mp.Manager()
@@ -233,9 +297,17 @@ if __name__ == '__main__':
     first_image = cv2.imread(frames.get(first_frame_number), cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
     h, w, _ = first_image.shape
 
-    ph = ((h - 1) // 64 + 1) * 64
-    pw = ((w - 1) // 64 + 1) * 64
-    padding = (0, pw - w, 0, ph - h)
+    ph, pw, padding = pad_size(h, w, args.UHD)
+
+    if args.time_budget:
+        from model.registry import apply_time_budget
+        apply_time_budget(args, w, h, (input_duration - 1) * step, device_type(args), time_budget_workers(args, h, w))
+
+    ref_frames = None
+    if args.precision != 'fp32':
+        # reduced precision is checked against fp32 on the first pair of the clip
+        ref_image = cv2.imread(frames.get(first_frame_number + step + 1), cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
+        ref_frames = (first_image, ref_image)
 
     output_folder = os.path.abspath(args.output)
     if not os.path.exists(output_folder):
@@ -252,19 +324,18 @@ if __name__ == '__main__':
         _thread.start_new_thread(build_read_buffer, (args, read_buffer, files_list))
         _thread.start_new_thread(clear_write_buffer, (args, write_buffer, input_duration))
 
-        from model.RIFE_HD import Model     # type: ignore
-        model = Model()
-        model.load_model(args.model, -1)
-        model.eval()
-        model.device()
-        print ('Trained model loaded: %s' % args.model)
+        device = torch.device("cuda")
+        model = load_model(args, device)
+        configure_model(model, args, h, w, ref_frames)
+        if args.warm_start:
+            # warm start follows the sequence one pair at a time
+            args.batch_size = 1
+            model.set_warm_start()
 
-
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        if torch.cuda.is_available():
-            torch.set_grad_enabled(False)
-            torch.backends.cudnn.enabled = True
-            torch.backends.cudnn.benchmark = True
+        if args.feature_cache:
+            # a batch has batch_size + 1 distinct source frames,
+            # the last one is also the first frame of the next batch
+            model.enable_feature_cache(args.batch_size + 1)
 
         # print ('Loading initial frames...')
         lastframe = first_image
@@ -272,6 +343,14 @@ if __name__ == '__main__':
         I1 = F.pad(I1, padding)
         frame = read_buffer.get()
 
+        # pairs are collected in batches of args.batch_size
+        # and sent to the model in a single pass
+        batch_lastframes = []
+        batch_I0 = []
+        batch_I1 = []
+        batch_keys0 = []
+        batch_keys1 = []
+
         for nn in range(1, input_duration+1):
 
             frame = read_buffer.get()
@@ -282,51 +361,43 @@ if __name__ == '__main__':
             I1 = torch.from_numpy(np.transpose(frame, (2,0,1))).to(device, non_blocking=True).unsqueeze(0)
             I1 = F.pad(I1, padding)
 
-            output = make_inference(model, I0, I1, args.exp, args.UHD)
-            write_buffer.put(lastframe)
-            for mid in output:
-                if sys.platform == 'darwin':
-                    mid = (((mid[0]).cpu().detach().numpy().transpose(1, 2, 0)))
-                else:
-                    mid = (((mid[0]).cpu().numpy().transpose(1, 2, 0)))
-                write_buffer.put(mid[:h, :w])
+            batch_lastframes.append(lastframe)
+            batch_I0.append(I0)
+            batch_I1.append(I1)
+            batch_keys0.append(nn - 1)
+            batch_keys1.append(nn)
             lastframe = frame
-        
+
+            if len(batch_lastframes) < args.batch_size:
+                continue
+
+            write_batch(make_inference(model, torch.cat(batch_I0), torch.cat(batch_I1), args.exp, args.UHD, (batch_keys0, batch_keys1), args.warm_start), batch_lastframes, write_buffer, h, w)
+            batch_lastframes = []
+            batch_I0 = []
+            batch_I1 = []
+            batch_keys0 = []
+            batch_keys1 = []
+
+        if batch_lastframes:
+            write_batch(make_inference(model, torch.cat(batch_I0), torch.cat(batch_I1), args.exp, args.UHD, (batch_keys0, batch_keys1), args.warm_start), batch_lastframes, write_buffer, h, w)
+
         write_buffer.put(lastframe)
         while(not write_buffer.empty()):
             time.sleep(0.1)
 
+        if args.warm_start:
+            stats = model.warm_start_stats
+            print ('Flow warm start: %s of %s pairs, %s fallbacks, %s scene cuts' % (
+                stats['warm'], stats['warm'] + stats['cold'], stats['fallback'], stats['scene_cut']))
+
     else:
         # process on CPU(s)
 
-        from model_cpu.RIFE_HD import Model     # type: ignore
-        model = Model()
-        model.load_model(args.model, -1)
-        model.eval()
-        model.device()
-        print ('Trained model loaded: %s' % args.model)
-
-
         device = torch.device('cpu')
-        torch.set_grad_enabled(False)
-        
-        max_cpu_workers = mp.cpu_count() - 2
-        available_ram = psutil.virtual_memory()[1]/( 1024 ** 3 )
-        megapixels = ( h * w ) / ( 10 ** 6 )
-        thread_ram = megapixels * 2.4
-        sim_workers = round( available_ram / thread_ram )
-        if sim_workers < 1:
-            sim_workers = 1
-        elif sim_workers > max_cpu_workers:
-            sim_workers = max_cpu_workers
-
-        print ('---\nFree RAM: %s Gb available' % '{0:.1f}'.format(available_ram))
-        print ('Image size: %s x %s' % ( w, h,))
-        print ('Peak memory usage estimation: %s Gb per CPU thread ' % '{0:.1f}'.format(thread_ram))
-        print ('Using %s CPU worker thread%s (of %s available)\n---' % (sim_workers, '' if sim_workers == 1 else 's', mp.cpu_count()))
-        if thread_ram > available_ram:
-            print ('Warning: estimated peak memory usage is greater then RAM avaliable')
-        
+        model = load_model(args, device)
+        thread_ram = configure_model(model, args, h, w, ref_frames)
+        sim_workers, thread_ram = cpu_workers(model, args, h, w, thread_ram, 'Frame pairs')
+
         print ('rendering %s frames to %s/' % (last_frame_number, args.output))
 
         active_workers = []
@@ -372,6 +443,8 @@ if __name__ == '__main__':
         ThreadsFlag = False
         cpu_progress_updater.join()
     
+    print_stats(model, args)
+
     for p in IOProcesses:
         p.join(timeout=8)
 
@@ -9,6 +9,7 @@ import warnings
 import _thread
 import skvideo.io
 from queue import Queue, Empty
+from model.RIFE_HD import FLOW_SCALES, flow_padding
 warnings.filterwarnings("ignore")
 
 from pprint import pprint
@@ -64,21 +65,52 @@ parser.add_argument('--video', dest='video', type=str, default=None)
 parser.add_argument('--img', dest='img', type=str, default=None)
 parser.add_argument('--montage', dest='montage', action='store_true', help='montage origin video')
 parser.add_argument('--UHD', dest='UHD', action='store_true', help='support 4k video')
+parser.add_argument('--flow_scale', dest='flow_scale', type=float, default=0, choices=(0, ) + FLOW_SCALES, help='flow size relative to the frame, 0.125 or 0.0625 for 6K / 8K, overrides --UHD')
 parser.add_argument('--skip', dest='skip', action='store_true', help='whether to remove static frames before processing')
 parser.add_argument('--fps', dest='fps', type=int, default=None)
 parser.add_argument('--png', dest='png', action='store_true', help='whether to vid_out png format vid_outs')
 parser.add_argument('--ext', dest='ext', type=str, default='mp4', help='vid_out video extension')
 parser.add_argument('--exp', dest='exp', type=int, default=1)
+parser.add_argument('--precision', dest='precision', type=str, default='fp32', choices=['fp32', 'bf16', 'fp16'], help='inference precision')
+parser.add_argument('--min_psnr', dest='min_psnr', type=float, default=40.0, help='fall back to fp32 if reduced precision PSNR is lower (dB)')
+parser.add_argument('--compile', dest='compile', action='store_true', help='trace and freeze inference graph, compiled graphs are cached on disk')
+parser.add_argument('--compile_cache', dest='compile_cache', type=str, default='./compiled_models', help='folder to cache compiled graphs in')
+parser.add_argument('--backend', dest='backend', type=str, default='torch', choices=['torch', 'onnx'], help='run inference with torch or onnx runtime')
+parser.add_argument('--channels_last', dest='channels_last', action='store_true', help='run networks in channels_last memory format, faster on CPU')
+parser.add_argument('--quality', dest='quality', type=str, default='final', choices=['draft', 'normal', 'final'], help='speed / quality tier, draft skips the last flow block and refinement')
+parser.add_argument('--similarity_gate', dest='similarity_gate', type=float, default=0, help='pairs whose frames differ less than this skip the model, 0 - off')
+parser.add_argument('--gate_mode', dest='gate_mode', type=str, default='blend', choices=['blend', 'nearest'], help='similarity gate fast path: blend the two frames or copy the nearer one')
+parser.add_argument('--sparse', dest='sparse', action='store_true', help='run contextnet and fusionnet only on tiles with motion, blend static tiles')
+parser.add_argument('--adaptive_flow', dest='adaptive_flow', action='store_true', help='pick flow size per pair from its estimated motion: 1/4 for large motion, 1/2 for small')
+parser.add_argument('--warm_start', dest='warm_start', action='store_true', help='start flow estimation from the previous pair flow')
 args = parser.parse_args()
+if args.flow_scale:
+    # UHD argument of the model carries the flow size
+    args.UHD = args.flow_scale
 assert (not args.video is None or not args.img is None)
 if not args.img is None:
     args.png = True
 
-from model.RIFE_HD import Model
-model = Model()
+if args.backend == 'onnx':
+    from model.RIFE_HD_onnx import Model
+else:
+    from model.RIFE_HD import Model
+model = Model(device=device)
 model.load_model('./train_log', -1)
 model.eval()
 model.device()
+if args.channels_last:
+    model.set_channels_last()
+model.set_precision(args.precision)
+model.set_quality(args.quality)
+if args.similarity_gate:
+    model.set_similarity_gate(args.similarity_gate, args.gate_mode)
+if args.sparse:
+    model.set_sparse_synthesis()
+if args.adaptive_flow:
+    model.set_adaptive_flow()
+if args.warm_start:
+    model.set_warm_start()
 
 if not args.video is None:
     videoCapture = cv2.VideoCapture(args.video)
@@ -152,9 +184,13 @@ def build_read_buffer(user_args, read_buffer, videogen):
         read_buffer.put(frame)
     read_buffer.put(None)
 
-def make_inference(I0, I1, exp):
+def make_inference(I0, I1, exp, warm_start=False):
+    # warm_start - I0 and I1 follow the previous top level pair of the video
     global model
-    middle = model.inference(I0, I1, args.UHD)
+    if warm_start:
+        middle = model.inference_warm(I0, I1, args.UHD)
+    else:
+        middle = model.inference(I0, I1, args.UHD)
     if exp == 1:
         return [middle]
     first_half = make_inference(I0, middle, exp=exp - 1)
@@ -164,13 +200,15 @@ def make_inference(I0, I1, exp):
 if args.montage:
     left = w // 4
     w = w // 2
-if args.UHD:
-    ph = ((h - 1) // 64 + 1) * 64
-    pw = ((w - 1) // 64 + 1) * 64
-else:
-    ph = ((h - 1) // 32 + 1) * 32
-    pw = ((w - 1) // 32 + 1) * 32
+pad = flow_padding(args.UHD)
+if args.adaptive_flow:
+    # pairs can switch to 1/4 flow size
+    pad = max(64, flow_padding(True))
+ph = ((h - 1) // pad + 1) * pad
+pw = ((w - 1) // pad + 1) * pad
 padding = (0, pw - w, 0, ph - h)
+if args.compile or args.backend == 'onnx':
+    model.enable_compile(args.compile_cache)
 pbar = tqdm(total=tot_frame)
 skip_frame = 1
 if args.montage:
@@ -197,6 +235,10 @@ while True:
     else:
         I1 = torch.from_numpy(np.transpose(frame, (2,0,1))).to(device, non_blocking=True).unsqueeze(0).float() / 255.
     I1 = F.pad(I1, padding)
+    if pbar.n == 0 and model.precision != 'fp32':
+        # check reduced precision against fp32 on the first pair of the video
+        psnr = model.check_precision(I0, I1, args.UHD, args.min_psnr)
+        print ('Inference precision: %s (%.2f dB PSNR against fp32 on first pair)' % (model.precision, psnr))
 
     diff = (F.interpolate(I0, (16, 16), mode='bilinear', align_corners=False)
          - F.interpolate(I1, (16, 16), mode='bilinear', align_corners=False)).abs()
@@ -209,11 +251,12 @@ while True:
         continue
 
     if diff.mean() > 0.2:
+        model.reset_warm_start()
         output = []
         for i in range((2 ** args.exp) - 1):
             output.append(I0)
     else:
-        output = make_inference(I0, I1, args.exp)
+        output = make_inference(I0, I1, args.exp, args.warm_start)
         
     if args.montage:
         write_buffer.put(np.concatenate((lastframe, lastframe), 1))
@@ -235,6 +278,24 @@ import time
 while(not write_buffer.empty()):
     time.sleep(0.1)
 pbar.close()
+if args.warm_start:
+    stats = model.warm_start_stats
+    print ('Flow warm start: %s of %s pairs, %s fallbacks, %s scene cuts' % (
+        stats['warm'], stats['warm'] + stats['cold'], stats['fallback'], stats['scene_cut']))
+if args.similarity_gate:
+    stats = model.gate_stats()
+    print ('Similarity gate: %s of %s pairs took the fast path (%s)' % (
+        stats['fast'], stats['fast'] + stats['model'], args.gate_mode))
+if args.sparse:
+    stats = model.sparse_stats()
+    tiles = stats['static'] + stats['moving']
+    print ('Sparse synthesis: %s of %s tiles static (%.1f%% skipped)' % (
+        stats['static'], tiles, 100.0 * stats['static'] / max(1, tiles)))
+if args.adaptive_flow:
+    stats = model.adaptive_flow_stats()
+    saved = 'time saved not measured' if stats['saved'] is None else 'estimated %.1f sec saved' % stats['saved']
+    print ('Adaptive flow: %s pairs at 1/4 flow size (mean motion %.1f px), %s at 1/2 (%.1f px), %s' % (
+        stats['coarse'], stats['coarse_motion'], stats['fine'], stats['fine_motion'], saved))
 if not vid_out is None:
     vid_out.release()
 
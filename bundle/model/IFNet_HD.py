@@ -2,10 +2,32 @@ import torch
 import numpy as np
 import torch.nn as nn
 import torch.nn.functional as F
-from model.warplayer import warp
+from model.warplayer import warp, warp_pair
 
+# flow sizes relative to the frame the networks support
+FLOW_SCALES = (0.5, 0.25, 0.125, 0.0625)
+
+
+def flow_resolution(UHD):
+    # UHD argument as flow size relative to the frame:
+    # False - 1/2, True - 1/4, a number - the flow size itself, see FLOW_SCALES
+    if UHD is True:
+        return 0.25
+    if not UHD:
+        return 0.5
+    return float(UHD)
+
+
+def flow_padding(UHD):
+    # frames are padded to a multiple of this, so block0 at 1/8 of the flow size
+    # and its stride 2 convolution divide evenly
+    return int(round(16 / flow_resolution(UHD)))
+
+
+def resize_flow(flow, factor):
+    # flow resampled by factor with its vectors scaled to match
+    return F.interpolate(flow, scale_factor=factor, mode="bilinear", align_corners=False) * factor
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 def conv_wo_act(in_planes, out_planes, kernel_size=3, stride=1, padding=1, dilation=1):
     return nn.Sequential(
@@ -51,16 +73,13 @@ class ResBlock(nn.Module):
 
 
 class IFBlock(nn.Module):
-    def __init__(self, in_planes, scale=1, c=64):
+    def __init__(self, in_planes, scale=1, c=64, depth=6):
         super(IFBlock, self).__init__()
         self.scale = scale
+        self.depth = depth
         self.conv0 = conv(in_planes, c, 5, 2, 2)
-        self.res0 = ResBlock(c, c)
-        self.res1 = ResBlock(c, c)
-        self.res2 = ResBlock(c, c)
-        self.res3 = ResBlock(c, c)
-        self.res4 = ResBlock(c, c)
-        self.res5 = ResBlock(c, c)
+        for i in range(depth):
+            setattr(self, 'res%d' % i, ResBlock(c, c))
         self.conv1 = nn.Conv2d(c, 8, 3, 1, 1)
         self.up = nn.PixelShuffle(2)
 
@@ -69,12 +88,8 @@ class IFBlock(nn.Module):
             x = F.interpolate(x, scale_factor=1. / self.scale, mode="bilinear",
                               align_corners=False)
         x = self.conv0(x)
-        x = self.res0(x)
-        x = self.res1(x)
-        x = self.res2(x)
-        x = self.res3(x)
-        x = self.res4(x)
-        x = self.res5(x)
+        for i in range(self.depth):
+            x = getattr(self, 'res%d' % i)(x)
         x = self.conv1(x)
         flow = self.up(x)
         if self.scale != 1:
@@ -84,36 +99,69 @@ class IFBlock(nn.Module):
 
 
 class IFNet(nn.Module):
-    def __init__(self):
+    def __init__(self, channels=(192, 128, 96, 48), depth=6):
+        # channels of the four blocks and number of ResBlocks in each,
+        # smaller values give distilled student flownets
         super(IFNet, self).__init__()
-        self.block0 = IFBlock(6, scale=8, c=192)
-        self.block1 = IFBlock(8, scale=4, c=128)
-        self.block2 = IFBlock(8, scale=2, c=96)
-        self.block3 = IFBlock(8, scale=1, c=48)
-
-    def forward(self, x, UHD=False):
-        if UHD:
-            x = F.interpolate(x, scale_factor=0.25, mode="bilinear", align_corners=False)
+        self.block0 = IFBlock(6, scale=8, c=channels[0], depth=depth)
+        self.block1 = IFBlock(8, scale=4, c=channels[1], depth=depth)
+        self.block2 = IFBlock(8, scale=2, c=channels[2], depth=depth)
+        self.block3 = IFBlock(8, scale=1, c=channels[3], depth=depth)
+        # number of blocks to run and mean flow update (px) below which
+        # the cascade stops early for a pair, see RIFE_HD quality tiers
+        self.levels = 4
+        self.exit_threshold = 0
+
+    def step(self, block, x_pair, flow):
+        # flow update of block for img0 and img1 warped by flow
+        warped_img0, warped_img1 = warp_pair(x_pair, flow)
+        return block(torch.cat((warped_img0, warped_img1, flow), 1))
+
+    def refine(self, block, x_pair, flow, update):
+        # flow update of block for pairs that have not converged yet.
+        # A pair has converged when its last update is below exit_threshold (mean px),
+        # it gets no further update, so a pair exits the same way in any batch.
+        # Traced graphs have no data dependent exit and refine every pair
+        if not self.exit_threshold or torch.jit.is_tracing():
+            return self.step(block, x_pair, flow)
+        active = update.abs().mean((1, 2, 3)) >= self.exit_threshold
+        if active.all():
+            return self.step(block, x_pair, flow)
+        delta = torch.zeros_like(flow)
+        if active.any():
+            index = torch.nonzero(active).flatten()
+            pair_index = torch.cat((index, index + flow.shape[0]))
+            delta[index] = self.step(block, x_pair[pair_index], flow[index])
+        return delta
+
+    def forward(self, x, UHD=False, flow_init=None):
+        # flow is estimated at flow_resolution(UHD) of the frame.
+        # flow_init is an optional coarse flow used instead of block0,
+        # e.g. the flow of the previous pair of a sequence
+        x = F.interpolate(x, scale_factor=flow_resolution(UHD), mode="bilinear",
+                          align_corners=False)
+        # img0 and img1 are stacked along the batch axis once
+        # and warped in a single call at every stage
+        x_pair = torch.cat((x[:, :3], x[:, 3:]), 0)
+        if flow_init is None:
+            flow0 = self.block0(x)
         else:
-            x = F.interpolate(x, scale_factor=0.5, mode="bilinear",
-                              align_corners=False)
-        flow0 = self.block0(x)
+            flow0 = flow_init
         F1 = flow0
-        warped_img0 = warp(x[:, :3], F1)
-        warped_img1 = warp(x[:, 3:], -F1)
-        flow1 = self.block1(torch.cat((warped_img0, warped_img1, F1), 1))
+        flow1 = self.step(self.block1, x_pair, F1)
         F2 = (flow0 + flow1)
-        warped_img0 = warp(x[:, :3], F2)
-        warped_img1 = warp(x[:, 3:], -F2)
-        flow2 = self.block2(torch.cat((warped_img0, warped_img1, F2), 1))
+        if self.levels < 3:
+            return F2, [F1, F2, F2, F2]
+        flow2 = self.refine(self.block2, x_pair, F2, flow1)
         F3 = (flow0 + flow1 + flow2)
-        warped_img0 = warp(x[:, :3], F3)
-        warped_img1 = warp(x[:, 3:], -F3)
-        flow3 = self.block3(torch.cat((warped_img0, warped_img1, F3), 1))
+        if self.levels < 4:
+            return F3, [F1, F2, F3, F3]
+        flow3 = self.refine(self.block3, x_pair, F3, flow2)
         F4 = (flow0 + flow1 + flow2 + flow3)
         return F4, [F1, F2, F3, F4]
 
 if __name__ == '__main__':
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     img0 = torch.zeros(3, 3, 256, 256).float().to(device)
     img1 = torch.tensor(np.random.normal(
         0, 1, (3, 3, 256, 256))).float().to(device)
@@ -10,8 +10,6 @@ from model.IFNet import *
 import torch.nn.functional as F
 from model.loss import *
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
 
 def conv(in_planes, out_planes, kernel_size=3, stride=1, padding=1, dilation=1):
     return nn.Sequential(
@@ -121,11 +119,15 @@ class FusionNet(nn.Module):
 
 
 class Model:
-    def __init__(self, local_rank=-1):
+    def __init__(self, local_rank=-1, device=None):
+        # device is picked here rather than at import time,
+        # so CPU only processes never probe CUDA
+        if device is None:
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.torch_device = torch.device(device)
         self.flownet = IFNet()
         self.contextnet = ContextNet()
         self.fusionnet = FusionNet()
-        self.device()
         self.optimG = AdamW(itertools.chain(
             self.flownet.parameters(),
             self.contextnet.parameters(),
@@ -135,6 +137,7 @@ class Model:
         self.epe = EPE()
         self.ter = Ternary()
         self.sobel = SOBEL()
+        self.device()
         if local_rank != -1:
             self.flownet = DDP(self.flownet, device_ids=[
                                local_rank], output_device=local_rank)
@@ -154,9 +157,11 @@ class Model:
         self.fusionnet.eval()
 
     def device(self):
-        self.flownet.to(device)
-        self.contextnet.to(device)
-        self.fusionnet.to(device)
+        self.flownet.to(self.torch_device)
+        self.contextnet.to(self.torch_device)
+        self.fusionnet.to(self.torch_device)
+        self.ter.to(self.torch_device)
+        self.sobel.to(self.torch_device)
 
     def load_model(self, path, rank):
         def convert(param):
@@ -170,11 +175,11 @@ class Model:
                 return param
         if rank <= 0:
             self.flownet.load_state_dict(
-                convert(torch.load('{}/flownet.pkl'.format(path), map_location=device)))
+                convert(torch.load('{}/flownet.pkl'.format(path), map_location=self.torch_device)))
             self.contextnet.load_state_dict(
-                convert(torch.load('{}/contextnet.pkl'.format(path), map_location=device)))
+                convert(torch.load('{}/contextnet.pkl'.format(path), map_location=self.torch_device)))
             self.fusionnet.load_state_dict(
-                convert(torch.load('{}/unet.pkl'.format(path), map_location=device)))
+                convert(torch.load('{}/unet.pkl'.format(path), map_location=self.torch_device)))
 
     def save_model(self, path, rank):
         if rank == 0:
@@ -245,6 +250,7 @@ class Model:
 
 
 if __name__ == '__main__':
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     img0 = torch.zeros(3, 3, 256, 256).float().to(device)
     img1 = torch.tensor(np.random.normal(
         0, 1, (3, 3, 256, 256))).float().to(device)
@@ -1,17 +1,27 @@
+import io
+import os
+import math
+import time
+import zlib
+import hashlib
+import warnings
+import json
+import contextlib
+import multiprocessing
+from collections import OrderedDict
 import torch
 import torch.nn as nn
 import numpy as np
 from torch.optim import AdamW
 import torch.optim as optim
 import itertools
-from model.warplayer import warp
+from model.warplayer import warp, warp_pair
+from model.weights import flat_weights_path, load_flat, load_state_dict
 from torch.nn.parallel import DistributedDataParallel as DDP
 from model.IFNet_HD import *
 import torch.nn.functional as F
 from model.loss import *
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
 
 def conv(in_planes, out_planes, kernel_size=3, stride=1, padding=1, dilation=1):
     return nn.Sequential(
@@ -61,6 +71,56 @@ class ResBlock(nn.Module):
 
 c = 32
 
+# speed / quality tiers: number of IFNet blocks, mean flow update (px)
+# that stops the IFNet cascade early and whether FusionNet refines the result
+QUALITY_TIERS = {
+    'draft': {'levels': 3, 'exit_threshold': 0.2, 'fusion': False},
+    'normal': {'levels': 4, 'exit_threshold': 0.05, 'fusion': True},
+    'final': {'levels': 4, 'exit_threshold': 0, 'fusion': True},
+}
+
+
+def take(x, index):
+    # items of a per pair argument listed in index: tensors and lists are
+    # indexed, tuples of lists (feature cache keys) per item, scalars are kept
+    if isinstance(x, torch.Tensor):
+        return x[index]
+    if isinstance(x, list):
+        return [x[i] for i in index.tolist()]
+    if isinstance(x, tuple):
+        return tuple(take(k, index) for k in x)
+    return x
+
+
+def roi_region(roi, h, w, margin=64, align=64):
+    # region of a padded h x w frame that goes through the model for roi (x, y, w, h):
+    # roi extended by margin and aligned to align px, as (y0, y1, x0, x1)
+    x, y, roi_w, roi_h = roi
+    y0 = max(0, ((y - margin) // align) * align)
+    x0 = max(0, ((x - margin) // align) * align)
+    y1 = min(h, ((y + roi_h + margin + align - 1) // align) * align)
+    x1 = min(w, ((x + roi_w + margin + align - 1) // align) * align)
+    return y0, y1, x0, x1
+
+
+def flow_name(UHD):
+    # flow size in compiled graph names, 1/2 and 1/4 keep their original names
+    scale = flow_resolution(UHD)
+    return {0.5: 'hd', 0.25: 'uhd'}.get(scale, 'flow%d' % round(1 / scale))
+
+
+def flow_pyramid(flow, levels=4, scale=0.5):
+    # flow at 1/4, 1/8, 1/16 and 1/32 of the frame for ContextNet feature levels
+    # from flow at scale of the frame, built once per pair
+    if scale != 0.5:
+        flow = resize_flow(flow, 0.5 / scale)
+    pyramid = []
+    for _ in range(levels):
+        flow = F.interpolate(flow, scale_factor=0.5, mode="bilinear", align_corners=False) * 0.5
+        pyramid.append(flow)
+    return pyramid
+
+
 class ContextNet(nn.Module):
     def __init__(self):
         super(ContextNet, self).__init__()
@@ -70,25 +130,24 @@ class ContextNet(nn.Module):
         self.conv3 = ResBlock(2*c, 4*c)
         self.conv4 = ResBlock(4*c, 8*c)
 
-    def forward(self, x, flow):
+    def features(self, x):
+        # flow independent part, each frame's features depend on that frame only
         x = self.conv0(x)
-        x = self.conv1(x)
-        flow = F.interpolate(flow, scale_factor=0.5, mode="bilinear", align_corners=False) * 0.5
-        f1 = warp(x, flow)
-        x = self.conv2(x)
-        flow = F.interpolate(flow, scale_factor=0.5, mode="bilinear",
-                             align_corners=False) * 0.5
-        f2 = warp(x, flow)
-        x = self.conv3(x)
-        flow = F.interpolate(flow, scale_factor=0.5, mode="bilinear",
-                             align_corners=False) * 0.5
-        f3 = warp(x, flow)
-        x = self.conv4(x)
-        flow = F.interpolate(flow, scale_factor=0.5, mode="bilinear",
-                             align_corners=False) * 0.5
-        f4 = warp(x, flow)
+        f1 = self.conv1(x)
+        f2 = self.conv2(f1)
+        f3 = self.conv3(f2)
+        f4 = self.conv4(f3)
         return [f1, f2, f3, f4]
 
+    def warp_features(self, features, flow):
+        return [warp(f, flow[i]) for i, f in enumerate(features)]
+
+    def forward(self, x, flow, flow_scale=0.5):
+        # flow is either a flow tensor at flow_scale of the frame or its flow_pyramid()
+        if not isinstance(flow, (list, tuple)):
+            flow = flow_pyramid(flow, scale=flow_scale)
+        return self.warp_features(self.features(x), flow)
+
 
 class FusionNet(nn.Module):
     def __init__(self):
@@ -105,9 +164,11 @@ class FusionNet(nn.Module):
         self.conv = nn.Conv2d(c, 16, 3, 1, 1)
         self.up4 = nn.PixelShuffle(2)
 
-    def forward(self, img0, img1, flow, c0, c1, flow_gt):
-        warped_img0 = warp(img0, flow)
-        warped_img1 = warp(img1, -flow)
+    def forward(self, img0, img1, flow, c0, c1, flow_gt, flow1=None, img_pair=None):
+        # img_pair is img0 and img1 stacked along the batch axis if the caller has it already
+        if img_pair is None:
+            img_pair = torch.cat((img0, img1), 0)
+        warped_img0, warped_img1 = warp_pair(img_pair, flow, flow1)
         if flow_gt == None:
             warped_img0_gt, warped_img1_gt = None, None
         else:
@@ -126,21 +187,55 @@ class FusionNet(nn.Module):
         return x, warped_img0, warped_img1, warped_img0_gt, warped_img1_gt
 
 
+class InferenceGraph(nn.Module):
+    # flownet + contextnet + fusionnet inference path as a single module
+    # so it can be traced and frozen for a given padded frame size
+    def __init__(self, model, UHD=False):
+        super(InferenceGraph, self).__init__()
+        self.flownet = model.flownet
+        self.contextnet = model.contextnet
+        self.fusionnet = model.fusionnet
+        self.predict = model.predict
+        self.UHD = UHD
+
+    def forward(self, img0, img1):
+        imgs = torch.cat((img0, img1), 1)
+        flow, _ = self.flownet(imgs, self.UHD)
+        return self.predict(imgs, flow, training=False, UHD=self.UHD)
+
+
 class Model:
-    def __init__(self, local_rank=-1):
+    def __init__(self, local_rank=-1, device=None):
+        # device is picked here rather than at import time,
+        # so CPU only processes never probe CUDA
+        if device is None:
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.torch_device = torch.device(device)
         self.flownet = IFNet()
         self.contextnet = ContextNet()
         self.fusionnet = FusionNet()
-        self.device()
-        self.optimG = AdamW(itertools.chain(
-            self.flownet.parameters(),
-            self.contextnet.parameters(),
-            self.fusionnet.parameters()), lr=1e-6, weight_decay=1e-5)
-        self.schedulerG = optim.lr_scheduler.CyclicLR(
-            self.optimG, base_lr=1e-6, max_lr=1e-3, step_size_up=8000, cycle_momentum=False)
+        self.init_optimizer()
         self.epe = EPE()
         self.ter = Ternary()
         self.sobel = SOBEL()
+        self.device()
+        self.precision = 'fp32'
+        self.compile_cache = None
+        self.compiled = {}
+        self.tile_size = 0
+        self.tile_overlap = 64
+        self.quantized = False
+        self.memory_format = torch.contiguous_format
+        self.model_checksum = None
+        self.feature_cache = None
+        self.feature_cache_size = 0
+        self.set_quality('final')
+        self.set_warm_start(False)
+        self.set_similarity_gate(0)
+        self.set_sparse_synthesis(False)
+        self.set_roi(None)
+        self.set_adaptive_flow(False)
+        self.set_flow_cache(None)
         if local_rank != -1:
             self.flownet = DDP(self.flownet, device_ids=[
                                local_rank], output_device=local_rank)
@@ -149,6 +244,14 @@ class Model:
             self.fusionnet = DDP(self.fusionnet, device_ids=[
                                  local_rank], output_device=local_rank)
 
+    def init_optimizer(self):
+        self.optimG = AdamW(itertools.chain(
+            self.flownet.parameters(),
+            self.contextnet.parameters(),
+            self.fusionnet.parameters()), lr=1e-6, weight_decay=1e-5)
+        self.schedulerG = optim.lr_scheduler.CyclicLR(
+            self.optimG, base_lr=1e-6, max_lr=1e-3, step_size_up=8000, cycle_momentum=False)
+
     def train(self):
         self.flownet.train()
         self.contextnet.train()
@@ -160,27 +263,562 @@ class Model:
         self.fusionnet.eval()
 
     def device(self):
-        self.flownet.to(device)
-        self.contextnet.to(device)
-        self.fusionnet.to(device)
+        self.flownet.to(self.torch_device)
+        self.contextnet.to(self.torch_device)
+        self.fusionnet.to(self.torch_device)
+        self.ter.to(self.torch_device)
+        self.sobel.to(self.torch_device)
+
+    def set_precision(self, precision):
+        # precision to run inference with: 'fp32', 'bf16' or 'fp16'
+        # reduced precision is applied with autocast, weights stay in fp32
+        device_type = self.torch_device.type
+        if self.quantized and precision != 'fp32':
+            print ('int8 quantized model runs without autocast, %s is ignored' % precision)
+            precision = 'fp32'
+        if precision == 'fp16' and device_type == 'cpu':
+            print ('fp16 inference is not supported on CPU, using bf16 instead')
+            precision = 'bf16'
+        if precision == 'bf16' and device_type == 'cuda' and not torch.cuda.is_bf16_supported():
+            print ('bf16 inference is not supported by this GPU, using fp16 instead')
+            precision = 'fp16'
+        self.precision = precision
+
+    def autocast(self):
+        if self.precision == 'fp32':
+            return contextlib.nullcontext()
+        device_type = self.torch_device.type
+        dtype = torch.bfloat16 if self.precision == 'bf16' else torch.float16
+        return torch.autocast(device_type=device_type, dtype=dtype)
+
+    def check_precision(self, img0, img1, UHD=False, min_psnr=40.0):
+        # compares reduced precision result with fp32 on a reference pair
+        # and falls back to fp32 if PSNR is below min_psnr. Returns PSNR in dB
+        if self.precision == 'fp32':
+            return float('inf')
+        precision = self.precision
+        self.precision = 'fp32'
+        reference = self.inference_full(img0, img1, UHD)
+        self.precision = precision
+        result = self.inference_full(img0, img1, UHD)
+        mse = torch.mean((reference - result) ** 2).item()
+        psnr = float('inf') if mse == 0 else -10 * math.log10(mse)
+        if psnr < min_psnr:
+            print ('Warning: %s PSNR against fp32 is %.2f dB (minimum %.2f dB), falling back to fp32' % (precision, psnr, min_psnr))
+            self.precision = 'fp32'
+        return psnr
+
+    def set_channels_last(self, enabled=True):
+        # networks and their inputs use channels_last (NHWC) memory format,
+        # so oneDNN convolutions on CPU run without reordering to and from NCHW
+        self.memory_format = torch.channels_last if enabled else torch.contiguous_format
+        for net in (self.flownet, self.contextnet, self.fusionnet):
+            net.to(memory_format=self.memory_format)
+        self.compiled = {}
+
+    def to_memory_format(self, img):
+        if self.memory_format == torch.contiguous_format:
+            return img
+        return img.contiguous(memory_format=self.memory_format)
+
+    def set_quality(self, quality):
+        # picks one of QUALITY_TIERS
+        tier = QUALITY_TIERS[quality]
+        self.quality = quality
+        self.fusion = tier['fusion']
+        self.flownet.levels = tier['levels']
+        self.flownet.exit_threshold = tier['exit_threshold']
+
+    def graph_quality(self):
+        # quality tier compiled and exported graphs actually run.
+        # Early exit is decided per pair at run time and is not part of a traced graph,
+        # so a tier that differs from another only by its exit is keyed as that one
+        tier = dict(QUALITY_TIERS[self.quality], exit_threshold=0)
+        for name, other in QUALITY_TIERS.items():
+            if other == tier:
+                return name
+        return self.quality
+
+    def set_tiling(self, tile_size, tile_overlap=64):
+        # frames larger than tile_size are rendered in overlapping tiles, 0 - off.
+        # Sizes are rounded to 64 to keep tiles aligned with network downsampling
+        self.tile_size = max(128, (int(tile_size) // 64) * 64) if tile_size else 0
+        self.tile_overlap = max(64, ((int(tile_overlap) + 63) // 64) * 64)
+
+    def set_sparse_synthesis(self, enabled=True, tile_size=256, flow_threshold=0.25, diff_threshold=0.01):
+        # frames are rendered in tiles and only tiles with motion run contextnet and fusionnet.
+        # A tile is static when its flow stays below flow_threshold (px) and its
+        # 1/8 resolution frame difference below diff_threshold, including the overlap.
+        # Static tiles get a linear blend of the source frames.
+        # Tile counts are shared with forked CPU worker processes
+        self.sparse = enabled
+        self.sparse_tile_size = max(128, (int(tile_size) // 64) * 64)
+        self.sparse_flow_threshold = flow_threshold
+        self.sparse_diff_threshold = diff_threshold
+        self.sparse_counts = multiprocessing.Array('q', 2) if enabled else None
+
+    def sparse_stats(self):
+        if self.sparse_counts is None:
+            return {'static': 0, 'moving': 0}
+        return {'static': self.sparse_counts[0], 'moving': self.sparse_counts[1]}
+
+    def use_tiles(self, img):
+        return self.sparse or (self.tile_size and max(img.shape[2], img.shape[3]) > self.tile_size)
+
+    def checksum(self):
+        # md5 of network weights, used to key cached compiled graphs
+        if self.model_checksum is None:
+            md5 = hashlib.md5()
+            for net in (self.flownet, self.contextnet, self.fusionnet):
+                for k, v in net.state_dict().items():
+                    md5.update(k.encode())
+                    if not isinstance(v, torch.Tensor):
+                        md5.update(str(v).encode())
+                        continue
+                    if v.is_quantized:
+                        v = v.int_repr()
+                    md5.update(v.detach().cpu().contiguous().numpy().tobytes())
+            self.model_checksum = md5.hexdigest()
+        return self.model_checksum
+
+    def enable_feature_cache(self, size):
+        # keeps contextnet features of the last `size` frames passed with keys,
+        # so a frame shared by neighbouring pairs goes through contextnet once.
+        # Only the eager path uses it, 0 - disabled
+        self.feature_cache = OrderedDict() if size else None
+        self.feature_cache_size = size
+
+    def cached_features(self, imgs, keys):
+        # contextnet features of a batch of frames, frames with the same key
+        # are computed once and reused from the feature cache. None key - not cached
+        keys = [None if k is None else (k, tuple(imgs.shape[1:]), self.precision) for k in keys]
+        known = {}
+        compute = []
+        for i, k in enumerate(keys):
+            if k is None:
+                compute.append(i)
+            elif k in self.feature_cache:
+                self.feature_cache.move_to_end(k)
+                known[k] = self.feature_cache[k]
+            elif k not in known:
+                known[k] = None
+                compute.append(i)
+        rows = {}
+        if compute:
+            computed = self.contextnet.features(imgs[compute])
+            for row, i in enumerate(compute):
+                rows[i] = [f[row:row + 1] for f in computed]
+                if keys[i] is not None:
+                    # cached entries are copied so they do not keep the whole batch alive
+                    known[keys[i]] = self.feature_cache[keys[i]] = [f.clone() for f in rows[i]]
+        while len(self.feature_cache) > self.feature_cache_size:
+            self.feature_cache.popitem(last=False)
+        frames = [rows[i] if i in rows else known[k] for i, k in enumerate(keys)]
+        return [torch.cat(level, 0) for level in zip(*frames)]
+
+    def set_warm_start(self, enabled=True, interval=8, tolerance=1.25):
+        # inference_warm() seeds flownet with the flow of the previous pair
+        # for up to `interval` pairs in a row, as long as the warm started flow
+        # matches the frames within `tolerance` of the last full flownet pass
+        self.warm_start = enabled
+        self.warm_start_interval = interval
+        self.warm_start_tolerance = tolerance
+        self.warm_start_stats = {'warm': 0, 'cold': 0, 'fallback': 0, 'scene_cut': 0}
+        self.reset_warm_start()
+
+    def set_similarity_gate(self, threshold=2e-3, mode='blend'):
+        # pairs whose 1/8 resolution frames differ by less than threshold everywhere
+        # skip the networks: 'blend' mixes the two frames at the timestep,
+        # 'nearest' copies the nearer frame. 0 - off.
+        # Pair counts are shared with forked CPU worker processes
+        self.gate_threshold = threshold
+        self.gate_mode = mode
+        self.gate_counts = multiprocessing.Array('q', 2) if threshold else None
+
+    def gate_stats(self):
+        if self.gate_counts is None:
+            return {'fast': 0, 'model': 0}
+        return {'fast': self.gate_counts[0], 'model': self.gate_counts[1]}
+
+    def similar_pairs(self, img0, img1):
+        thumb0 = F.interpolate(img0.float(), scale_factor=0.125, mode='area')
+        thumb1 = F.interpolate(img1.float(), scale_factor=0.125, mode='area')
+        return (thumb0 - thumb1).abs().flatten(1).max(1)[0] < self.gate_threshold
+
+    def fast_path(self, img0, img1, timestep=0.5, mode='blend'):
+        if not isinstance(timestep, (int, float)):
+            timestep = torch.tensor(timestep, device=img0.device, dtype=torch.float32).view(-1, 1, 1, 1)
+        img0 = img0.float()
+        img1 = img1.float()
+        if mode == 'nearest':
+            return torch.where(torch.as_tensor(timestep, device=img0.device) <= 0.5, img0, img1)
+        return img0 * (1 - timestep) + img1 * timestep
+
+    def gated(self, infer, img0, img1, **kwargs):
+        # runs infer(img0, img1, **kwargs) on the pairs of a batch that fail the similarity gate,
+        # the other pairs get the fast path. kwargs are per pair as in take()
+        timestep = kwargs.get('timestep', 0.5)
+        if not self.gate_threshold:
+            return self.in_roi(infer, img0, img1, **kwargs)
+        similar = self.similar_pairs(img0, img1)
+        fast = int(similar.sum().item())
+        with self.gate_counts.get_lock():
+            self.gate_counts[0] += fast
+            self.gate_counts[1] += img0.shape[0] - fast
+        if not fast:
+            return self.in_roi(infer, img0, img1, **kwargs)
+        output = self.fast_path(img0, img1, timestep, self.gate_mode)
+        if fast < img0.shape[0]:
+            index = (~similar).nonzero().flatten()
+            output[index] = self.in_roi(
+                infer, img0[index], img1[index], **{k: take(v, index) for k, v in kwargs.items()})
+        return output
+
+    def set_roi(self, roi, margin=64):
+        # only roi (x, y, w, h in frame pixels from the top left corner) extended by margin
+        # goes through the model, the result is composited over a linear blend
+        # of the source frames with a feathered edge inside the margin. None - full frame
+        self.roi = tuple(roi) if roi else None
+        self.roi_margin = margin
+
+    def in_roi(self, infer, img0, img1, **kwargs):
+        # runs infer(img0, img1, **kwargs) on the region of interest
+        if self.roi is None:
+            return self.adaptive(infer, img0, img1, **kwargs)
+        n, _, h, w = img0.shape
+        align = max(64, flow_padding(kwargs.get('UHD', False)))
+        y0, y1, x0, x1 = roi_region(self.roi, h, w, self.roi_margin, align)
+        if (y0, y1, x0, x1) == (0, h, 0, w):
+            return self.adaptive(infer, img0, img1, **kwargs)
+        pred = self.adaptive(
+            infer, img0[:, :, y0:y1, x0:x1].contiguous(), img1[:, :, y0:y1, x0:x1].contiguous(), **kwargs)
+        # weight is 1 inside roi and falls to 0 halfway to the region edge
+        x, y, roi_w, roi_h = self.roi
+        feather = max(1, self.roi_margin // 2)
+        ys = torch.arange(y0, y1, device=img0.device, dtype=torch.float32)
+        xs = torch.arange(x0, x1, device=img0.device, dtype=torch.float32)
+        wy = (1 - torch.maximum(y - ys, ys - (y + roi_h - 1)).clamp(min=0) / feather).clamp(min=0)
+        wx = (1 - torch.maximum(x - xs, xs - (x + roi_w - 1)).clamp(min=0) / feather).clamp(min=0)
+        mask = wy.view(-1, 1) * wx.view(1, -1)
+        output = self.fast_path(img0, img1, kwargs.get('timestep', 0.5))
+        output[:, :, y0:y1, x0:x1] = pred * mask + output[:, :, y0:y1, x0:x1] * (1 - mask)
+        return output
+
+    def set_adaptive_flow(self, enabled=True, motion_threshold=32.0):
+        # flow size is picked per pair instead of a True / False UHD argument: 1/4 for pairs
+        # with estimated motion above motion_threshold (px), 1/2 for the rest.
+        # Frames have to be padded to flow_padding(True) for the 1/4 size.
+        # Pair counts, motion and inference time per flow size
+        # are shared with forked CPU worker processes
+        self.adaptive_flow = enabled
+        self.adaptive_motion_threshold = motion_threshold
+        self.adaptive_counts = multiprocessing.Array('d', 6) if enabled else None
+
+    def adaptive_flow_stats(self):
+        # 'saved' - seconds saved by 1/4 flow pairs estimated from the mean
+        # time per pair at each flow size, None until both sizes ran
+        if self.adaptive_counts is None:
+            return {'coarse': 0, 'fine': 0, 'coarse_motion': 0, 'fine_motion': 0, 'saved': None}
+        coarse, fine, coarse_motion, fine_motion, coarse_time, fine_time = self.adaptive_counts[:]
+        saved = None
+        if coarse and fine:
+            saved = coarse * (fine_time / fine - coarse_time / coarse)
+        return {
+            'coarse': int(coarse),
+            'fine': int(fine),
+            'coarse_motion': coarse_motion / max(1, coarse),
+            'fine_motion': fine_motion / max(1, fine),
+            'saved': saved
+            }
+
+    def flow_motion(self, img0, img1, radius=4):
+        # motion magnitude per pair in frame pixels: 4x4 blocks of 1/16 resolution
+        # luma thumbnails are matched within radius, mean block displacement.
+        # Longer shifts get a small penalty so flat blocks stay at zero
+        thumb0 = F.interpolate(img0.float(), scale_factor=0.0625, mode='area').mean(1, True)
+        thumb1 = F.interpolate(img1.float(), scale_factor=0.0625, mode='area').mean(1, True)
+        h, w = thumb0.shape[2:]
+        padded = F.pad(thumb1, [radius] * 4, mode='replicate')
+        costs = []
+        shifts = []
+        for dy in range(2 * radius + 1):
+            for dx in range(2 * radius + 1):
+                diff = (padded[:, :, dy:dy + h, dx:dx + w] - thumb0).abs()
+                shift = math.hypot(dy - radius, dx - radius)
+                costs.append(F.avg_pool2d(diff, 4, ceil_mode=True) + 1e-4 * shift)
+                shifts.append(shift)
+        shifts = torch.tensor(shifts, device=thumb0.device)
+        return 16 * shifts[torch.cat(costs, 1).argmin(1)].flatten(1).mean(1)
+
+    def adaptive(self, infer, img0, img1, **kwargs):
+        # runs infer(img0, img1, **kwargs) with UHD picked per pair.
+        # A flow size given as a number is kept for every pair
+        if not self.adaptive_flow or not isinstance(kwargs.get('UHD', False), bool):
+            return infer(img0, img1, **kwargs)
+        motion = self.flow_motion(img0, img1)
+        coarse = motion > self.adaptive_motion_threshold
+        pad = flow_padding(True)
+        if img0.shape[2] % pad or img0.shape[3] % pad:
+            # frames padded for 1/2 flow size only
+            coarse = torch.zeros_like(coarse)
+        output = None
+        for flow_size, uhd in enumerate((True, False)):
+            index = (coarse == uhd).nonzero().flatten()
+            if not len(index):
+                continue
+            args = {k: take(v, index) for k, v in kwargs.items()}
+            args['UHD'] = uhd
+            if len(index) == img0.shape[0]:
+                pair0, pair1 = img0, img1
+            else:
+                pair0, pair1 = img0[index], img1[index]
+            start = time.time()
+            pred = infer(pair0, pair1, **args)
+            if pred.is_cuda:
+                torch.cuda.synchronize(pred.device)
+            elapsed = time.time() - start
+            with self.adaptive_counts.get_lock():
+                self.adaptive_counts[flow_size] += len(index)
+                self.adaptive_counts[2 + flow_size] += motion[index].sum().item()
+                self.adaptive_counts[4 + flow_size] += elapsed
+            if len(index) == img0.shape[0]:
+                return pred
+            if output is None:
+                output = pred.new_empty((img0.shape[0], ) + pred.shape[1:])
+            output[index] = pred
+        return output
+
+    def set_flow_cache(self, cache_dir, max_size=20, max_age=14):
+        # flownet results are stored in cache_dir per frame pair as zlib compressed
+        # half float arrays, keyed by fingerprints of both frames, model weights,
+        # flow size, precision and quality, so pairs rendered again with another
+        # speed or timing skip flownet. Entries unused for max_age days and least
+        # recently used ones above max_size (GB) are removed. Only the eager path
+        # uses it, None - off. Pairs with synthesized frames, such as bisection steps,
+        # are passed with cache_flow=False and skip it as they are unlikely to repeat.
+        # Pair counts are shared with forked CPU worker processes
+        self.flow_cache = cache_dir
+        self.flow_cache_max_size = max_size * 1024 ** 3
+        self.flow_cache_max_age = max_age * 24 * 3600
+        self.flow_cache_size = 0
+        self.flow_cache_counts = multiprocessing.Array('q', 2) if cache_dir else None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.prune_flow_cache()
+
+    def flow_cache_stats(self):
+        if self.flow_cache_counts is None:
+            return {'hit': 0, 'miss': 0}
+        return {'hit': self.flow_cache_counts[0], 'miss': self.flow_cache_counts[1]}
+
+    def prune_flow_cache(self):
+        # removes expired entries, then the least recently used
+        # down to 90% of max size so pruning does not run on every store
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.flow_cache):
+            if not name.endswith('.flow'):
+                continue
+            path = os.path.join(self.flow_cache, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # removed by another process
+                continue
+            if now - stat.st_mtime > self.flow_cache_max_age:
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        if size > self.flow_cache_max_size:
+            for _, entry_size, path in sorted(entries):
+                if size <= self.flow_cache_max_size * 0.9:
+                    break
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+                size -= entry_size
+        self.flow_cache_size = size
+
+    def flow_cache_keys(self, imgs, UHD=False):
+        # frames are fingerprinted by md5 of their 1/8 resolution thumbnails
+        n = imgs.shape[0]
+        thumbs = F.interpolate(torch.cat((imgs[:, :3], imgs[:, 3:]), 0).float(), scale_factor=0.125, mode='area')
+        prints = [hashlib.md5(t.tobytes()).hexdigest() for t in thumbs.cpu().numpy()]
+        tag = '%s_%sx%s_%s_%s_%s' % (
+            self.checksum(), imgs.shape[3], imgs.shape[2], flow_name(UHD), self.precision, self.quality)
+        return [hashlib.md5(('%s_%s_%s' % (prints[i], prints[n + i], tag)).encode()).hexdigest() for i in range(n)]
+
+    def load_flow(self, key):
+        path = os.path.join(self.flow_cache, key + '.flow')
+        try:
+            with open(path, 'rb') as flow_file:
+                flow = np.load(io.BytesIO(zlib.decompress(flow_file.read())))
+            # modification time orders entries for pruning
+            os.utime(path)
+        except (OSError, ValueError, zlib.error):
+            return None
+        return torch.from_numpy(flow)
+
+    def save_flow(self, key, flow):
+        # level 1 compression keeps the store cheap next to flownet
+        buffer = io.BytesIO()
+        np.save(buffer, flow.detach().cpu().numpy().astype(np.float16))
+        data = zlib.compress(buffer.getvalue(), 1)
+        path = os.path.join(self.flow_cache, key + '.flow')
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as flow_file:
+                flow_file.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            warnings.warn('flow cache entry not stored: %s' % e)
+            return
+        self.flow_cache_size += len(data)
+        if self.flow_cache_size > self.flow_cache_max_size:
+            self.prune_flow_cache()
+
+    def cached_flow(self, imgs, UHD=False, cache_flow=True):
+        # flownet(imgs, UHD) flow, pairs found in the flow cache skip flownet
+        if self.flow_cache is None or not cache_flow:
+            flow, _ = self.flownet(imgs, UHD)
+            return flow
+        keys = self.flow_cache_keys(imgs, UHD)
+        flows = [self.load_flow(k) for k in keys]
+        missing = [i for i, f in enumerate(flows) if f is None]
+        with self.flow_cache_counts.get_lock():
+            self.flow_cache_counts[0] += len(keys) - len(missing)
+            self.flow_cache_counts[1] += len(missing)
+        if missing:
+            computed, _ = self.flownet(imgs if len(missing) == len(keys) else imgs[missing], UHD)
+            for row, i in enumerate(missing):
+                flows[i] = computed[row:row + 1]
+                self.save_flow(keys[i], flows[i])
+        return torch.cat([f.to(imgs.device).float() for f in flows], 0)
+
+    def reset_warm_start(self):
+        # next inference_warm() call runs full flownet
+        self.warm_flow = None
+        self.warm_flow_key = None
+        self.warm_error = 0
+        self.warm_count = 0
+
+    def flow_error(self, imgs, flow):
+        # mean photometric difference of img0 and img1 warped to the middle by flow
+        x = F.interpolate(imgs, size=flow.shape[2:], mode="bilinear", align_corners=False)
+        warped_img0, warped_img1 = warp_pair(torch.cat((x[:, :3], x[:, 3:]), 0), flow)
+        return (warped_img0 - warped_img1).abs().mean().item()
+
+    def enable_compile(self, cache_dir):
+        # inference() runs traced and frozen TorchScript graphs from now on.
+        # A graph is built on first use of each padded frame size and stored
+        # in cache_dir, so later runs with the same model, size and torch version load it
+        self.compile_cache = cache_dir
+        self.compiled = {}
+
+    def graph_name(self, h, w, UHD=False):
+        # file name for a compiled graph of a padded frame size
+        return '%s_%sx%s_%s_%s_%s_%s%s_%s' % (
+            self.checksum(), w, h, flow_name(UHD), self.precision, self.graph_quality(),
+            self.torch_device.type, '_nhwc' if self.memory_format == torch.channels_last else '',
+            torch.__version__.replace('+', '_'))
+
+    def warn_graph_quality(self):
+        # compiled graphs run every flow block of the tier, see graph_quality()
+        if self.flownet.exit_threshold:
+            print ('early flow exit of %s quality is not used by compiled graphs, they are cached as %s' % (
+                self.quality, self.graph_quality()))
+
+    def compile(self, h, w, UHD=False):
+        # returns the compiled graph for a padded frame size,
+        # tracing it if it is not found in the on-disk cache
+        k = (h, w, flow_resolution(UHD), self.precision, self.graph_quality())
+        if k in self.compiled:
+            return self.compiled[k]
+        self.warn_graph_quality()
+        path = os.path.join(self.compile_cache, self.graph_name(h, w, UHD) + '.pt')
+        if os.path.isfile(path):
+            graph = torch.jit.load(path, map_location=self.torch_device)
+        else:
+            print ('Compiling inference graph for %s x %s, it is cached in %s' % (w, h, self.compile_cache))
+            img0 = self.to_memory_format(torch.rand(1, 3, h, w, device=self.torch_device))
+            img1 = self.to_memory_format(torch.rand(1, 3, h, w, device=self.torch_device))
+            with torch.no_grad(), self.autocast(), warnings.catch_warnings():
+                warnings.simplefilter('ignore', torch.jit.TracerWarning)
+                graph = torch.jit.trace(InferenceGraph(self, UHD).eval(), (img0, img1), check_trace=False)
+            if self.torch_device.type == 'cpu' and self.memory_format == torch.channels_last:
+                # freezes and converts convolutions to oneDNN layouts
+                graph = torch.jit.optimize_for_inference(graph)
+            else:
+                graph = torch.jit.freeze(graph)
+            if not os.path.isdir(self.compile_cache):
+                os.makedirs(self.compile_cache, exist_ok=True)
+            # several worker processes may compile the same graph at once
+            tmp_path = '%s.%s.tmp' % (path, os.getpid())
+            torch.jit.save(graph, tmp_path)
+            os.replace(tmp_path, path)
+        self.compiled[k] = graph
+        return graph
+
+    def load_config(self, path):
+        # optional config.json in model folder describes models
+        # that differ from the trained fp32 model
+        config_path = os.path.join(path, 'config.json')
+        if not os.path.isfile(config_path):
+            return {}
+        with open(config_path, 'r') as config_file:
+            return json.load(config_file)
 
     def load_model(self, path, rank):
         def convert(param):
             if rank == -1:
+                # DDP checkpoints have module. prefix, saved by save_model do not
                 return {
-                    k.replace("module.", ""): v
+                    k[len("module."):] if k.startswith("module.") else k: v
                     for k, v in param.items()
-                    if "module." in k
                 }
             else:
                 return param
-        if rank <= 0:
+        self.model_checksum = None
+        config = self.load_config(path)
+        if 'flownet' in config:
+            # flownet of a different size, e.g. a distilled student
+            self.flownet = IFNet(**config['flownet'])
+            self.flownet.to(self.torch_device)
+            self.set_quality(self.quality)
+            self.init_optimizer()
+        if 'pruned' in config:
+            # channel pruned networks get the layer shapes of the pruned model
+            from model.prune import resize_modules
+            resize_modules(self.flownet, config['pruned']['flownet'])
+            resize_modules(self.fusionnet, config['pruned']['fusionnet'])
+            self.init_optimizer()
+        if config.get('quantization') == 'int8':
+            if self.torch_device.type != 'cpu':
+                raise RuntimeError('int8 quantized model %s runs on CPU only, use --cpu' % path)
+            from model.quantize import prepare_int8, convert_int8
+            prepare_int8(self, config.get('engine', 'x86'))
+            convert_int8(self)
+            self.quantized = True
+        flat_path = None if self.quantized or rank != -1 else flat_weights_path(path)
+        if flat_path:
+            # memory mapped weights, on CPU parameters stay backed by the shared mapping
+            state_dicts = load_flat(flat_path)
+            assign = self.torch_device.type == 'cpu'
+            load_state_dict(self.flownet, state_dicts['flownet'], assign)
+            load_state_dict(self.contextnet, state_dicts['contextnet'], assign)
+            load_state_dict(self.fusionnet, state_dicts['fusionnet'], assign)
+            if assign:
+                # optimizer should follow the assigned parameters
+                # and not keep the initial ones alive
+                self.init_optimizer()
+        elif rank <= 0:
             self.flownet.load_state_dict(
-                convert(torch.load('{}/flownet.pkl'.format(path), map_location=device)))
+                convert(torch.load('{}/flownet.pkl'.format(path), map_location=self.torch_device)))
             self.contextnet.load_state_dict(
-                convert(torch.load('{}/contextnet.pkl'.format(path), map_location=device)))
+                convert(torch.load('{}/contextnet.pkl'.format(path), map_location=self.torch_device)))
             self.fusionnet.load_state_dict(
-                convert(torch.load('{}/unet.pkl'.format(path), map_location=device)))
+                convert(torch.load('{}/unet.pkl'.format(path), map_location=self.torch_device)))
 
     def save_model(self, path, rank):
         if rank == 0:
@@ -188,19 +826,64 @@ class Model:
             torch.save(self.contextnet.state_dict(), '{}/contextnet.pkl'.format(path))
             torch.save(self.fusionnet.state_dict(), '{}/unet.pkl'.format(path))
 
-    def predict(self, imgs, flow, training=True, flow_gt=None, UHD=False):
+    def predict(self, imgs, flow, training=True, flow_gt=None, UHD=False, timestep=0.5, keys=None):
+        # keys is an optional pair of per frame key lists for img0 and img1,
+        # see enable_feature_cache()
         img0 = imgs[:, :3]
         img1 = imgs[:, 3:]
-        if UHD:
-            flow = F.interpolate(flow, scale_factor=2.0, mode="bilinear", align_corners=False) * 2.0
-        c0 = self.contextnet(img0, flow)
-        c1 = self.contextnet(img1, -flow)
-        flow = F.interpolate(flow, scale_factor=2.0, mode="bilinear",
+        # contextnet and fusionnet take flow at 1/2 of the frame
+        scale = flow_resolution(UHD)
+        if scale != 0.5:
+            flow = resize_flow(flow, 0.5 / scale)
+        # flow is estimated for the middle frame, for any other timestep
+        # it is scaled assuming linear motion between img0 and img1
+        midpoint = isinstance(timestep, (int, float)) and timestep == 0.5
+        if midpoint:
+            flow0, flow1 = flow, -flow
+        else:
+            if not isinstance(timestep, (int, float)):
+                timestep = torch.tensor(timestep, dtype=flow.dtype, device=flow.device).view(-1, 1, 1, 1)
+            flow0 = flow * (timestep * 2)
+            flow1 = flow * ((timestep - 1) * 2)
+        if not training and not self.fusion:
+            # draft tier blends the two warped frames without contextnet and fusionnet
+            flow0 = F.interpolate(flow0, scale_factor=2.0, mode="bilinear", align_corners=False) * 2.0
+            flow1 = F.interpolate(flow1, scale_factor=2.0, mode="bilinear", align_corners=False) * 2.0
+            warped_img0, warped_img1 = warp_pair(torch.cat((img0, img1), 0), flow0, flow1)
+            return torch.clamp(warped_img0 * (1 - timestep) + warped_img1 * timestep, 0, 1)
+        if midpoint:
+            # bilinear resampling is linear, so the pyramid of -flow
+            # is exactly the negated pyramid of flow
+            pyramid0 = flow_pyramid(flow0)
+            pyramid1 = [-f for f in pyramid0]
+        else:
+            pyramid0 = flow_pyramid(flow0)
+            pyramid1 = flow_pyramid(flow1)
+        # contextnet runs once on img0 and img1 stacked along the batch axis
+        n = img0.shape[0]
+        img_pair = torch.cat((img0, img1), 0)
+        pyramid = [torch.cat((f0, f1), 0) for f0, f1 in zip(pyramid0, pyramid1)]
+        if keys is not None and self.feature_cache is not None:
+            features = self.contextnet.warp_features(self.cached_features(img_pair, list(keys[0]) + list(keys[1])), pyramid)
+        else:
+            features = self.contextnet(img_pair, pyramid)
+        c0 = [f[:n] for f in features]
+        c1 = [f[n:] for f in features]
+        flow0 = F.interpolate(flow0, scale_factor=2.0, mode="bilinear",
                              align_corners=False) * 2.0
+        if midpoint:
+            flow1 = -flow0
+        else:
+            flow1 = F.interpolate(flow1, scale_factor=2.0, mode="bilinear",
+                                 align_corners=False) * 2.0
         refine_output, warped_img0, warped_img1, warped_img0_gt, warped_img1_gt = self.fusionnet(
-            img0, img1, flow, c0, c1, flow_gt)
+            img0, img1, flow0, c0, c1, flow_gt, flow1, img_pair)
         res = torch.sigmoid(refine_output[:, :3]) * 2 - 1
         mask = torch.sigmoid(refine_output[:, 3:4])
+        if not midpoint:
+            # fusion mask is trained for the middle frame,
+            # shift it towards the temporally closer frame
+            mask = mask * (1 - timestep) / (mask * (1 - timestep) + (1 - mask) * timestep + 1e-6)
         merged_img = warped_img0 * mask + warped_img1 * (1 - mask)
         pred = merged_img + res
         pred = torch.clamp(pred, 0, 1)
@@ -209,10 +892,205 @@ class Model:
         else:
             return pred
 
-    def inference(self, img0, img1, UHD=False):
+    def inference(self, img0, img1, UHD=False, keys=None, cache_flow=True):
+        # cache_flow=False keeps flow of pairs with synthesized frames out of the flow cache
+        return self.gated(self.inference_full, img0, img1, UHD=UHD, keys=keys, cache_flow=cache_flow)
+
+    def inference_full(self, img0, img1, UHD=False, keys=None, cache_flow=True):
+        # inference() without the similarity gate
+        img0 = self.to_memory_format(img0)
+        img1 = self.to_memory_format(img1)
+        if self.use_tiles(img0):
+            return self.inference_tiled(img0, img1, UHD, cache_flow=cache_flow)
+        if self.compile_cache:
+            # traced graph has reduced precision casts recorded in it
+            return self.compile(img0.shape[2], img0.shape[3], UHD)(img0, img1).float()
+        imgs = torch.cat((img0, img1), 1)
+        with self.autocast():
+            flow = self.cached_flow(imgs, UHD, cache_flow)
+            return self.predict(imgs, flow, training=False, UHD=UHD, keys=keys).float()
+
+    def inference_warm(self, img0, img1, UHD=False, keys=None):
+        # interpolates consecutive pairs of a sequence one pair at a time,
+        # starting flownet from the previous pair's flow and skipping its
+        # most expensive block. Falls back to the full flownet pass on scene cuts,
+        # every warm_start_interval pairs and when the warm started flow is worse.
+        # Pairs taking the similarity gate fast path keep the previous flow
+        return self.gated(self.inference_warm_full, img0, img1, UHD=UHD, keys=keys)
+
+    def inference_warm_full(self, img0, img1, UHD=False, keys=None):
+        img0 = self.to_memory_format(img0)
+        img1 = self.to_memory_format(img1)
+        # cached flows are cheaper than warm started ones
+        if not self.warm_start or img0.shape[0] != 1 or self.compile_cache or (
+                self.use_tiles(img0) or self.flow_cache):
+            self.reset_warm_start()
+            return self.inference_full(img0, img1, UHD, keys)
+        imgs = torch.cat((img0, img1), 1)
+        thumbs = F.interpolate(imgs, (16, 16), mode='bilinear', align_corners=False)
+        if (thumbs[:, :3] - thumbs[:, 3:]).abs().mean().item() > 0.2:
+            self.warm_start_stats['scene_cut'] += 1
+            self.reset_warm_start()
+        warm_flow_key = (tuple(imgs.shape), UHD, self.precision)
+        if self.warm_flow_key != warm_flow_key or self.warm_count >= self.warm_start_interval:
+            self.warm_flow = None
+        with self.autocast():
+            flow = None
+            if self.warm_flow is not None:
+                flow, _ = self.flownet(imgs, UHD, flow_init=self.warm_flow)
+                if self.flow_error(imgs, flow) > max(self.warm_error, 1e-3) * self.warm_start_tolerance:
+                    self.warm_start_stats['fallback'] += 1
+                    flow = None
+                else:
+                    self.warm_start_stats['warm'] += 1
+                    self.warm_count += 1
+            if flow is None:
+                flow, _ = self.flownet(imgs, UHD)
+                self.warm_start_stats['cold'] += 1
+                self.warm_error = self.flow_error(imgs, flow)
+                self.warm_count = 0
+            self.warm_flow = flow
+            self.warm_flow_key = warm_flow_key
+            return self.predict(imgs, flow, training=False, UHD=UHD, keys=keys).float()
+
+    def inference_timestep(self, img0, img1, timestep, UHD=False, pairs=None):
+        # synthesizes frame at arbitrary timestep between img0 (0.0) and img1 (1.0)
+        # running flownet only once. timestep is either a float or a list
+        # of floats with individual timestep for each pair in a batch.
+        # pairs optionally lists a source pair id for each row, rows of the same
+        # source pair at different timesteps share a single flow estimate
+        return self.gated(self.inference_timestep_full, img0, img1, timestep=timestep, UHD=UHD, pairs=pairs)
+
+    def inference_timestep_full(self, img0, img1, timestep, UHD=False, pairs=None):
+        img0 = self.to_memory_format(img0)
+        img1 = self.to_memory_format(img1)
+        if self.use_tiles(img0):
+            return self.inference_tiled(img0, img1, UHD, timestep, pairs)
         imgs = torch.cat((img0, img1), 1)
-        flow, _ = self.flownet(imgs, UHD)
-        return self.predict(imgs, flow, training=False, UHD=UHD)
+        with self.autocast():
+            flow = self.pair_flow(imgs, UHD, pairs)
+            return self.predict(imgs, flow, training=False, UHD=UHD, timestep=timestep).float()
+
+    def pair_flow(self, imgs, UHD=False, pairs=None, cache_flow=True):
+        # cached_flow() estimated once per distinct id in pairs and repeated for its rows
+        if pairs is None or len(set(pairs)) == len(pairs):
+            return self.cached_flow(imgs, UHD, cache_flow)
+        unique = list(dict.fromkeys(pairs))
+        flow = self.cached_flow(imgs[[pairs.index(pair) for pair in unique]], UHD, cache_flow)
+        return flow[[unique.index(pair) for pair in pairs]]
+
+    def inference_tiled(self, img0, img1, UHD=False, timestep=0.5, pairs=None, cache_flow=True):
+        # flow is estimated for the whole frame at its low resolution,
+        # contextnet and fusionnet run on overlapping tiles that are feather blended.
+        # Each tile is extended by the largest motion inside it, so warps
+        # sample the same pixels as they would on the full frame.
+        # With sparse synthesis static tiles are blended from the source frames
+        imgs = torch.cat((img0, img1), 1)
+        n, _, h, w = img0.shape
+        with self.autocast():
+            flow = self.pair_flow(imgs, UHD, pairs, cache_flow)
+        flow = flow.float()
+        flow_scale = w // flow.shape[3]
+
+        memory_tiles = self.tile_size and max(h, w) > self.tile_size
+        tile = self.tile_size if memory_tiles else 0
+        overlap = self.tile_overlap
+        if self.sparse:
+            tile = min(tile, self.sparse_tile_size) if tile else self.sparse_tile_size
+        step = tile - overlap
+
+        def tile_starts(size):
+            if size <= tile:
+                return [0]
+            starts = list(range(0, size - tile, step))
+            return starts + [size - tile]
+
+        def feather(start, end, size):
+            ramp = torch.ones(end - start, device=img0.device)
+            edge = torch.arange(1, overlap + 1, device=img0.device, dtype=ramp.dtype) / (overlap + 1)
+            if start > 0:
+                ramp[:overlap] = edge
+            if end < size:
+                ramp[-overlap:] = torch.minimum(ramp[-overlap:], edge.flip(0))
+            return ramp
+
+        tiles = [(y0, x0) for y0 in tile_starts(h) for x0 in tile_starts(w)]
+        static = set()
+        if self.sparse:
+            # tiles static in every pair of the batch, including their overlap
+            diff = F.interpolate((img0 - img1).abs().float(), scale_factor=0.125, mode='area')
+            diff_scale = w // diff.shape[3]
+            for y0, x0 in tiles:
+                oy0, ox0 = max(0, y0 - overlap), max(0, x0 - overlap)
+                oy1, ox1 = min(h, y0 + tile + overlap), min(w, x0 + tile + overlap)
+                tile_flow = flow[:, :, oy0 // flow_scale:oy1 // flow_scale, ox0 // flow_scale:ox1 // flow_scale]
+                tile_diff = diff[:, :, oy0 // diff_scale:oy1 // diff_scale, ox0 // diff_scale:ox1 // diff_scale]
+                if (tile_flow.abs().max().item() * flow_scale < self.sparse_flow_threshold and
+                        tile_diff.max().item() < self.sparse_diff_threshold):
+                    static.add((y0, x0))
+            with self.sparse_counts.get_lock():
+                self.sparse_counts[0] += len(static)
+                self.sparse_counts[1] += len(tiles) - len(static)
+            if not static and not memory_tiles:
+                # moving tiles with margins would cost more than the whole frame
+                with self.autocast():
+                    return self.predict(imgs, flow, training=False, UHD=UHD, timestep=timestep).float()
+
+        def synthesize(y0, y1, x0, x1):
+            # runs contextnet and fusionnet on a region extended by its largest motion
+            region_flow = flow[:, :, y0 // flow_scale:y1 // flow_scale, x0 // flow_scale:x1 // flow_scale]
+            margin = int(region_flow.abs().max().item() * flow_scale) + overlap
+            margin = ((margin + 63) // 64) * 64
+            sy0, sx0 = max(0, y0 - margin), max(0, x0 - margin)
+            sy1, sx1 = min(h, y1 + margin), min(w, x1 + margin)
+            with self.autocast():
+                pred = self.predict(
+                    imgs[:, :, sy0:sy1, sx0:sx1],
+                    flow[:, :, sy0 // flow_scale:sy1 // flow_scale, sx0 // flow_scale:sx1 // flow_scale],
+                    training=False, UHD=UHD, timestep=timestep).float()
+            return pred, sy0, sx0
+
+        region = None
+        if static and not memory_tiles and len(static) < len(tiles):
+            # moving tiles are synthesized in a single pass over their bounding box,
+            # separate passes would repeat the margins around every tile
+            moving = [(y0, x0) for y0, x0 in tiles if (y0, x0) not in static]
+            region = synthesize(
+                min(y0 for y0, _ in moving), max(min(y0 + tile, h) for y0, _ in moving),
+                min(x0 for _, x0 in moving), max(min(x0 + tile, w) for _, x0 in moving))
+
+        output = torch.zeros_like(img0)
+        weight = torch.zeros((1, 1, h, w), device=img0.device, dtype=img0.dtype)
+        for y0, x0 in tiles:
+            y1 = min(y0 + tile, h)
+            x1 = min(x0 + tile, w)
+            mask = feather(y0, y1, h).view(-1, 1) * feather(x0, x1, w).view(1, -1)
+            if (y0, x0) in static:
+                pred = self.fast_path(img0[:, :, y0:y1, x0:x1], img1[:, :, y0:y1, x0:x1], timestep)
+                sy0, sx0 = y0, x0
+            else:
+                pred, sy0, sx0 = region or synthesize(y0, y1, x0, x1)
+            output[:, :, y0:y1, x0:x1] += pred[:, :, y0 - sy0:y1 - sy0, x0 - sx0:x1 - sx0] * mask
+            weight[:, :, y0:y1, x0:x1] += mask
+        return output / weight
+
+    def inference_batch(self, img0, img1, UHD=False, batch_size=0, cache_flow=True):
+        # interpolates N pairs of frames padded to the same size
+        # img0 and img1 are either N x C x H x W tensors or lists of 1 x C x H x W tensors
+        # batch_size limits the number of pairs going through a single forward pass, 0 - no limit.
+        # cache_flow=False for pairs with synthesized frames, see set_flow_cache()
+        # returns N x C x H x W tensor with middle frames in the order of input pairs
+        if isinstance(img0, (list, tuple)):
+            img0 = torch.cat(img0, 0)
+        if isinstance(img1, (list, tuple)):
+            img1 = torch.cat(img1, 0)
+        assert img0.shape == img1.shape, 'frames in pairs should be of the same padded shape'
+        if not batch_size or batch_size >= img0.shape[0]:
+            return self.inference(img0, img1, UHD, cache_flow=cache_flow)
+        middles = []
+        for i in range(0, img0.shape[0], batch_size):
+            middles.append(self.inference(img0[i:i + batch_size], img1[i:i + batch_size], UHD, cache_flow=cache_flow))
+        return torch.cat(middles, 0)
 
     def update(self, imgs, gt, learning_rate=0, mul=1, training=True, flow_gt=None):
         for param_group in self.optimG.param_groups:
@@ -253,6 +1131,7 @@ class Model:
 
 
 if __name__ == '__main__':
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     img0 = torch.zeros(3, 3, 256, 256).float().to(device)
     img1 = torch.tensor(np.random.normal(
         0, 1, (3, 3, 256, 256))).float().to(device)
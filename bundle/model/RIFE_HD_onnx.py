@@ -0,0 +1,117 @@
+import os
+import torch
+import warnings
+import importlib.util
+from model.RIFE_HD import Model as TorchModel
+from model.RIFE_HD import InferenceGraph, flow_resolution
+
+
+def check_onnx():
+    # onnx is needed to export graphs and onnxruntime to run them,
+    # both are optional and listed in requirements-onnx.txt
+    missing = [name for name in ('onnx', 'onnxruntime') if importlib.util.find_spec(name) is None]
+    if missing:
+        raise ImportError('onnx backend needs %s, install with: pip install -r requirements-onnx.txt' % (
+            ' and '.join(missing)))
+
+
+def export_onnx(model, path, h, w, UHD=False, opset=17):
+    # exports flownet + contextnet + fusionnet inference path of RIFE_HD model
+    # as a single ONNX graph for a padded frame size, batch size is left dynamic
+    img0 = torch.rand(1, 3, h, w, device=model.torch_device)
+    img1 = torch.rand(1, 3, h, w, device=model.torch_device)
+    graph = InferenceGraph(model, UHD).eval()
+    # several worker processes may export the same graph at once
+    tmp_path = '%s.%s.tmp' % (path, os.getpid())
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter('ignore', torch.jit.TracerWarning)
+        torch.onnx.export(
+            graph, (img0, img1), tmp_path,
+            input_names=['img0', 'img1'],
+            output_names=['output'],
+            dynamic_axes={'img0': {0: 'batch'}, 'img1': {0: 'batch'}, 'output': {0: 'batch'}},
+            opset_version=opset,
+            dynamo=False)
+    os.replace(tmp_path, path)
+
+
+class Model(TorchModel):
+    # RIFE_HD model running inference() with ONNX Runtime.
+    # Torch modules are still used to load weights, to export graphs
+    # and for tiled, sparse and timestep synthesis that are not part of the exported graph
+    def __init__(self, local_rank=-1, device=None):
+        check_onnx()
+        super(Model, self).__init__(local_rank, device)
+        self.compile_cache = './compiled_models'
+        self.threads = 0
+        self.sessions = {}
+        self.eager_noted = False
+
+    def note_eager(self, timestep=False):
+        # tells once which enabled paths run with torch instead of onnxruntime.
+        # Drivers call it before forking worker processes so workers do not repeat it
+        if self.eager_noted:
+            return
+        paths = []
+        if self.tile_size:
+            paths.append('tiled frames')
+        if self.sparse:
+            paths.append('sparse synthesis')
+        if timestep:
+            paths.append('timestep synthesis')
+        if self.flow_cache:
+            paths.append('flow cache lookups')
+        if paths:
+            print ('onnx backend is not used for %s, they run with torch' % ', '.join(paths))
+            self.eager_noted = True
+
+    def set_precision(self, precision):
+        if precision != 'fp32':
+            print ('onnx backend runs in fp32 only, %s is ignored' % precision)
+        self.precision = 'fp32'
+
+    def enable_compile(self, cache_dir):
+        # exported graphs are always cached, this only sets the folder
+        self.compile_cache = cache_dir
+        self.sessions = {}
+
+    def compile(self, h, w, UHD=False):
+        # returns ONNX Runtime session for a padded frame size,
+        # exporting the graph first if it is not found in the cache folder
+        import onnxruntime     # type: ignore
+
+        # sessions can not be shared with forked worker processes
+        k = (os.getpid(), h, w, flow_resolution(UHD), self.graph_quality())
+        if k in self.sessions:
+            return self.sessions[k]
+        self.warn_graph_quality()
+        path = os.path.join(self.compile_cache, self.graph_name(h, w, UHD) + '.onnx')
+        if not os.path.isfile(path):
+            print ('Exporting onnx graph for %s x %s, it is cached in %s' % (w, h, self.compile_cache))
+            if not os.path.isdir(self.compile_cache):
+                os.makedirs(self.compile_cache, exist_ok=True)
+            export_onnx(self, path, h, w, UHD)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        providers = ['CPUExecutionProvider']
+        if self.torch_device.type == 'cuda':
+            providers.insert(0, 'CUDAExecutionProvider')
+        self.sessions[k] = onnxruntime.InferenceSession(path, options, providers=providers)
+        return self.sessions[k]
+
+    def inference_full(self, img0, img1, UHD=False, keys=None, cache_flow=True):
+        # feature cache keys are not used by the exported graph
+        if self.use_tiles(img0):
+            self.note_eager()
+            return self.inference_tiled(img0, img1, UHD, cache_flow=cache_flow)
+        session = self.compile(img0.shape[2], img0.shape[3], UHD)
+        output = session.run(None, {
+            'img0': img0.detach().float().cpu().numpy(),
+            'img1': img1.detach().float().cpu().numpy()})[0]
+        return torch.from_numpy(output).to(img0.device)
+
+    def inference_timestep_full(self, img0, img1, timestep, UHD=False, pairs=None):
+        self.note_eager(timestep=True)
+        return super(Model, self).inference_timestep_full(img0, img1, timestep, UHD, pairs)
@@ -0,0 +1,34 @@
+import os
+import cv2
+import math
+import torch
+import numpy as np
+from torch.nn import functional as F
+
+# Frame pairs and PSNR shared by the tools that measure a model on a sequence:
+# quantize.py, prune.py and profile_models.py
+
+
+def read_pairs(folder, pairs):
+    files_list = sorted([f for f in os.listdir(folder) if os.path.splitext(f)[1] == '.exr'])
+    if len(files_list) < 2:
+        return []
+    # pairs are picked evenly across the sequence
+    count = min(pairs, len(files_list) - 1)
+    indices = np.linspace(0, len(files_list) - 2, count).round().astype(int)
+    result = []
+    for index in indices:
+        img0 = cv2.imread(os.path.join(folder, files_list[index]), cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
+        img1 = cv2.imread(os.path.join(folder, files_list[index + 1]), cv2.IMREAD_COLOR | cv2.IMREAD_ANYDEPTH)[:, :, ::-1].copy()
+        result.append((img0, img1))
+    return result
+
+
+def to_tensor(img, padding):
+    return F.pad(torch.from_numpy(np.transpose(img, (2,0,1))).unsqueeze(0), padding)
+
+
+def psnr(reference, result, max_psnr=float('inf')):
+    # identical results get max_psnr
+    mse = torch.mean((reference - result) ** 2).item()
+    return max_psnr if mse == 0 else min(max_psnr, -10 * math.log10(mse))
@@ -0,0 +1,231 @@
+import torch
+import psutil
+import numpy as np
+import multiprocessing as mp
+from torch.nn import functional as F
+from model.RIFE_HD import flow_padding, roi_region
+
+# Setup shared by inference_sequence.py, inference_dpframes.py, inference_fluidmorph.py
+# and inference_flame_tw.py: model loading and configuration from their common
+# command line arguments, memory budget, CPU worker count and statistics
+
+
+def device_type(args):
+    return 'cuda' if torch.cuda.is_available() and not args.cpu else 'cpu'
+
+
+def pad_size(h, w, UHD=False):
+    # padded frame size and F.pad padding of a h x w frame, a multiple of 64
+    # or of flow_padding(UHD) for flow sizes below 1/4
+    pad = max(64, flow_padding(UHD))
+    ph = ((h - 1) // pad + 1) * pad
+    pw = ((w - 1) // pad + 1) * pad
+    return ph, pw, (0, pw - w, 0, ph - h)
+
+
+def frame_tensor(frame, device, padding):
+    # H x W x C frame as padded 1 x C x H x W tensor
+    return F.pad(torch.from_numpy(np.transpose(frame, (2,0,1))).to(device, non_blocking=True).unsqueeze(0), padding)
+
+
+def load_model(args, device):
+    # --backend model with --model weights on device, ready for inference
+    if args.backend == 'onnx':
+        from model.RIFE_HD_onnx import Model     # type: ignore
+    else:
+        from model.RIFE_HD import Model     # type: ignore
+    model = Model(device=device)
+    model.load_model(args.model, -1)
+    model.eval()
+    model.device()
+    print ('Trained model loaded: %s' % args.model)
+
+    torch.set_grad_enabled(False)
+    if device.type == 'cuda':
+        torch.backends.cudnn.enabled = True
+        torch.backends.cudnn.benchmark = True
+    return model
+
+
+def configure_model(model, args, h, w, ref_frames=None):
+    # applies command line options to the model for h x w frames.
+    # Reduced precision is checked against fp32 on ref_frames, the first pair of the clip.
+    # Tile size and batch size are picked for --memory_budget, returns estimated
+    # peak memory (Gb) of a single pair
+    ph, pw, padding = pad_size(h, w, args.UHD)
+    roi = getattr(args, 'roi', None)
+    if args.channels_last:
+        model.set_channels_last()
+    model.set_precision(args.precision)
+    model.set_quality(args.quality)
+    if args.similarity_gate:
+        model.set_similarity_gate(args.similarity_gate, args.gate_mode)
+    if args.sparse:
+        model.set_sparse_synthesis()
+    if args.adaptive_flow:
+        model.set_adaptive_flow()
+    if roi:
+        model.set_roi(roi)
+    if model.precision != 'fp32' and ref_frames is not None:
+        ref_I0, ref_I1 = [frame_tensor(frame, model.torch_device, padding) for frame in ref_frames]
+        psnr = model.check_precision(ref_I0, ref_I1, args.UHD, args.min_psnr)
+        print ('Inference precision: %s (%.2f dB PSNR against fp32 on first pair)' % (model.precision, psnr))
+
+    if args.compile or args.backend == 'onnx':
+        model.enable_compile(args.compile_cache)
+        model.compile(ph, pw, args.UHD)
+
+    megapixels = ( h * w ) / ( 10 ** 6 )
+    if roi:
+        # only the region of interest with its margin goes through the model
+        y0, y1, x0, x1 = roi_region(roi, ph, pw)
+        megapixels = ( (y1 - y0) * (x1 - x0) ) / ( 10 ** 6 )
+    # reduced precision roughly halves activations memory
+    thread_ram = megapixels * (2.4 if model.precision == 'fp32' else 1.4)
+    if args.memory_budget and thread_ram > args.memory_budget and not args.tile_size:
+        # frame does not fit in memory budget, render it in overlapping tiles
+        args.tile_size = int(1000 * (megapixels * args.memory_budget / thread_ram) ** 0.5) - 2 * args.tile_overlap
+    if args.tile_size:
+        # flow is still estimated for the whole frame at low resolution
+        thread_ram = thread_ram * min(1.0, ((args.tile_size + 2 * args.tile_overlap) ** 2 / 10 ** 6) / megapixels)
+    if args.memory_budget:
+        args.batch_size = max(1, int(args.memory_budget // thread_ram))
+    args.batch_size = max(1, args.batch_size)
+    if args.tile_size:
+        model.set_tiling(args.tile_size, args.tile_overlap)
+    if args.flow_cache:
+        model.set_flow_cache(args.flow_cache, args.flow_cache_size, args.flow_cache_age)
+    if args.backend == 'onnx':
+        model.note_eager(getattr(args, 'timestep', False))
+    return thread_ram
+
+
+def worker_count(thread_ram):
+    # CPU worker processes that fit in free RAM with thread_ram (Gb) each,
+    # two cores are left to reading and writing frames. Returns it with free RAM (Gb)
+    available_ram = psutil.virtual_memory()[1]/( 1024 ** 3 )
+    sim_workers = min(round( available_ram / thread_ram ), mp.cpu_count() - 2)
+    return max(1, sim_workers), available_ram
+
+
+def time_budget_workers(args, h, w):
+    # CPU worker processes a --time_budget job is split between, estimated
+    # before the profile sets precision, so with fp32 memory per pair
+    if device_type(args) != 'cpu':
+        return 1
+    megapixels = ( h * w ) / ( 10 ** 6 )
+    return worker_count(megapixels * 2.4 * max(1, args.batch_size))[0]
+
+
+def cpu_workers(model, args, h, w, thread_ram, unit='Frames'):
+    # number of CPU worker processes that fit in free RAM with a batch of
+    # args.batch_size each, returns it with estimated peak memory (Gb) per worker
+    thread_ram = thread_ram * args.batch_size
+    sim_workers, available_ram = worker_count(thread_ram)
+    if args.backend == 'onnx':
+        # each worker process gets its share of CPU threads
+        model.threads = max(1, mp.cpu_count() // sim_workers)
+
+    print ('---\nFree RAM: %s Gb available' % '{0:.1f}'.format(available_ram))
+    print ('Image size: %s x %s' % ( w, h,))
+    print ('Peak memory usage estimation: %s Gb per CPU thread ' % '{0:.1f}'.format(thread_ram))
+    print ('Using %s CPU worker thread%s (of %s available)' % (sim_workers, '' if sim_workers == 1 else 's', mp.cpu_count()))
+    print ('%s per worker pass: %s\n---' % (unit, args.batch_size))
+    if thread_ram > available_ram:
+        print ('Warning: estimated peak memory usage is greater then RAM avaliable')
+    return sim_workers, thread_ram
+
+
+def print_stats(model, args):
+    # pair, tile and cache counts of the speed-ups enabled for the run
+    if args.similarity_gate:
+        stats = model.gate_stats()
+        print ('Similarity gate: %s of %s pairs took the fast path (%s)' % (
+            stats['fast'], stats['fast'] + stats['model'], args.gate_mode))
+    if args.sparse:
+        stats = model.sparse_stats()
+        tiles = stats['static'] + stats['moving']
+        print ('Sparse synthesis: %s of %s tiles static (%.1f%% skipped)' % (
+            stats['static'], tiles, 100.0 * stats['static'] / max(1, tiles)))
+    if args.adaptive_flow:
+        stats = model.adaptive_flow_stats()
+        saved = 'time saved not measured' if stats['saved'] is None else 'estimated %.1f sec saved' % stats['saved']
+        print ('Adaptive flow: %s pairs at 1/4 flow size (mean motion %.1f px), %s at 1/2 (%.1f px), %s' % (
+            stats['coarse'], stats['coarse_motion'], stats['fine'], stats['fine_motion'], saved))
+    if args.flow_cache:
+        stats = model.flow_cache_stats()
+        print ('Flow cache: %s of %s pairs reused flow from %s' % (
+            stats['hit'], stats['hit'] + stats['miss'], args.flow_cache))
+
+
+def make_inference_rational_batch(model, I0, I1, ratios, rthreshold=0.02, maxcycles=8, UHD=False, always_interp=False, timestep=False, pairs=None):
+    # interpolates N x C x H x W batches of pairs with individual ratio for each pair.
+    # By default ratio is reached by bisection with pairs that still need
+    # to be bisected further sent to the model together.
+    # With timestep=True frames are synthesized at given ratio directly
+    # from a single flow estimate for each source pair, pairs optionally lists
+    # a source pair id per row so rows of the same source frames share it
+    I0 = I0.clone()
+    I1 = I1.clone()
+    I0_ratios = [0.0] * len(ratios)
+    I1_ratios = [1.0] * len(ratios)
+    result = [None] * len(ratios)
+    active = []
+
+    for index, ratio in enumerate(ratios):
+        if not always_interp:
+            if ratio <= I0_ratios[index] + rthreshold / 2:
+                result[index] = I0[index:index + 1]
+                continue
+            if ratio >= I1_ratios[index] - rthreshold / 2:
+                result[index] = I1[index:index + 1]
+                continue
+        active.append(index)
+
+    if timestep and active:
+        active_pairs = None if pairs is None else [pairs[index] for index in active]
+        middle = model.inference_timestep(I0[active], I1[active], [ratios[index] for index in active], UHD, active_pairs)
+        for middle_index, index in enumerate(active):
+            result[index] = middle[middle_index:middle_index + 1]
+        return torch.cat(result, 0)
+
+    for inference_cycle in range(0, maxcycles):
+        if not active:
+            break
+
+        # only the first pass runs on source frames, later ones are not worth caching
+        middle = model.inference_batch(I0[active], I1[active], UHD, cache_flow = inference_cycle == 0)
+        still_active = []
+
+        for middle_index, index in enumerate(active):
+            ratio = ratios[index]
+            middle_ratio = (I0_ratios[index] + I1_ratios[index]) / 2
+            result[index] = middle[middle_index:middle_index + 1]
+
+            if not always_interp:
+                if ratio - (rthreshold / 2) <= middle_ratio <= ratio + (rthreshold / 2):
+                    continue
+
+            if ratio > middle_ratio:
+                I0[index] = middle[middle_index]
+                I0_ratios[index] = middle_ratio
+            else:
+                I1[index] = middle[middle_index]
+                I1_ratios[index] = middle_ratio
+            still_active.append(index)
+
+        active = still_active
+
+    return torch.cat(result, 0)
+
+
+def make_inference_rational_cpu(model, I0, I1, ratios, frame_nums, w, h, write_buffer, rthreshold=0.02, maxcycles=8, UHD=False, always_interp=False, timestep=False, pairs=None):
+    # renders a batch of output frames in a CPU worker process
+    # I0 and I1 are N x C x H x W batches, ratios and frame_nums are lists of N
+    torch.set_grad_enabled(False)
+
+    middles = make_inference_rational_batch(model, I0, I1, ratios, rthreshold=rthreshold, maxcycles=maxcycles, UHD=UHD, always_interp=always_interp, timestep=timestep, pairs=pairs)
+    for index, frame_num in enumerate(frame_nums):
+        middle = (((middles[index]).cpu().detach().numpy().transpose(1, 2, 0)))
+        write_buffer.put((frame_num, middle[:h, :w]))
+    return
@@ -3,8 +3,6 @@ import numpy as np
 import torch.nn as nn
 import torch.nn.functional as F
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
 
 class EPE(nn.Module):
     def __init__(self):
@@ -21,10 +19,10 @@ class Ternary(nn.Module):
         super(Ternary, self).__init__()
         patch_size = 7
         out_channels = patch_size * patch_size
-        self.w = np.eye(out_channels).reshape(
+        w = np.eye(out_channels).reshape(
             (patch_size, patch_size, 1, out_channels))
-        self.w = np.transpose(self.w, (3, 2, 0, 1))
-        self.w = torch.tensor(self.w).float().to(device)
+        w = np.transpose(w, (3, 2, 0, 1))
+        self.register_buffer('w', torch.tensor(w).float(), persistent=False)
 
     def transform(self, img):
         patches = F.conv2d(img, self.w, padding=3, bias=None)
@@ -57,14 +55,14 @@ class Ternary(nn.Module):
 class SOBEL(nn.Module):
     def __init__(self):
         super(SOBEL, self).__init__()
-        self.kernelX = torch.tensor([
+        kernelX = torch.tensor([
             [1, 0, -1],
             [2, 0, -2],
             [1, 0, -1],
         ]).float()
-        self.kernelY = self.kernelX.clone().T
-        self.kernelX = self.kernelX.unsqueeze(0).unsqueeze(0).to(device)
-        self.kernelY = self.kernelY.unsqueeze(0).unsqueeze(0).to(device)
+        kernelY = kernelX.clone().T
+        self.register_buffer('kernelX', kernelX.unsqueeze(0).unsqueeze(0), persistent=False)
+        self.register_buffer('kernelY', kernelY.unsqueeze(0).unsqueeze(0), persistent=False)
 
     def forward(self, pred, gt):
         N, C, H, W = pred.shape[0], pred.shape[1], pred.shape[2], pred.shape[3]
@@ -81,6 +79,7 @@ class SOBEL(nn.Module):
 
 
 if __name__ == '__main__':
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     img0 = torch.zeros(3, 3, 256, 256).float().to(device)
     img1 = torch.tensor(np.random.normal(
         0, 1, (3, 3, 256, 256))).float().to(device)
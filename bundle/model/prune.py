@@ -0,0 +1,143 @@
+import torch
+import torch.nn as nn
+from model.IFNet_HD import IFBlock
+
+# Structured channel pruning of RIFE_HD networks.
+# Channels are removed in groups that have to shrink together:
+# - inner channels of every ResBlock (conv1 outputs / conv2 inputs) in flownet and fusionnet,
+# - width of every IFBlock, shared by its conv0 output, all of its ResBlocks
+#   (identity shortcuts) and its output convolution input.
+# Pruned models store shapes of their layers in config.json and
+# Model.load_model resizes freshly built networks with resize_modules()
+
+
+def resized_layers(net):
+    return [(name, module) for name, module in net.named_modules()
+            if isinstance(module, (nn.Conv2d, nn.ConvTranspose2d, nn.BatchNorm2d, nn.PReLU))]
+
+
+def layer_shapes(net):
+    return {name: list(module.weight.shape) for name, module in resized_layers(net)}
+
+
+def set_param(module, name, value):
+    old = getattr(module, name)
+    if isinstance(old, nn.Parameter):
+        setattr(module, name, nn.Parameter(value, requires_grad=old.requires_grad))
+    else:
+        setattr(module, name, value)
+
+
+def resize_modules(net, shapes):
+    # gives layers the weight shapes of a pruned model, values are loaded afterwards
+    for name, module in resized_layers(net):
+        shape = shapes.get(name)
+        if shape is None or list(module.weight.shape) == shape:
+            continue
+        weight = module.weight
+        set_param(module, 'weight', torch.empty(shape, device=weight.device, dtype=weight.dtype))
+        if isinstance(module, nn.PReLU):
+            module.num_parameters = shape[0]
+            continue
+        if isinstance(module, nn.BatchNorm2d):
+            module.num_features = shape[0]
+            for k in ('bias', 'running_mean', 'running_var'):
+                set_param(module, k, torch.empty(shape[0], device=weight.device, dtype=getattr(module, k).dtype))
+            continue
+        if isinstance(module, nn.ConvTranspose2d):
+            module.in_channels, module.out_channels = shape[0], shape[1] * module.groups
+        else:
+            module.out_channels, module.in_channels = shape[0], shape[1] * module.groups
+        if module.bias is not None:
+            set_param(module, 'bias', torch.empty(module.out_channels, device=weight.device, dtype=weight.dtype))
+
+
+def keep_outputs(module, index):
+    # keeps output channels / features listed in index
+    if isinstance(module, nn.PReLU):
+        if module.num_parameters > 1:
+            set_param(module, 'weight', module.weight.data[index].clone())
+            module.num_parameters = len(index)
+        return
+    if isinstance(module, nn.BatchNorm2d):
+        for k in ('weight', 'bias', 'running_mean', 'running_var'):
+            set_param(module, k, getattr(module, k).data[index].clone())
+        module.num_features = len(index)
+        return
+    if isinstance(module, nn.ConvTranspose2d):
+        set_param(module, 'weight', module.weight.data[:, index].clone())
+    else:
+        set_param(module, 'weight', module.weight.data[index].clone())
+    if module.bias is not None:
+        set_param(module, 'bias', module.bias.data[index].clone())
+    module.out_channels = len(index)
+
+
+def keep_inputs(module, index):
+    if isinstance(module, nn.ConvTranspose2d):
+        set_param(module, 'weight', module.weight.data[index].clone())
+    else:
+        set_param(module, 'weight', module.weight.data[:, index].clone())
+    module.in_channels = len(index)
+
+
+def prune_groups(net):
+    # returns channel groups of a network as dicts with
+    # name, outputs (layers losing output channels), inputs (layers losing input channels)
+    # and measure (modules whose output activations rank the channels)
+    groups = []
+    for name, module in net.named_modules():
+        if hasattr(module, 'fc1') and hasattr(module, 'conv2'):
+            # ResBlock inner channels
+            groups.append({
+                'name': name + '.conv1',
+                'outputs': [m for m in module.conv1 if not isinstance(m, nn.PReLU) or m.num_parameters > 1],
+                'inputs': [module.conv2[0]],
+                'measure': [module.conv1]})
+        if isinstance(module, IFBlock):
+            res = [getattr(module, 'res%d' % i) for i in range(module.depth)]
+            outputs = list(module.conv0)
+            inputs = [module.conv1]
+            for r in res:
+                if not isinstance(r.conv0, nn.Identity):
+                    raise ValueError('%s has projection shortcuts, block width can not be pruned' % name)
+                outputs += list(r.conv2) + [r.relu2, r.fc2]
+                inputs += [r.conv1[0], r.fc1]
+            groups.append({'name': name, 'outputs': outputs, 'inputs': inputs, 'measure': [module.conv0] + res})
+    return groups
+
+
+def weight_importance(group):
+    # batch norm scale if the group has batch norms, L1 norm of output weights otherwise
+    bns = [m for m in group['outputs'] if isinstance(m, nn.BatchNorm2d)]
+    if bns:
+        return sum(m.weight.data.abs().float() for m in bns)
+    convs = [m for m in group['outputs'] if isinstance(m, nn.Conv2d)]
+    return sum(m.weight.data.abs().float().sum((1, 2, 3)) for m in convs)
+
+
+def add_activation_hooks(groups):
+    # accumulates mean absolute activation of every channel in each group
+    hooks = []
+    for group in groups:
+        group['activation'] = 0
+
+        def hook(module, inputs, output, group=group):
+            group['activation'] = group['activation'] + output.detach().abs().float().mean((0, 2, 3))
+        for module in group['measure']:
+            hooks.append(module.register_forward_hook(hook))
+    return hooks
+
+
+def prune_group(group, importance, ratio, multiple=8):
+    # removes ratio of the least important channels, keeping a multiple of 8 for faster kernels
+    channels = importance.shape[0]
+    keep = max(multiple, int(round(channels * (1 - ratio) / multiple)) * multiple)
+    if keep >= channels:
+        return channels
+    index = importance.topk(keep).indices.sort().values.to(group['outputs'][0].weight.device)
+    for module in group['outputs']:
+        keep_outputs(module, index)
+    for module in group['inputs']:
+        keep_inputs(module, index)
+    return keep
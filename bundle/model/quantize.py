@@ -0,0 +1,62 @@
+import torch
+import warnings
+import torch.nn as nn
+import torch.ao.quantization as quantization
+
+# int8 post-training static quantization of RIFE_HD networks.
+# Convolutions run as int8 kernels, everything in between
+# (PReLU, warps, interpolation, SE attention) stays in float
+
+
+def quantizable(module):
+    # flow and mask output convolutions and SE 1x1 convolutions stay in float
+    return isinstance(module, (nn.Conv2d, nn.ConvTranspose2d)) \
+        and module.out_channels > 16 and module.kernel_size != (1, 1)
+
+
+def fuse_conv_bn(net):
+    for name, module in net.named_modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        children = list(module.children())
+        for i in range(len(children) - 1):
+            if isinstance(children[i], nn.Conv2d) and isinstance(children[i + 1], nn.BatchNorm2d):
+                prefix = name + '.' if name else ''
+                quantization.fuse_modules(net, [[prefix + str(i), prefix + str(i + 1)]], inplace=True)
+
+
+def wrap_convs(net, qconfig):
+    # each quantized convolution gets its own quantize / dequantize pair
+    for name, module in net.named_children():
+        if quantizable(module):
+            wrapper = quantization.QuantWrapper(module)
+            if isinstance(module, nn.ConvTranspose2d):
+                # per channel weights are not supported for transposed convolutions
+                wrapper.qconfig = quantization.QConfig(
+                    activation=qconfig.activation, weight=quantization.default_weight_observer)
+            else:
+                wrapper.qconfig = qconfig
+            setattr(net, name, wrapper)
+        else:
+            wrap_convs(module, qconfig)
+
+
+def prepare_int8(model, engine='x86'):
+    # inserts observers, run inference on a few pairs afterwards to calibrate them
+    torch.backends.quantized.engine = engine
+    qconfig = quantization.get_default_qconfig(engine)
+    for net in (model.flownet, model.contextnet, model.fusionnet):
+        net.eval()
+        fuse_conv_bn(net)
+        wrap_convs(net, qconfig)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            quantization.prepare(net, inplace=True)
+
+
+def convert_int8(model):
+    with warnings.catch_warnings():
+        # observers are empty when converting only to load saved int8 weights
+        warnings.simplefilter('ignore')
+        for net in (model.flownet, model.contextnet, model.fusionnet):
+            quantization.convert(net, inplace=True)
@@ -0,0 +1,102 @@
+import os
+import json
+import socket
+from model.weights import FLAT_WEIGHTS
+from model.IFNet_HD import flow_resolution
+
+# Registry of installed models with speed / quality profiles measured on this host.
+# profile_models.py benchmarks every model folder under trained_models/<group>/
+# with each backend, precision and quality tier and stores the results in
+# trained_models/profiles.json, keyed by host name and device type.
+# Inference scripts called with --time_budget pick the profile with the best
+# PSNR against the reference model that is estimated to finish in time
+
+PROFILES = './trained_models/profiles.json'
+
+# PSNR stored for results identical to the reference
+MAX_PSNR = 100.0
+
+
+def find_models(models_folder):
+    # model folders in trained_models/<group>/<name>.model
+    models = []
+    if not os.path.isdir(models_folder):
+        return models
+    for group in sorted(os.listdir(models_folder)):
+        group_path = os.path.join(models_folder, group)
+        if not os.path.isdir(group_path):
+            continue
+        for name in sorted(os.listdir(group_path)):
+            path = os.path.join(group_path, name)
+            if os.path.isfile(os.path.join(path, 'flownet.pkl')) or os.path.isfile(os.path.join(path, FLAT_WEIGHTS)):
+                models.append(path)
+    return models
+
+
+def host_profiles(profiles, device_type):
+    return profiles.get(socket.gethostname(), {}).get(device_type, [])
+
+
+def load_profiles(path=PROFILES):
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r') as profiles_file:
+        return json.load(profiles_file)
+
+
+def save_profiles(device_type, entries, path=PROFILES):
+    # replaces profiles of this host and device, other hosts sharing the bundle are kept
+    profiles = load_profiles(path)
+    profiles.setdefault(socket.gethostname(), {})[device_type] = entries
+    tmp_path = '%s.%s.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as profiles_file:
+        json.dump(profiles, profiles_file, indent=4)
+    os.replace(tmp_path, path)
+
+
+def estimate_time(entry, w, h, frames):
+    # seconds to synthesize frames of w x h with a profile
+    return entry['sec_per_megapixel'] * (w * h / 10 ** 6) * frames
+
+
+def select_profile(entries, w, h, frames, budget):
+    # best PSNR that fits in budget (seconds), faster of equal ones.
+    # Returns (entry, estimated seconds, fits), the fastest entry if none fits
+    if not entries:
+        return None, 0, False
+    fitting = [e for e in entries if estimate_time(e, w, h, frames) <= budget]
+    if fitting:
+        entry = max(fitting, key=lambda e: (e['psnr'], -e['sec_per_megapixel']))
+    else:
+        entry = min(entries, key=lambda e: e['sec_per_megapixel'])
+    return entry, estimate_time(entry, w, h, frames), bool(fitting)
+
+
+def apply_time_budget(args, w, h, frames, device_type, workers=1, path=PROFILES):
+    # sets args.model, args.backend, args.precision and args.quality
+    # to the profile picked for args.time_budget (minutes).
+    # Profiles are measured in a single process, frames rendered by
+    # parallel CPU worker processes are shared between workers
+    if getattr(args, 'roi', None):
+        # only the region of interest with its margin goes through the model
+        from model.RIFE_HD import roi_region
+        y0, y1, x0, x1 = roi_region(args.roi, h, w)
+        w, h = x1 - x0, y1 - y0
+    # only profiles measured at the flow size of the job
+    scale = flow_resolution(getattr(args, 'UHD', False))
+    entries = [e for e in host_profiles(load_profiles(path), device_type) if flow_resolution(e.get('UHD', False)) == scale]
+    entry, estimate, fits = select_profile(entries, w, h, frames / max(1, workers), args.time_budget * 60)
+    if entry is None:
+        print ('Warning: no %s model profiles at 1/%s flow size for %s in %s, run profile_models.py first. Time budget is ignored' % (
+            device_type, round(1 / scale), socket.gethostname(), path))
+        return None
+    args.model = entry['model']
+    args.backend = entry['backend']
+    args.precision = entry['precision']
+    args.quality = entry['quality']
+    print ('Time budget %.1f min for %s frames of %s x %s%s: %s, %s, %s, %s (%.1f dB, estimated %.1f min)' % (
+        args.time_budget, frames, w, h, '' if workers <= 1 else ' on %s CPU workers' % workers,
+        entry['model'], entry['backend'], entry['precision'], entry['quality'], entry['psnr'], estimate / 60))
+    if not fits:
+        print ('Warning: the fastest profiled model does not fit in the time budget')
+    return entry
@@ -1,22 +1,32 @@
 import torch
 import torch.nn as nn
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-backwarp_tenGrid = {}
-
 
 def warp(tenInput, tenFlow):
-    k = (str(tenFlow.device), str(tenFlow.size()))
-    if k not in backwarp_tenGrid:
-        tenHorizontal = torch.linspace(-1.0, 1.0, tenFlow.shape[3]).view(
-            1, 1, 1, tenFlow.shape[3]).expand(tenFlow.shape[0], -1, tenFlow.shape[2], -1)
-        tenVertical = torch.linspace(-1.0, 1.0, tenFlow.shape[2]).view(
-            1, 1, tenFlow.shape[2], 1).expand(tenFlow.shape[0], -1, -1, tenFlow.shape[3])
-        backwarp_tenGrid[k] = torch.cat(
-            [tenHorizontal, tenVertical], 1).to(device)
+    _, _, h, w = tenFlow.shape
+    dtype = torch.promote_types(tenFlow.dtype, torch.float32)
+
+    # base grid is built per call in grid_sample (N, H, W, 2) layout
+    # and broadcast over the batch, flow is scaled onto it in a single addcmul
+    tenHorizontal = torch.linspace(-1.0, 1.0, w, device=tenFlow.device, dtype=dtype).view(1, 1, w).expand(1, h, w)
+    tenVertical = torch.linspace(-1.0, 1.0, h, device=tenFlow.device, dtype=dtype).view(1, h, 1).expand(1, h, w)
+    tenGrid = torch.stack([tenHorizontal, tenVertical], 3)
+    tenScale = torch.tensor([2.0 / (tenInput.shape[3] - 1.0), 2.0 / (tenInput.shape[2] - 1.0)], device=tenFlow.device, dtype=dtype)
+    g = torch.addcmul(tenGrid, tenFlow.permute(0, 2, 3, 1), tenScale).clamp_(-1, 1)
+
+    output = torch.nn.functional.grid_sample(input=tenInput, grid=g, mode='bilinear', padding_mode='zeros', align_corners=True)
+    if tenInput.stride(1) == 1 and tenInput.shape[1] > 1:
+        # grid_sample returns NCHW, keep channels_last inputs channels_last
+        # so the following convolutions do not reorder them again
+        output = output.contiguous(memory_format=torch.channels_last)
+    return output
 
-    tenFlow = torch.cat([tenFlow[:, 0:1, :, :] / ((tenInput.shape[3] - 1.0) / 2.0),
-                         tenFlow[:, 1:2, :, :] / ((tenInput.shape[2] - 1.0) / 2.0)], 1)
 
-    g = (backwarp_tenGrid[k] + tenFlow).permute(0, 2, 3, 1)
-    return torch.nn.functional.grid_sample(input=tenInput, grid=torch.clamp(g, -1, 1), mode='bilinear', padding_mode='zeros', align_corners=True)
+def warp_pair(tenInputs, tenFlow, tenFlow1=None):
+    # warps a pair stacked along the batch axis in a single call:
+    # first half of tenInputs with tenFlow, second half with tenFlow1 (-tenFlow by default)
+    if tenFlow1 is None:
+        tenFlow1 = -tenFlow
+    n = tenFlow.shape[0]
+    warped = warp(tenInputs, torch.cat((tenFlow, tenFlow1), 0))
+    return warped[:n], warped[n:]
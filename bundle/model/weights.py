@@ -0,0 +1,90 @@
+import os
+import json
+import struct
+import numpy as np
+import torch
+
+# flat weight file: 8 byte header length, json header with name, dtype, shape
+# and offset of every tensor, then raw tensor data aligned to 64 bytes.
+# Keys are stored without DDP module. prefix, as <net>.<parameter name>.
+# The file is memory mapped copy-on-write, so processes loading the same file
+# share its pages in the page cache instead of holding a private copy each
+
+FLAT_WEIGHTS = 'weights.bin'
+ALIGNMENT = 64
+
+# numpy has no bfloat16, 2 byte tensors are stored as int16 and viewed back
+storage_dtypes = {1: np.uint8, 2: np.int16, 4: np.int32, 8: np.int64}
+
+
+def save_flat(state_dicts, path):
+    # state_dicts maps net name to its state_dict
+    header = {}
+    offset = 0
+    tensors = []
+    for net_name, state_dict in state_dicts.items():
+        for k, v in state_dict.items():
+            if not isinstance(v, torch.Tensor) or v.is_quantized:
+                raise ValueError('%s.%s is not a plain tensor, flat weights support float models only' % (net_name, k))
+            v = v.detach().cpu().contiguous()
+            header['%s.%s' % (net_name, k)] = {
+                'dtype': str(v.dtype).replace('torch.', ''),
+                'shape': list(v.shape),
+                'offset': offset}
+            tensors.append(v)
+            offset += ((v.numel() * v.element_size() + ALIGNMENT - 1) // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = ((8 + len(header_bytes) + ALIGNMENT - 1) // ALIGNMENT) * ALIGNMENT
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for info, v in zip(header.values(), tensors):
+            f.seek(data_start + info['offset'])
+            f.write(v.view(-1).view(torch.uint8).numpy().tobytes() if v.numel() else b'')
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+def load_flat(path):
+    # returns net name -> state_dict with tensors backed by the mapped file
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size).decode('utf-8'))
+    data_start = ((8 + header_size + ALIGNMENT - 1) // ALIGNMENT) * ALIGNMENT
+    data = np.memmap(path, dtype=np.uint8, mode='c')
+    state_dicts = {}
+    for name, info in header.items():
+        net_name, k = name.split('.', 1)
+        dtype = getattr(torch, info['dtype'])
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        numel = int(np.prod(info['shape']))
+        start = data_start + info['offset']
+        array = data[start:start + numel * itemsize].view(storage_dtypes[itemsize])
+        tensor = torch.from_numpy(array).view(dtype).view(info['shape'])
+        state_dicts.setdefault(net_name, {})[k] = tensor
+    return state_dicts
+
+
+def load_state_dict(net, state_dict, assign=False):
+    # assign keeps parameters backed by the mapped file instead of copying them,
+    # torch versions without assign= copy
+    if assign:
+        try:
+            return net.load_state_dict(state_dict, assign=True)
+        except TypeError:
+            pass
+    return net.load_state_dict(state_dict)
+
+
+def flat_weights_path(path):
+    # flat weights file of a model folder if it is there and not older than .pkl files
+    flat_path = os.path.join(path, FLAT_WEIGHTS)
+    if not os.path.isfile(flat_path):
+        return None
+    for name in ('flownet.pkl', 'contextnet.pkl', 'unet.pkl'):
+        pkl_path = os.path.join(path, name)
+        if os.path.isfile(pkl_path) and os.path.getmtime(pkl_path) > os.path.getmtime(flat_path):
+            print ('%s is older than %s, loading .pkl weights' % (flat_path, pkl_path))
+            return None
+    return flat_path
@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+import torch
+import argparse
+import numpy as np
+import warnings
+warnings.filterwarnings("ignore")
+
+from model.RIFE_HD import Model, QUALITY_TIERS, FLOW_SCALES, flow_padding
+from model.calibration import read_pairs, to_tensor, psnr
+from model.registry import PROFILES, MAX_PSNR, find_models, save_profiles
+from dataset import FramePairDataset
+
+# Measures speed and quality of every installed model on this host.
+# Each model folder under trained_models/<group>/ is run with every backend,
+# precision and quality tier. Speed is stored as seconds and frames per megapixel,
+# quality as PSNR against the reference model at final quality in fp32.
+# Inference scripts called with --time_budget pick a model from these profiles
+
+def synchronize(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+def load(path, backend, device):
+    if backend == 'onnx':
+        from model.RIFE_HD_onnx import Model as OnnxModel
+        model = OnnxModel(device=device)
+    else:
+        model = Model(device=device)
+    model.load_model(path, -1)
+    model.eval()
+    model.device()
+    return model
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure speed and quality of installed models on this host')
+    parser.add_argument('--models', dest='models', type=str, default='./trained_models', help='folder with model groups')
+    parser.add_argument('--reference', dest='reference', type=str, default='./trained_models/default/v1.8.model', help='model to measure PSNR against')
+    parser.add_argument('--profiles', dest='profiles', type=str, default=PROFILES, help='file to store profiles in')
+    parser.add_argument('--calibration', dest='calibration', type=str, default=None, help='folder with exr sequence to measure on, synthetic pairs if not set')
+    parser.add_argument('--pairs', dest='pairs', type=int, default=4, help='number of frame pairs to use')
+    parser.add_argument('--crop', dest='crop', type=int, default=512, help='synthetic pairs size')
+    parser.add_argument('--UHD', dest='UHD', action='store_true', help='flow size 1/4')
+    parser.add_argument('--flow_scale', dest='flow_scale', type=float, default=0, choices=(0, ) + FLOW_SCALES, help='flow size relative to the frame, overrides --UHD')
+    parser.add_argument('--backends', dest='backends', type=str, default='torch,onnx', help='comma separated backends to measure')
+    parser.add_argument('--precisions', dest='precisions', type=str, default='fp32,bf16,fp16', help='comma separated precisions to measure')
+    parser.add_argument('--qualities', dest='qualities', type=str, default=','.join(QUALITY_TIERS), help='comma separated quality tiers to measure')
+    parser.add_argument('--compile_cache', dest='compile_cache', type=str, default='./compiled_models', help='folder to cache onnx graphs in')
+    parser.add_argument('--cpu', dest='cpu', action='store_true', help='measure on CPU')
+    args = parser.parse_args()
+    if args.flow_scale:
+        # UHD argument of the model carries the flow size
+        args.UHD = args.flow_scale
+
+    device = torch.device('cuda' if torch.cuda.is_available() and not args.cpu else 'cpu')
+    torch.set_grad_enabled(False)
+    if device.type == 'cuda':
+        torch.backends.cudnn.enabled = True
+        torch.backends.cudnn.benchmark = True
+
+    models = find_models(args.models)
+    if not models:
+        print ('no models found in %s' % args.models)
+        sys.exit()
+
+    if args.calibration:
+        pairs = read_pairs(args.calibration, args.pairs)
+        if not pairs:
+            print('not enough frames to measure on: at least 2 needed')
+            sys.exit()
+        h, w, _ = pairs[0][0].shape
+        pad = max(64, flow_padding(args.UHD))
+        ph = ((h - 1) // pad + 1) * pad
+        pw = ((w - 1) // pad + 1) * pad
+        padding = (0, pw - w, 0, ph - h)
+        pairs = [(to_tensor(img0, padding).to(device), to_tensor(img1, padding).to(device)) for img0, img1 in pairs]
+    else:
+        h = w = ph = pw = args.crop
+        synthetic = FramePairDataset(None, args.crop, length=args.pairs)
+        pairs = [(imgs[:3].unsqueeze(0).to(device), imgs[3:].unsqueeze(0).to(device))
+                 for imgs in (synthetic[i] for i in range(len(synthetic)))]
+    megapixels = w * h / 10 ** 6
+
+    reference_model = load(args.reference, 'torch', device)
+    references = [reference_model.inference(I0, I1, args.UHD)[:, :, :h, :w] for I0, I1 in pairs]
+    del reference_model
+    print ('Reference model: %s, measuring %s models on %s pairs of %s x %s frames (%s)' % (
+        args.reference, len(models), len(pairs), w, h, device.type))
+
+    entries = []
+    print ('%-48s %-6s %-6s %-8s %10s %10s %10s' % ('model', 'backend', 'prec', 'quality', 'fps/MP', 'PSNR', 'min PSNR'))
+    for path in models:
+        for backend in args.backends.split(','):
+            try:
+                model = load(path, backend, device)
+                if backend == 'onnx':
+                    import onnxruntime     # type: ignore
+                    model.enable_compile(args.compile_cache)
+            except (ImportError, RuntimeError) as e:
+                print ('%s with %s backend skipped: %s' % (path, backend, e))
+                continue
+            measured = set()
+            for precision in args.precisions.split(','):
+                model.set_precision(precision)
+                for quality in args.qualities.split(','):
+                    # unsupported precisions fall back to the ones already measured
+                    if (model.precision, quality) in measured:
+                        continue
+                    measured.add((model.precision, quality))
+                    model.set_quality(quality)
+                    # first pass compiles graphs and picks kernels
+                    model.inference(pairs[0][0], pairs[0][1], args.UHD)
+                    synchronize(device)
+                    psnr_list = []
+                    elapsed = 0
+                    for (I0, I1), reference in zip(pairs, references):
+                        start = time.time()
+                        result = model.inference(I0, I1, args.UHD)
+                        synchronize(device)
+                        elapsed += time.time() - start
+                        psnr_list.append(psnr(reference, result[:, :, :h, :w].float(), MAX_PSNR))
+                    sec_per_megapixel = elapsed / len(pairs) / megapixels
+                    entry = {
+                        'model': path,
+                        'backend': backend,
+                        'precision': model.precision,
+                        'quality': quality,
+                        'sec_per_megapixel': sec_per_megapixel,
+                        'fps_per_megapixel': 1 / sec_per_megapixel,
+                        'psnr': float(np.mean(psnr_list)),
+                        'min_psnr': float(np.min(psnr_list)),
+                        'width': w,
+                        'height': h,
+                        'UHD': args.UHD,
+                        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    }
+                    entries.append(entry)
+                    print ('%-48s %-6s %-6s %-8s %10.3f %10.2f %10.2f' % (
+                        path, backend, entry['precision'], quality, entry['fps_per_megapixel'], entry['psnr'], entry['min_psnr']))
+            del model
+
+    save_profiles(device.type, entries, args.profiles)
+    print ('%s profiles saved: %s' % (len(entries), args.profiles))
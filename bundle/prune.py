@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+import torch
+import random
+import argparse
+import numpy as np
+from torch.utils.data import DataLoader
+import warnings
+warnings.filterwarnings("ignore")
+
+from model.RIFE_HD import Model
+from model.calibration import read_pairs, to_tensor, psnr
+from model.prune import prune_groups, weight_importance, add_activation_hooks, prune_group, layer_shapes
+from dataset import FramePairDataset
+from finetune import finetune
+
+# Builds a channel pruned copy of a trained model.
+# Channels are ranked by mean activation on sample frame pairs (or batch norm scale / weight norm)
+# and the least important ones are removed from flownet and fusionnet ResBlocks and IFBlocks.
+# The pruned model is optionally fine-tuned against the original one without ground truth frames,
+# then compared with it on held out pairs. The pruned model folder is used with --model in inference scripts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prune channels of a trained model')
+    parser.add_argument('--model', dest='model', type=str, default='./trained_models/default/v1.8.model')
+    parser.add_argument('--output', dest='output', type=str, default=None, help='folder to save pruned model to')
+    parser.add_argument('--ratio', dest='ratio', type=float, default=0.25, help='share of channels to remove in every group')
+    parser.add_argument('--criterion', dest='criterion', type=str, default='activation', choices=['activation', 'weight'], help='rank channels by mean activation on sample pairs or by batch norm scale / weight norm')
+    parser.add_argument('--calibration', dest='calibration', type=str, default=None, help='folder with exr sequence to rank channels and report on, synthetic pairs if not set')
+    parser.add_argument('--pairs', dest='pairs', type=int, default=8, help='number of frame pairs to use')
+    parser.add_argument('--UHD', dest='UHD', action='store_true', help='flow size 1/4')
+    parser.add_argument('--finetune_steps', dest='finetune_steps', type=int, default=0, help='fine-tune pruned model against the original one, 0 - no fine-tuning')
+    parser.add_argument('--data', dest='data', type=str, default=None, help='folder with image sequences to fine-tune on, synthetic pairs if not set')
+    parser.add_argument('--batch_size', dest='batch_size', type=int, default=8)
+    parser.add_argument('--crop', dest='crop', type=int, default=256, help='fine-tuning crop size, multiple of 64')
+    parser.add_argument('--lr', dest='lr', type=float, default=1e-4)
+    parser.add_argument('--workers', dest='workers', type=int, default=4, help='data loader workers')
+    parser.add_argument('--cpu', dest='cpu', action='store_true', help='run on CPU')
+    args = parser.parse_args()
+    if args.output is None:
+        parser.print_help()
+        sys.exit()
+
+    device = torch.device('cuda' if torch.cuda.is_available() and not args.cpu else 'cpu')
+    random.seed(1234)
+    np.random.seed(1234)
+    torch.manual_seed(1234)
+    torch.set_grad_enabled(False)
+
+    if args.calibration:
+        pairs = read_pairs(args.calibration, args.pairs)
+        if not pairs:
+            print('not enough frames to calibrate: at least 2 needed')
+            sys.exit()
+        h, w, _ = pairs[0][0].shape
+        ph = ((h - 1) // 64 + 1) * 64
+        pw = ((w - 1) // 64 + 1) * 64
+        padding = (0, pw - w, 0, ph - h)
+        pairs = [(to_tensor(img0, padding).to(device), to_tensor(img1, padding).to(device)) for img0, img1 in pairs]
+    else:
+        h = w = args.crop
+        synthetic = FramePairDataset(None, args.crop, length=args.pairs)
+        pairs = [(imgs[:3].unsqueeze(0).to(device), imgs[3:].unsqueeze(0).to(device))
+                 for imgs in (synthetic[i] for i in range(len(synthetic)))]
+    # every other pair is held out from ranking for the report
+    ranking_pairs = pairs[::2]
+    test_pairs = pairs[1::2] if len(pairs) > 1 else pairs
+
+    model = Model(device=device)
+    model.load_model(args.model, -1)
+    model.eval()
+    if model.quantized:
+        print ('%s is an int8 quantized model, prune the float model it was made from' % args.model)
+        sys.exit()
+    print ('Trained model loaded: %s' % args.model)
+
+    pruned_model = Model(device=device)
+    pruned_model.load_model(args.model, -1)
+    pruned_model.eval()
+    groups = prune_groups(pruned_model.flownet) + prune_groups(pruned_model.fusionnet)
+    if args.criterion == 'activation':
+        hooks = add_activation_hooks(groups)
+        print ('Ranking channels on %s pairs of %s x %s frames...' % (len(ranking_pairs), w, h))
+        for I0, I1 in ranking_pairs:
+            pruned_model.inference(I0, I1, args.UHD)
+        for hook in hooks:
+            hook.remove()
+        importance = [group['activation'] for group in groups]
+    else:
+        importance = [weight_importance(group) for group in groups]
+    # all groups are ranked before any of them is pruned
+    channels_before = 0
+    channels_after = 0
+    for group, group_importance in zip(groups, importance):
+        channels_before += group_importance.shape[0]
+        channels_after += prune_group(group, group_importance, args.ratio)
+    pruned_model.init_optimizer()
+    parameters = sum(p.numel() for net in (model.flownet, model.fusionnet) for p in net.parameters())
+    pruned_parameters = sum(p.numel() for net in (pruned_model.flownet, pruned_model.fusionnet) for p in net.parameters())
+    print ('Pruned %s groups: %s of %s channels left, flownet + fusionnet parameters %.1fM -> %.1fM' % (
+        len(groups), channels_after, channels_before, parameters / 1e6, pruned_parameters / 1e6))
+
+    if args.finetune_steps:
+        # pruned model output is pushed towards the original model output
+        dataset = FramePairDataset(args.data, args.crop, length=args.finetune_steps * args.batch_size)
+        train_data = DataLoader(dataset, batch_size=args.batch_size, shuffle=True, drop_last=True, num_workers=args.workers)
+        pruned_model.flownet.train()
+        pruned_model.fusionnet.train()
+        pruned_model.contextnet.requires_grad_(False)
+        finetune(model, pruned_model.flownet, pruned_model.predict,
+                 list(pruned_model.flownet.parameters()) + list(pruned_model.fusionnet.parameters()),
+                 train_data, args.finetune_steps, args.lr, device)
+        pruned_model.eval()
+
+    psnr_list = []
+    full_time = 0
+    pruned_time = 0
+    for I0, I1 in test_pairs:
+        start = time.time()
+        reference = model.inference(I0, I1, args.UHD)[:, :, :h, :w]
+        full_time += time.time() - start
+        start = time.time()
+        result = pruned_model.inference(I0, I1, args.UHD)[:, :, :h, :w]
+        pruned_time += time.time() - start
+        psnr_list.append(psnr(reference, result))
+
+    report = {
+        'ratio': args.ratio,
+        'criterion': args.criterion,
+        'finetune_steps': args.finetune_steps,
+        'pairs': len(test_pairs),
+        'psnr': float(np.mean(psnr_list)),
+        'min_psnr': float(np.min(psnr_list)),
+        'full_sec_per_frame': full_time / len(test_pairs),
+        'pruned_sec_per_frame': pruned_time / len(test_pairs),
+    }
+    print ('---\npruned against full model on %s held out pairs:' % report['pairs'])
+    print ('PSNR: %.2f dB (min %.2f dB)' % (report['psnr'], report['min_psnr']))
+    print ('full: %.3f sec per frame, pruned: %.3f sec per frame (%.2fx)\n---' % (
+        report['full_sec_per_frame'], report['pruned_sec_per_frame'], report['full_sec_per_frame'] / report['pruned_sec_per_frame']))
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+    pruned_model.save_model(args.output, 0)
+    # size of distilled source flownet is kept
+    config = model.load_config(args.model)
+    config.update({
+        'pruned': {
+            'flownet': layer_shapes(pruned_model.flownet),
+            'fusionnet': layer_shapes(pruned_model.fusionnet)},
+        'source_model': os.path.abspath(args.model),
+        'report': report
+        })
+    with open(os.path.join(args.output, 'config.json'), 'w') as config_file:
+        json.dump(config, config_file, indent=4)
+    print ('Pruned model saved: %s' % args.output)
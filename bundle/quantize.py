@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import time
+import torch
+import argparse
+import numpy as np
+import warnings
+warnings.filterwarnings("ignore")
+
+from model.RIFE_HD import Model
+from model.quantize import prepare_int8, convert_int8
+from model.calibration import read_pairs, to_tensor, psnr
+from benchmark.pytorch_msssim import ssim_matlab
+
+# Builds int8 quantized copy of a trained model.
+# Observers are calibrated on pairs of consecutive frames from an exr sequence,
+# then int8 and fp32 results are compared on the pairs held out from calibration.
+# The quantized model folder is used with --model and --cpu in inference scripts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quantize model to int8 for CPU inference')
+    parser.add_argument('--model', dest='model', type=str, default='./trained_models/default/v1.8.model')
+    parser.add_argument('--calibration', dest='calibration', type=str, default=None, help='folder with exr sequence to calibrate on')
+    parser.add_argument('--output', dest='output', type=str, default=None, help='folder to save quantized model to')
+    parser.add_argument('--pairs', dest='pairs', type=int, default=8, help='number of frame pairs to use')
+    parser.add_argument('--UHD', dest='UHD', action='store_true', help='flow size 1/4')
+    parser.add_argument('--engine', dest='engine', type=str, default='x86', choices=['x86', 'fbgemm', 'onednn', 'qnnpack'], help='quantized kernels backend')
+    args = parser.parse_args()
+    if (args.calibration is None or args.output is None):
+        parser.print_help()
+        sys.exit()
+
+    torch.set_grad_enabled(False)
+    device = torch.device('cpu')
+
+    pairs = read_pairs(args.calibration, args.pairs)
+    if not pairs:
+        print('not enough frames to calibrate: at least 2 needed')
+        sys.exit()
+    h, w, _ = pairs[0][0].shape
+    ph = ((h - 1) // 64 + 1) * 64
+    pw = ((w - 1) // 64 + 1) * 64
+    padding = (0, pw - w, 0, ph - h)
+    pairs = [(to_tensor(img0, padding), to_tensor(img1, padding)) for img0, img1 in pairs]
+
+    # every other pair is held out from calibration for the report
+    calibration_pairs = pairs[::2]
+    test_pairs = pairs[1::2] if len(pairs) > 1 else pairs
+
+    model = Model(device=device)
+    model.load_model(args.model, -1)
+    model.eval()
+    print ('Trained model loaded: %s' % args.model)
+
+    quantized_model = Model(device=device)
+    quantized_model.load_model(args.model, -1)
+    quantized_model.eval()
+    prepare_int8(quantized_model, args.engine)
+    print ('Calibrating on %s pairs of %s x %s frames...' % (len(calibration_pairs), w, h))
+    for I0, I1 in calibration_pairs:
+        quantized_model.inference(I0, I1, args.UHD)
+    convert_int8(quantized_model)
+
+    psnr_list = []
+    ssim_list = []
+    fp32_time = 0
+    int8_time = 0
+    for I0, I1 in test_pairs:
+        start = time.time()
+        reference = model.inference(I0, I1, args.UHD)[:, :, :h, :w]
+        fp32_time += time.time() - start
+        start = time.time()
+        result = quantized_model.inference(I0, I1, args.UHD)[:, :, :h, :w]
+        int8_time += time.time() - start
+        psnr_list.append(psnr(reference, result))
+        ssim_list.append(float(ssim_matlab(reference.clamp(0, 1), result.clamp(0, 1), val_range=1)))
+
+    report = {
+        'pairs': len(test_pairs),
+        'psnr': float(np.mean(psnr_list)),
+        'min_psnr': float(np.min(psnr_list)),
+        'ssim': float(np.mean(ssim_list)),
+        'fp32_sec_per_frame': fp32_time / len(test_pairs),
+        'int8_sec_per_frame': int8_time / len(test_pairs),
+    }
+    print ('---\nint8 against fp32 on %s held out pairs:' % report['pairs'])
+    print ('PSNR: %.2f dB (min %.2f dB), SSIM: %.4f' % (report['psnr'], report['min_psnr'], report['ssim']))
+    print ('fp32: %.2f sec per frame, int8: %.2f sec per frame (%.2fx)\n---' % (
+        report['fp32_sec_per_frame'], report['int8_sec_per_frame'], report['fp32_sec_per_frame'] / report['int8_sec_per_frame']))
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+    quantized_model.save_model(args.output, 0)
+    # size of distilled or pruned source networks is kept
+    config = model.load_config(args.model)
+    config.update({
+        'quantization': 'int8',
+        'engine': args.engine,
+        'source_model': os.path.abspath(args.model),
+        'report': report
+        })
+    with open(os.path.join(args.output, 'config.json'), 'w') as config_file:
+        json.dump(config, config_file, indent=4)
+    print ('Quantized model saved: %s' % args.output)
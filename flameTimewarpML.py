@@ -754,6 +754,104 @@ class flameTimewrapML(flameMenuApp):
         self.dedup_mode = 0
         self.cpu = False
         self.UHD = True
+        self.roi = ''
+
+    def roi_values(self):
+        # x,y,w,h region of interest in pixels set in the current dialog, None if not set or invalid
+        roi = self.roi.split(',')
+        if len(roi) != 4 or not all(v.isdigit() for v in roi):
+            return None
+        return roi
+
+    def roi_arg(self):
+        # --roi option for the region of interest
+        roi = self.roi_values()
+        if roi is None:
+            return ''
+        return ' --roi ' + ','.join(roi)
+
+    def roi_style(self):
+        # region field is highlighted while a region is set, red if it is not x,y,w,h
+        if not self.roi:
+            return ('QLineEdit {color: #9a9a9a; background-color: #373e47; border-top: 1px inset #black; border-bottom: 1px inset #545454}'
+                    'QToolTip {color: black; background-color: #ffffd9; border: 0px}')
+        color = '#d9d9d9' if self.roi_values() else '#d96c6c'
+        return ('QLineEdit {font:italic; color: %s; background-color: #4f4f4f; border-top: 1px inset black; border-bottom: 1px inset #555555}'
+                'QToolTip {color: black; background-color: #ffffd9; border: 0px}' % color)
+
+    def flow_cache_arg(self):
+        # --flow_cache option, flow is kept in the working folder
+        # so renders of the same source with new timings skip flownet
+        if not self.prefs.get('flow_cache', False):
+            return ''
+        return ' --flow_cache ' + os.path.join(self.working_folder, 'flow_cache')
+
+    def flow_cache_button(self, window):
+        # 'Cache flow' toggle of the flow_cache pref
+        from PySide2 import QtWidgets, QtCore
+
+        style_on = ('QPushButton {font:italic; background-color: #4f4f4f; color: #d9d9d9; border-top: 1px inset black; border-bottom: 1px inset #555555}'
+                    'QToolTip {color: black; background-color: #ffffd9; border: 0px}')
+        style_off = ('QPushButton {color: #989898; background-color: #373737; border-top: 1px inset #555555; border-bottom: 1px inset black}'
+                    'QToolTip {color: black; background-color: #ffffd9; border: 0px}')
+        def enableFlowCache():
+            self.prefs['flow_cache'] = not self.prefs.get('flow_cache', False)
+            btn_FlowCache.setStyleSheet(style_on if self.prefs['flow_cache'] else style_off)
+        btn_FlowCache = QtWidgets.QPushButton('Cache flow', window)
+        btn_FlowCache.setToolTip('<b>Cache flow button</b><br>Keep flow of source frame pairs in flow_cache inside the working folder, so rendering the same clip again with new speed or timing skips flow estimation. Uses up to 20 GB of disk.')
+        btn_FlowCache.setFocusPolicy(QtCore.Qt.NoFocus)
+        btn_FlowCache.setMinimumSize(108, 28)
+        btn_FlowCache.setStyleSheet(style_on if self.prefs.get('flow_cache', False) else style_off)
+        btn_FlowCache.pressed.connect(enableFlowCache)
+        return btn_FlowCache
+
+    def quality_button(self, window):
+        # draft / normal / final selector of the quality pref
+        from PySide2 import QtWidgets, QtCore
+
+        btn_Quality = QtWidgets.QPushButton(window)
+        btn_Quality.setText(self.prefs.get('quality', 'final').capitalize())
+        def selectQuality(quality):
+            self.prefs['quality'] = quality
+            btn_Quality.setText(quality.capitalize())
+        btn_Quality.setToolTip('<b>Quality selector</b><br>Draft skips the finest flow block and refinement for fast editorial retimes, Normal stops flow estimation early on small motion, Final runs the full model.')
+        btn_Quality.setFocusPolicy(QtCore.Qt.NoFocus)
+        btn_Quality.setMinimumSize(80, 28)
+        btn_Quality.setStyleSheet('QPushButton {color: #9a9a9a; background-color: #29323d; border-top: 1px inset #555555; border-bottom: 1px inset black}'
+                                    'QPushButton:pressed {font:italic; color: #d9d9d9}'
+                                    'QPushButton::menu-indicator {image: none;}'
+                                    'QToolTip {color: black; background-color: #ffffd9; border: 0px}')
+        btn_Quality_menu = QtWidgets.QMenu(btn_Quality)
+        for quality in ['draft', 'normal', 'final']:
+            action = btn_Quality_menu.addAction(quality.capitalize())
+            action.triggered[()].connect(lambda quality=quality: selectQuality(quality))
+        btn_Quality.setMenu(btn_Quality_menu)
+        return btn_Quality
+
+    def roi_layout(self, window):
+        # region of interest label and x,y,w,h field of a dialog
+        from PySide2 import QtWidgets, QtCore
+
+        hbox_roi = QtWidgets.QHBoxLayout()
+        lbl_Roi = QtWidgets.QLabel('Region x,y,w,h ', window)
+        lbl_Roi.setStyleSheet('QFrame {color: #989898; background-color: #373737}')
+        lbl_Roi.setMinimumHeight(28)
+        lbl_Roi.setAlignment(QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter)
+        hbox_roi.addWidget(lbl_Roi)
+
+        # region is not saved in prefs, it only applies to the clips of this dialog
+        self.roi = ''
+        def txt_Roi_textChanged():
+            self.roi = txt_Roi.text().replace(' ', '')
+            txt_Roi.setStyleSheet(self.roi_style())
+        txt_Roi = QtWidgets.QLineEdit('', window)
+        txt_Roi.setFocusPolicy(QtCore.Qt.ClickFocus)
+        txt_Roi.setMinimumSize(180, 28)
+        txt_Roi.setStyleSheet(self.roi_style())
+        txt_Roi.setToolTip('<b>Region of interest</b><br>Interpolate only x,y,w,h region in pixels from the top left corner, the rest of the frame is blended. Leave empty for the full frame. Applies to the clips of this dialog only.')
+        txt_Roi.textChanged.connect(txt_Roi_textChanged)
+        hbox_roi.addWidget(txt_Roi)
+        return hbox_roi
 
     def build_menu(self):
         def scope_clip(selection):
@@ -867,6 +965,9 @@ class flameTimewrapML(flameMenuApp):
                     cmd += ' --cpu'
                 if self.prefs.get('slowmo_uhd', False):
                     cmd += ' --UHD'
+                cmd += ' --quality ' + self.prefs.get('quality', 'final')
+                cmd += self.roi_arg()
+                cmd += self.flow_cache_arg()
                 cmd += "; "
                 cmd_strings.append(cmd)
                 
@@ -1011,6 +1112,16 @@ class flameTimewrapML(flameMenuApp):
         btn_UHD.pressed.connect(enableUHD)
         new_speed_hbox.addWidget(btn_UHD)
 
+        # Flow cache button
+
+        btn_FlowCache = self.flow_cache_button(window)
+        new_speed_hbox.addWidget(btn_FlowCache)
+
+        # Quality tier selector
+
+        btn_Quality = self.quality_button(window)
+        new_speed_hbox.addWidget(btn_Quality)
+
         # Cpu Proc button
 
         if not sys.platform == 'darwin':            
@@ -1100,6 +1211,12 @@ class flameTimewrapML(flameMenuApp):
 
         vbox.addLayout(hbox_workfolder)
 
+        # Region of interest field
+
+        hbox_roi = self.roi_layout(window)
+
+        vbox.addLayout(hbox_roi)
+
 
         vbox.addWidget(lbl_Spacer)
 
@@ -1257,6 +1374,9 @@ class flameTimewrapML(flameMenuApp):
                     cmd += ' --cpu'
                 if self.prefs.get('dedup_uhd', False):
                     cmd += ' --UHD'
+                cmd += ' --quality ' + self.prefs.get('quality', 'final')
+                cmd += self.roi_arg()
+                cmd += self.flow_cache_arg()
                 cmd += "; "
                 cmd_strings.append(cmd)
                 
@@ -1396,6 +1516,16 @@ class flameTimewrapML(flameMenuApp):
         btn_UHD.pressed.connect(enableUHD)
         dframes_hbox.addWidget(btn_UHD)
 
+        # Flow cache button
+
+        btn_FlowCache = self.flow_cache_button(window)
+        dframes_hbox.addWidget(btn_FlowCache)
+
+        # Quality tier selector
+
+        btn_Quality = self.quality_button(window)
+        dframes_hbox.addWidget(btn_Quality)
+
         # Cpu Proc button
 
         if not sys.platform == 'darwin':            
@@ -1476,6 +1606,12 @@ class flameTimewrapML(flameMenuApp):
 
         vbox.addLayout(hbox_workfolder)
 
+        # Region of interest field
+
+        hbox_roi = self.roi_layout(window)
+
+        vbox.addLayout(hbox_roi)
+
         vbox.addWidget(lbl_Spacer)
 
         # Create and Cancel Buttons
@@ -1587,6 +1723,7 @@ class flameTimewrapML(flameMenuApp):
             cmd += ' --cpu'
         if self.UHD:
             cmd += ' --UHD'
+        cmd += ' --quality ' + self.prefs.get('quality', 'final')
         cmd += "; "
         cmd_strings.append(cmd)
         
@@ -1748,6 +1885,11 @@ class flameTimewrapML(flameMenuApp):
         btn_UHD.pressed.connect(enableUHD)
         dframes_hbox.addWidget(btn_UHD)
 
+        # Quality tier selector
+
+        btn_Quality = self.quality_button(window)
+        dframes_hbox.addWidget(btn_Quality)
+
         # Cpu Proc button
 
         if not sys.platform == 'darwin':            
@@ -2049,6 +2191,11 @@ class flameTimewrapML(flameMenuApp):
                 cmd += ' --cpu'
             if self.prefs.get('slowmo_uhd', False):
                 cmd += ' --UHD'
+            if self.prefs.get('fltw_timestep', False):
+                cmd += ' --timestep'
+            cmd += ' --quality ' + self.prefs.get('quality', 'final')
+            cmd += self.roi_arg()
+            cmd += self.flow_cache_arg()
             cmd += "; "
             cmd_strings.append(cmd)
             
@@ -2165,6 +2312,40 @@ class flameTimewrapML(flameMenuApp):
         btn_UHD.pressed.connect(enableUHD)
         new_speed_hbox.addWidget(btn_UHD)
 
+        # Flow cache button
+
+        btn_FlowCache = self.flow_cache_button(window)
+        new_speed_hbox.addWidget(btn_FlowCache)
+
+        # Single flow timestep button
+
+        def enableTimestep():
+            if self.prefs.get('fltw_timestep', False):
+                btn_Timestep.setStyleSheet('QPushButton {color: #989898; background-color: #373737; border-top: 1px inset #555555; border-bottom: 1px inset black}'
+                                        'QToolTip {color: black; background-color:  #ffffd9; border: 0px}')
+                self.prefs['fltw_timestep'] = False
+            else:
+                btn_Timestep.setStyleSheet('QPushButton {font:italic; background-color: #4f4f4f; color: #d9d9d9; border-top: 1px inset black; border-bottom: 1px inset #555555}'
+                                        'QToolTip {color: black; background-color: #ffffd9; border: 0px}')
+                self.prefs['fltw_timestep'] = True
+        btn_Timestep = QtWidgets.QPushButton('Single flow', window)
+        btn_Timestep.setToolTip('<b>Single flow button</b><br>Synthesize in-between frames directly from one flow estimate per source pair instead of repeated bisection. Several times faster on speed ramps.')
+        btn_Timestep.setFocusPolicy(QtCore.Qt.NoFocus)
+        btn_Timestep.setMinimumSize(108, 28)
+        if self.prefs.get('fltw_timestep', False):
+            btn_Timestep.setStyleSheet('QPushButton {font:italic; background-color: #4f4f4f; color: #d9d9d9; border-top: 1px inset black; border-bottom: 1px inset #555555}'
+                                    'QToolTip {color: black; background-color: #ffffd9; border: 0px}')
+        else:
+            btn_Timestep.setStyleSheet('QPushButton {color: #989898; background-color: #373737; border-top: 1px inset #555555; border-bottom: 1px inset black}'
+                                    'QToolTip {color: black; background-color: #ffffd9; border: 0px}')
+        btn_Timestep.pressed.connect(enableTimestep)
+        new_speed_hbox.addWidget(btn_Timestep)
+
+        # Quality tier selector
+
+        btn_Quality = self.quality_button(window)
+        new_speed_hbox.addWidget(btn_Quality)
+
         # Cpu Proc button
 
         if not sys.platform == 'darwin':            
@@ -2231,6 +2412,12 @@ class flameTimewrapML(flameMenuApp):
 
         vbox.addLayout(hbox_workfolder)
 
+        # Region of interest field
+
+        hbox_roi = self.roi_layout(window)
+
+        vbox.addLayout(hbox_roi)
+
         vbox.addWidget(lbl_Spacer)
         vbox.addWidget(lbl_Spacer)
 